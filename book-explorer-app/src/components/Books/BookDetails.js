@@ -15,17 +15,20 @@ import {
   Rating,
   Snackbar
 } from '@mui/material';
-import { useParams } from 'react-router-dom';
+import { Link, useParams } from 'react-router-dom';
 import { Edit as EditIcon, Delete as DeleteIcon } from '@mui/icons-material';
 import { format } from 'date-fns';
 import { useAuth } from '../../context/AuthContext';
-import { getBookById, getBookNotes, createBookNote, updateBookNote, deleteBookNote, rateBook, addToReadingList } from '../../services/api';
+import { getBookById, getBookNotes, getSimilarBooks, getBookNotesPage, createBookNote, updateBookNote, deleteBookNote, rateBook, addToReadingList } from '../../services/api';
 
 
 const BookDetails = () => {
   const { id } = useParams();
   const [book, setBook] = useState(null);
   const [notes, setNotes] = useState([]);
+  const [similarBooks, setSimilarBooks] = useState([]);
+  const [notesNext, setNotesNext] = useState(null);
+  const [loadingMoreNotes, setLoadingMoreNotes] = useState(false);
   const [newNote, setNewNote] = useState('');
   const [editingNote, setEditingNote] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -50,7 +53,8 @@ const BookDetails = () => {
         getBookNotes(id)
       ]);
       setBook(book);
-      setNotes(notes);
+      setNotes(notes.results);
+      setNotesNext(notes.next);
       setUserRating(book.user_rating || 0);
     } catch (err) {
       setError('Failed to fetch book details');
@@ -59,10 +63,28 @@ const BookDetails = () => {
     }
   };
 
+  const handleLoadMoreNotes = async () => {
+    try {
+      setLoadingMoreNotes(true);
+      const data = await getBookNotesPage(notesNext);
+      setNotes(prev => [...prev, ...data.results]);
+      setNotesNext(data.next);
+    } catch (err) {
+      setError('Failed to fetch book details');
+    } finally {
+      setLoadingMoreNotes(false);
+    }
+  };
+
   useEffect(() => {
     fetchBookAndNotes();
   }, [id]);
 
+  useEffect(() => {
+    // Only a suggestion list, so a failure just leaves it out
+    getSimilarBooks(id).then(setSimilarBooks).catch(() => setSimilarBooks([]));
+  }, [id]);
+
   useEffect(() => {
     if (!user) {
       setUserRating(0);
@@ -230,6 +252,19 @@ const BookDetails = () => {
         </CardContent>
         </Card>
 
+      {similarBooks.length > 0 && (
+        <Box sx={{ mt: 4 }}>
+          <Typography variant="h6" gutterBottom>
+            Readers who liked this also liked
+          </Typography>
+          {similarBooks.slice(0, 5).map((similar) => (
+            <Typography key={similar.id} variant="body2" sx={{ mb: 0.5 }}>
+              <Link to={`/books/${similar.id}`}>{similar.title}</Link> by {similar.author}
+            </Typography>
+          ))}
+        </Box>
+      )}
+
       {/* Notes Section */}
       {notes.length > 0 ?
       <Box sx={{ mt: 4 }}>
@@ -327,6 +362,17 @@ const BookDetails = () => {
             </Paper>
           ))}
         </Box>
+        {notesNext && (
+          <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+            <Button
+              variant="outlined"
+              onClick={handleLoadMoreNotes}
+              disabled={loadingMoreNotes}
+            >
+              {loadingMoreNotes ? 'Loading...' : 'Load More'}
+            </Button>
+          </Box>
+        )}
       </Box>
       : <Typography variant="h6" gutterBottom>
       This book does not have any review.
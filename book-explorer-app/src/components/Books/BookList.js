@@ -17,17 +17,22 @@ import {
   Box,
   Paper,
   Rating,
-  Snackbar
+  Snackbar,
+  Chip
 } from '@mui/material';
 import { Link } from 'react-router-dom';
 import debounce from 'lodash/debounce';
 import { useAuth } from '../../context/AuthContext';
 import ClearIcon from '@mui/icons-material/Clear';
-import { getBooks, addToReadingList } from '../../services/api';
+import { getBooks, getBooksPage, addToReadingList, getReadingListMembership } from '../../services/api';
 
 const BookList = () => {
   const [books, setBooks] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
+  const [genreCounts, setGenreCounts] = useState([]);
+  const [listedIds, setListedIds] = useState(new Set());
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
   const { user } = useAuth();
   const [snackbar, setSnackbar] = useState({
@@ -49,6 +54,19 @@ const BookList = () => {
     setSnackbar({ ...snackbar, open: false });
   };
 
+  // One request per page of books instead of one per book
+  const loadMembership = useCallback(async (pageBooks) => {
+    if (!user || pageBooks.length === 0) {
+      return;
+    }
+    try {
+      const ids = await getReadingListMembership(pageBooks.map(book => book.id));
+      setListedIds(prev => new Set([...prev, ...ids]));
+    } catch (err) {
+      // Membership only decorates the buttons; the list still works without it
+    }
+  }, [user]);
+
   const fetchBooks = useCallback(async (searchParams) => {
     try {
       setLoading(true);
@@ -56,15 +74,33 @@ const BookList = () => {
         ...searchParams,
         sort: sortBy,
         order: sortOrder,
+        facets: 'genre',
       });
-      setBooks(data);
+      setBooks(data.results);
+      setNextPage(data.next);
+      setGenreCounts(data.facets?.genre || []);
       setError(null);
+      loadMembership(data.results);
     } catch (err) {
       setError('Failed to fetch books. Please try again later.');
     } finally {
       setLoading(false);
     }
-  }, [sortBy, sortOrder]);
+  }, [sortBy, sortOrder, loadMembership]);
+
+  const handleLoadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const data = await getBooksPage(nextPage);
+      setBooks(prev => [...prev, ...data.results]);
+      setNextPage(data.next);
+      loadMembership(data.results);
+    } catch (err) {
+      setError('Failed to fetch books. Please try again later.');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const debouncedFetch = useCallback(
     debounce((searchParams) => {
@@ -89,6 +125,7 @@ const BookList = () => {
   const handleAddToReadingList = async (bookId) => {
     try {
       await addToReadingList(bookId);
+      setListedIds(prev => new Set([...prev, bookId]));
       setSnackbar({
         open: true,
         message: "Book successfully added to your reading list!",
@@ -187,6 +224,19 @@ const BookList = () => {
               </Select>
             </FormControl>
           </Grid>
+          {genreCounts.length > 0 && (
+            <Grid item xs={12} sx={{ display: 'flex', flexWrap: 'wrap', gap: 1 }}>
+              {genreCounts.map(({ value, count }) => (
+                <Chip
+                  key={value}
+                  label={`${value} (${count})`}
+                  size="small"
+                  variant={filters.genre === value ? 'filled' : 'outlined'}
+                  onClick={() => setFilters(prev => ({ ...prev, genre: value }))}
+                />
+              ))}
+            </Grid>
+          )}
         </Grid>
       </Paper>
 
@@ -277,8 +327,9 @@ const BookList = () => {
                       size="small"
                       onClick={() => handleAddToReadingList(book.id)}
                       color="primary"
+                      disabled={listedIds.has(book.id)}
                     >
-                      Add to Reading List
+                      {listedIds.has(book.id) ? 'In Reading List' : 'Add to Reading List'}
                     </Button>
                   )}
               </CardActions>
@@ -289,6 +340,17 @@ const BookList = () => {
               No books found matching your criteria.
             </Typography>
           )}
+          {nextPage && (
+            <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2, mb: 4 }}>
+              <Button
+                variant="outlined"
+                onClick={handleLoadMore}
+                disabled={loadingMore}
+              >
+                {loadingMore ? 'Loading...' : 'Load More'}
+              </Button>
+            </Box>
+          )}
         </Box>
       )}
 
@@ -14,10 +14,11 @@ import {
 } from '@mui/material';
 import { Link } from 'react-router-dom';
 import api from '../../services/api';
-import { getReadingList, removeFromReadingList } from '../../services/api';
+import { getReadingList, removeFromReadingList, getRecommendations } from '../../services/api';
 
 const ReadingList = () => {
   const [readingList, setReadingList] = useState([]);
+  const [recommended, setRecommended] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [snackbar, setSnackbar] = useState({
@@ -43,14 +44,25 @@ const ReadingList = () => {
     }
   };
 
+  const fetchRecommendations = async () => {
+    try {
+      setRecommended(await getRecommendations());
+    } catch (err) {
+      // Suggestions are optional; the reading list works without them
+      setRecommended([]);
+    }
+  };
+
   useEffect(() => {
     fetchReadingList();
+    fetchRecommendations();
   }, []);
 
   const handleRemoveFromList = async (bookId) => {
     try {
       await removeFromReadingList(bookId);
       setReadingList(readingList.filter(item => item.book.id !== bookId));
+      fetchRecommendations();
       setSnackbar({
         open: true,
         message: "Book successfully removed from your reading list!",
@@ -172,6 +184,19 @@ const ReadingList = () => {
         </Box>
       )}
 
+      {recommended.length > 0 && (
+        <Box sx={{ mt: 4, mb: 4 }}>
+          <Typography variant="h5" component="h2" gutterBottom>
+            Recommended for you
+          </Typography>
+          {recommended.map((book) => (
+            <Typography key={book.id} variant="body2" sx={{ mb: 0.5 }}>
+              <Link to={`/books/${book.id}`}>{book.title}</Link> by {book.author}
+            </Typography>
+          ))}
+        </Box>
+      )}
+
       <Snackbar
         open={snackbar.open}
         autoHideDuration={4000}
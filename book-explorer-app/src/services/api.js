@@ -44,8 +44,17 @@ export const register = async (userData) => {
   return response.data;
 };
 
+// The fields book cards show; list responses leave out long text unless asked
+const BOOK_CARD_FIELDS = 'id,title,author,genre,average_rating,total_ratings,short_description';
+const BOOK_LINK_FIELDS = 'id,title,author';
+
 export const getBooks = async (params) => {
-  const response = await api.get('/books/', { params });
+  const response = await api.get('/books/', { params: { fields: BOOK_CARD_FIELDS, ...params } });
+  return response.data;
+};
+
+export const getBooksPage = async (url) => {
+  const response = await api.get(url);
   return response.data;
 };
 
@@ -54,11 +63,26 @@ export const getBookById = async (id) => {
   return response.data;
 };
 
+export const getRecommendations = async (limit = 10) => {
+  const response = await api.get('/recommendations/', { params: { limit, fields: BOOK_LINK_FIELDS } });
+  return response.data;
+};
+
+export const getSimilarBooks = async (bookId) => {
+  const response = await api.get(`/books/${bookId}/similar/`, { params: { fields: BOOK_LINK_FIELDS } });
+  return response.data;
+};
+
 export const getBookNotes = async (bookId) => {
   const response = await api.get(`/books/${bookId}/notes/`);
   return response.data;
 };
 
+export const getBookNotesPage = async (url) => {
+  const response = await api.get(url);
+  return response.data;
+};
+
 export const createBookNote = async (bookId, noteData) => {
   const response = await api.post(`/books/${bookId}/notes/create/`, noteData);
   return response.data;
@@ -80,7 +104,7 @@ export const rateBook = async (bookId, rating) => {
 };
 
 export const getReadingList = async () => {
-  const response = await api.get('/reading-list/');
+  const response = await api.get('/reading-list/', { params: { fields: BOOK_CARD_FIELDS } });
   return response.data;
 };
 
@@ -93,4 +117,10 @@ export const removeFromReadingList = async (bookId) => {
   const response = await api.delete(`/reading-list/remove/${bookId}/`);
   return response.data;
 }
+
+// Which of the given books (up to 100) are on the user's reading list
+export const getReadingListMembership = async (bookIds) => {
+  const response = await api.get('/reading-list/contains/', { params: { ids: bookIds.join(',') } });
+  return response.data.book_ids;
+};
 export default api;
\ No newline at end of file
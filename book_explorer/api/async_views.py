@@ -0,0 +1,132 @@
+"""
+ASGI-native versions of the read endpoints.
+
+They share their querysets (api.queries), serializers, response caching and
+conditional GET handling with the views in views.py, but fetch through
+Django's async ORM so a worker running under ASGI is not handing every
+request to the sync thread. Django still runs each query in a thread of
+its own, so what this buys is how many slow connections one worker can
+hold, not faster queries. Routed in place of the sync views when the
+API_ASYNC_READ_VIEWS setting is on. Responses are JSON only.
+"""
+import functools
+
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from django.views.decorators.vary import vary_on_headers
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+
+from base import search
+from base.models import Book
+from . import queries
+from .authentication import AsyncJWTAuthentication, aauthenticate
+from .caching import cache_anonymous_response, books_key, book_key, notes_key
+from .conditional import abook_etag, abook_last_modified, acondition, anotes_etag, anotes_last_modified
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .serializers import BOOK_FIELDS, HEAVY_BOOK_FIELDS, book_rows, BookSerializer, BookNoteSerializer, ReadingListSerializer
+
+CHUNK_SIZE = 2000
+
+
+def render(data, status=status.HTTP_200_OK, headers=None, renderer_class=JSONRenderer):
+    # The same renderer, and so the same bytes, as the sync views' JSON
+    content = renderer_class().render(data)
+    return HttpResponse(content, status=status, content_type='application/json', headers=headers)
+
+
+def _error_response(request, exc):
+    # What DRF's default exception handler would send for the same error
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    headers = None
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        headers = {'WWW-Authenticate': AsyncJWTAuthentication().authenticate_header(request)}
+    return render(data, status=exc.status_code, headers=headers)
+
+
+def async_api_view(login_required=False):
+    """
+    Authenticate the request before an async view runs and turn DRF
+    exceptions, such as an invalid token or cursor, into DRF-style errors.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                user = await aauthenticate(request)
+                if login_required and not user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return _error_response(request, exc)
+        return wrapper
+    return decorator
+
+
+@cache_anonymous_response(books_key)
+@require_GET
+@async_api_view()
+async def getBooks(request):
+    try:
+        books, sort_by, descending = queries.book_list(request.GET, request.user)
+        facet_names = queries.requested_facets(request.GET)
+        fields = queries.selected_fields(request.GET, BOOK_FIELDS, default_exclude=HEAVY_BOOK_FIELDS)
+    except queries.InvalidQuery as e:
+        return render({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = KeysetPagination(sort_by, descending=descending)
+    page = await paginator.apaginate_queryset(book_rows.values(books, sort_by, fields=fields), request)
+
+    snippets = None
+    if queries.wants_snippets(request.GET) and (fields is None or 'snippet' in fields):
+        snippets = await search.asnippets([row.id for row in page], request.GET['q'])
+
+    data = paginator.get_paginated_data(book_rows.encode(page, fields=fields, snippet=snippets))
+    if facet_names:
+        data['facets'] = await queries.abook_facets(request.GET, facet_names)
+    return render(data, renderer_class=FastJSONRenderer)
+
+
+@acondition(etag_func=abook_etag, last_modified_func=abook_last_modified)
+@vary_on_headers('Authorization')
+@cache_anonymous_response(book_key)
+@require_GET
+@async_api_view()
+async def getBookById(request, pk):
+    try:
+        fields = queries.selected_fields(request.GET, BOOK_FIELDS)
+        book = await queries.book_detail(request.user, fields).aget(id=pk)
+    except queries.InvalidQuery as e:
+        return render({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Book.DoesNotExist:
+        return render({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+    serializer = BookSerializer(book, context={'request': request, 'book_fields': fields})
+    return render(serializer.data)
+
+
+@acondition(etag_func=anotes_etag, last_modified_func=anotes_last_modified)
+@vary_on_headers('Authorization')
+@cache_anonymous_response(notes_key)
+@require_GET
+@async_api_view()
+async def get_book_notes(request, book_id):
+    paginator = KeysetPagination('created_at', descending=True)
+    page = await paginator.apaginate_queryset(queries.book_notes(book_id), request)
+    # Any note on the page proves the book exists; only an empty page needs the check
+    if not page and not await Book.objects.filter(id=book_id).aexists():
+        return render({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+    serializer = BookNoteSerializer(page, many=True)
+    return render(paginator.get_paginated_data(serializer.data))
+
+
+@require_GET
+@async_api_view(login_required=True)
+async def get_reading_list(request):
+    try:
+        fields = queries.selected_fields(request.GET, BOOK_FIELDS, default_exclude=HEAVY_BOOK_FIELDS)
+    except queries.InvalidQuery as e:
+        return render({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    items = [item async for item in queries.reading_list(request.user, fields).aiterator(chunk_size=CHUNK_SIZE)]
+    serializer = ReadingListSerializer(items, many=True, context={'request': request, 'book_fields': fields})
+    return render(serializer.data)
@@ -0,0 +1,210 @@
+"""
+JWT authentication classes.
+
+AsyncJWTAuthentication serves the ASGI-native views in async_views.py,
+which run outside DRF's request cycle and so cannot use its lazy
+request.user. CachedJWTAuthentication, used when AUTH_USER_CACHE['ENABLED']
+is set, trusts the signed token for who the caller is and keeps the user
+rows it needs in a small in-process cache, so an authenticated request does
+not start with a query for its own user. Changes to a user's permissions
+or active flag reach other processes only when their cached row expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework.settings import api_settings as drf_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication with an awaitable authenticate(). Parsing and
+    validating the token involve no I/O, so only the user lookup goes
+    through the async ORM; the checks mirror JWTAuthentication.get_user().
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class UserCache:
+    """
+    Least-recently-used user records with a time to live. Saving or deleting
+    a user evicts it in this process; other processes catch up within the
+    TTL, which bounds how long a deactivated user's tokens keep working.
+    """
+
+    def __init__(self, max_entries=10000, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, record = entry
+            if expires <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return record
+
+    def set(self, user_id, record):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.timeout, record)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache_settings = getattr(settings, 'AUTH_USER_CACHE', {})
+user_cache = UserCache(
+    max_entries=_cache_settings.get('MAX_ENTRIES', 10000),
+    timeout=_cache_settings.get('TIMEOUT', 300),
+)
+
+# What request.user needs for permissions and as a foreign key. Never the
+# password: CHECK_REVOKE_TOKEN only needs the digest tokens carry anyway.
+USER_CACHE_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+class CachedJWTAuthentication(AsyncJWTAuthentication):
+    """
+    JWTAuthentication that builds request.user from user_cache instead of
+    reading the user row on every request. The user is a real User instance
+    loaded with USER_CACHE_FIELDS only; anything else is fetched on access.
+    The loaded fields may be up to AUTH_USER_CACHE['TIMEOUT'] seconds old,
+    so call refresh_from_db() on request.user before saving it.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        record = user_cache.get(user_id)
+        if record is None:
+            record = self._record(self._user_row(user_id).first())
+            if record is not None:
+                user_cache.set(user_id, record)
+        return self._check(record, validated_token)
+
+    async def aget_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        record = user_cache.get(user_id)
+        if record is None:
+            record = self._record(await self._user_row(user_id).afirst())
+            if record is not None:
+                user_cache.set(user_id, record)
+        return self._check(record, validated_token)
+
+    def _user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def _fields(self):
+        # from_db() takes values in the model's field order
+        return [f.attname for f in self.user_model._meta.concrete_fields if f.attname in USER_CACHE_FIELDS]
+
+    def _user_row(self, user_id):
+        users = self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+        return users.values_list(*self._fields(), 'password' if api_settings.CHECK_REVOKE_TOKEN else 'pk')
+
+    def _record(self, row):
+        # (USER_CACHE_FIELDS values, the revoke claim the password gives or None)
+        if row is None:
+            return None
+        *values, password = row
+        return tuple(values), get_md5_hash_password(password) if api_settings.CHECK_REVOKE_TOKEN else None
+
+    def _check(self, record, validated_token):
+        if record is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        values, revoke_claim = record
+        user = self.user_model.from_db(self.user_model.objects.db, self._fields(), values)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != revoke_claim:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def _user_changed(sender, instance, **kwargs):
+    # Evict now and again at commit, so a request that cached the old row
+    # while the write was still open does not keep it for the whole TTL
+    user_cache.invalidate(instance.pk)
+    transaction.on_commit(lambda: user_cache.invalidate(instance.pk))
+
+
+def _authenticator():
+    # The configured DRF class when it can authenticate asynchronously
+    for auth_class in drf_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        if hasattr(auth_class, 'aauthenticate'):
+            return auth_class()
+    return AsyncJWTAuthentication()
+
+
+async def aauthenticate(request):
+    """Set request.user from the Authorization header, or to AnonymousUser."""
+    result = await _authenticator().aauthenticate(request)
+    request.user, request.auth = result if result is not None else (AnonymousUser(), None)
+    return request.user
@@ -0,0 +1,183 @@
+import functools
+import hashlib
+import threading
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponse
+
+from base import cache as catalog_cache
+from . import compression
+
+
+class CacheStats:
+    """Per-process hit/miss counters for the anonymous response cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, view_name, hit):
+        with self._lock:
+            self._counts[view_name]['hits' if hit else 'misses'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def snapshot(self):
+        with self._lock:
+            views = {name: dict(counts) for name, counts in self._counts.items()}
+        for counts in views.values():
+            counts['hit_ratio'] = _ratio(counts['hits'], counts['misses'])
+        hits = sum(c['hits'] for c in views.values())
+        misses = sum(c['misses'] for c in views.values())
+        return {'hits': hits, 'misses': misses, 'hit_ratio': _ratio(hits, misses), 'views': views}
+
+
+def _ratio(hits, misses):
+    total = hits + misses
+    return round(hits / total, 4) if total else None
+
+
+stats = CacheStats()
+
+
+def normalized_params(request):
+    """Query parameters as a stable string: sorted, blanks dropped."""
+    items = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        for value in values
+        if value != ''
+    )
+    return '&'.join(f'{key}={value}' for key, value in items)
+
+
+def _digest(*parts):
+    return hashlib.md5('\x1f'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _versioned(prefix, versions, *parts):
+    return ':'.join(str(p) for p in (prefix, *versions, *parts))
+
+
+def books_key(request):
+    return _versioned('books', catalog_cache.catalog_versions(), _digest(normalized_params(request)))
+
+
+def book_key(request, pk):
+    # Parameters too, for fields= and exclude=
+    return _versioned('book', catalog_cache.book_versions(pk), pk, _digest(normalized_params(request)))
+
+
+def notes_key(request, book_id):
+    return _versioned('notes', catalog_cache.notes_versions(book_id), book_id, _digest(normalized_params(request)))
+
+
+def similar_key(request, pk):
+    # build_similarities invalidates everything when it replaces the table
+    return _versioned('similar', catalog_cache.catalog_versions(), pk, _digest(normalized_params(request)))
+
+
+def genres_key(request):
+    # Group statistics move with every book and rating write, as lists do
+    return _versioned('genres', catalog_cache.catalog_versions(), _digest(normalized_params(request)))
+
+
+def authors_key(request):
+    return _versioned('authors', catalog_cache.catalog_versions(), _digest(normalized_params(request)))
+
+
+def _is_anonymous(response):
+    context = getattr(response, 'renderer_context', None) or {}
+    request = context.get('request')
+    return request is not None and not request.user.is_authenticated
+
+
+def _send_encoded(response, encoding, entry):
+    # Left as it is when compression did not make it smaller
+    body = entry['encoded'][encoding]
+    if len(body) < len(entry['content']):
+        compression.use_encoded(response, encoding, body)
+
+
+def cache_anonymous_response(key_func):
+    """
+    Serve successful anonymous GET responses from the catalog cache. Goes
+    outside @api_view so what is stored is the final rendered response; a
+    request carrying credentials always reaches the view, since its body may
+    include per-user fields such as user_rating. Entries keep the content in
+    each coding it has been sent in (see compression.py), so hits are not
+    compressed again.
+    """
+    def decorator(view):
+        # api_view() names its generated class after the function
+        view_name = getattr(view, 'cls', view).__name__
+
+        def lookup(request, *args, **kwargs):
+            if request.method != 'GET' or 'HTTP_AUTHORIZATION' in request.META:
+                return None, None
+            key = f"{key_func(request, *args, **kwargs)}:{_digest(request.META.get('HTTP_ACCEPT', ''))}"
+            entry = catalog_cache.get_cache().get(key)
+            stats.record(view_name, hit=entry is not None)
+            if entry is None:
+                return key, None
+            response = HttpResponse(entry['content'], status=entry['status'])
+            for header, value in entry['headers']:
+                response[header] = value
+            encoding = compression.encoding_for(request, response)
+            if encoding is not None:
+                if encoding in entry.setdefault('encoded', {}):
+                    compression.stats.record_reuse(encoding)
+                else:
+                    # Compressed for the first request that accepts this
+                    # coding, and kept for every later one
+                    entry['encoded'][encoding] = compression.compress(entry['content'], encoding, request)
+                    catalog_cache.get_cache().set(key, entry)
+                _send_encoded(response, encoding, entry)
+            return key, response
+
+        def store(request, key, response, anonymous):
+            if key is not None and response.status_code == 200 and anonymous:
+                # DRF responses are rendered lazily; plain HttpResponses already are
+                if not getattr(response, 'is_rendered', True):
+                    response.render()
+                entry = {
+                    'status': response.status_code,
+                    'content': response.content,
+                    'headers': list(response.items()),
+                    # Content-Encoding -> the content in that coding
+                    'encoded': {},
+                }
+                encoding = compression.encoding_for(request, response)
+                if encoding is not None:
+                    entry['encoded'][encoding] = compression.compress(entry['content'], encoding, request)
+                catalog_cache.get_cache().set(key, entry)
+                if encoding is not None:
+                    _send_encoded(response, encoding, entry)
+            return response
+
+        if iscoroutinefunction(view):
+            # The catalog cache is in-process, so its sync calls do not block
+            # the event loop. Async views authenticate only from the
+            # Authorization header, so every request that gets this far is
+            # anonymous.
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                key, cached = lookup(request, *args, **kwargs)
+                if cached is not None:
+                    return cached
+                response = await view(request, *args, **kwargs)
+                return store(request, key, response, anonymous=True)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key, cached = lookup(request, *args, **kwargs)
+            if cached is not None:
+                return cached
+            response = view(request, *args, **kwargs)
+            return store(request, key, response, anonymous=_is_anonymous(response))
+        return wrapper
+    return decorator
@@ -0,0 +1,237 @@
+"""
+Negotiated response compression.
+
+CompressionMiddleware compresses JSON, NDJSON and CSV responses of at least
+COMPRESSION['MIN_SIZE'] bytes with the coding the client weights highest,
+ties going to the first in ENCODINGS: zstd and brotli when their packages
+(zstandard, brotli) are installed, then gzip. HTML is left alone, since the
+browsable API and admin pages carry CSRF tokens that compression next to
+reflected input would leak (BREACH).
+
+Cached anonymous responses (see caching.py) keep the bytes of each coding
+they have been sent in next to the raw body, so a hot response is compressed
+once per coding rather than once per request.
+
+Compression time is measured as thread CPU time, counted per coding in
+`stats` (shown by the cache stats endpoint) and added up per request in
+request.compression_seconds.
+"""
+import functools
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_settings = getattr(settings, 'COMPRESSION', {})
+MIN_SIZE = _settings.get('MIN_SIZE', 1024)
+LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6, **_settings.get('LEVELS', {})}
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/csv')
+
+
+class _BrotliCompressor:
+    # brotli's incremental API, under the names zlib and zstandard use
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def _gzip_compressor():
+    # A gzip wrapper with no timestamp, so equal bodies compress to equal bytes
+    return zlib.compressobj(LEVELS['gzip'], zlib.DEFLATED, 31)
+
+
+# Content-Encoding -> new incremental compressor, in order of preference
+ENCODINGS = {}
+if zstandard is not None:
+    ENCODINGS['zstd'] = lambda: zstandard.ZstdCompressor(level=LEVELS['zstd']).compressobj()
+if brotli is not None:
+    ENCODINGS['br'] = lambda: _BrotliCompressor(LEVELS['br'])
+ENCODINGS['gzip'] = _gzip_compressor
+
+
+class CompressionStats:
+    """
+    Per-process totals per coding: responses compressed, bytes before and
+    after, CPU time, and `reused`, responses sent from stored bytes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'responses': 0, 'reused': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_ms': 0.0})
+
+    def record(self, encoding, bytes_in, bytes_out, seconds):
+        with self._lock:
+            counts = self._counts[encoding]
+            counts['responses'] += 1
+            counts['bytes_in'] += bytes_in
+            counts['bytes_out'] += bytes_out
+            counts['cpu_ms'] += seconds * 1000
+
+    def record_reuse(self, encoding):
+        with self._lock:
+            self._counts[encoding]['reused'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def snapshot(self):
+        with self._lock:
+            encodings = {name: dict(counts) for name, counts in self._counts.items()}
+        for counts in encodings.values():
+            counts['cpu_ms'] = round(counts['cpu_ms'], 3)
+            counts['ratio'] = round(counts['bytes_in'] / counts['bytes_out'], 2) if counts['bytes_out'] else None
+        return encodings
+
+
+stats = CompressionStats()
+
+
+@functools.lru_cache(maxsize=256)
+def negotiate(accept_encoding):
+    """The coding to use for an Accept-Encoding header, or None for none."""
+    weights = {}
+    for item in accept_encoding.lower().split(','):
+        name, *params = (part.strip() for part in item.split(';'))
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    ranked = [
+        (weights.get(name, weights.get('*', 0.0)), -position, name)
+        for position, name in enumerate(ENCODINGS)
+    ]
+    weight, _, name = max(ranked)
+    return name if weight > 0 else None
+
+
+def _worth_compressing(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    if content_type not in COMPRESSIBLE_TYPES or response.has_header('Content-Encoding'):
+        return False
+    return response.streaming or len(response.content) >= MIN_SIZE
+
+
+def encoding_for(request, response):
+    """The coding `response` should be sent in, or None to send it as it is."""
+    if not _worth_compressing(response):
+        return None
+    return negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+
+def _account(request, encoding, bytes_in, bytes_out, seconds):
+    stats.record(encoding, bytes_in, bytes_out, seconds)
+    if request is not None:
+        request.compression_seconds = getattr(request, 'compression_seconds', 0.0) + seconds
+
+
+def compress(content, encoding, request=None):
+    started = time.thread_time()
+    compressor = ENCODINGS[encoding]()
+    body = compressor.compress(content) + compressor.flush()
+    _account(request, encoding, len(content), len(body), time.thread_time() - started)
+    return body
+
+
+def _compress_stream(chunks, encoding, request):
+    compressor = ENCODINGS[encoding]()
+    seconds, bytes_in, bytes_out = 0.0, 0, 0
+    for chunk in chunks:
+        started = time.thread_time()
+        data = compressor.compress(chunk)
+        seconds += time.thread_time() - started
+        bytes_in, bytes_out = bytes_in + len(chunk), bytes_out + len(data)
+        if data:
+            yield data
+    started = time.thread_time()
+    data = compressor.flush()
+    _account(request, encoding, bytes_in, bytes_out + len(data), seconds + time.thread_time() - started)
+    yield data
+
+
+async def _acompress_stream(chunks, encoding, request):
+    compressor = ENCODINGS[encoding]()
+    seconds, bytes_in, bytes_out = 0.0, 0, 0
+    async for chunk in chunks:
+        started = time.thread_time()
+        data = compressor.compress(chunk)
+        seconds += time.thread_time() - started
+        bytes_in, bytes_out = bytes_in + len(chunk), bytes_out + len(data)
+        if data:
+            yield data
+    started = time.thread_time()
+    data = compressor.flush()
+    _account(request, encoding, bytes_in, bytes_out + len(data), seconds + time.thread_time() - started)
+    yield data
+
+
+def use_encoded(response, encoding, body):
+    """Send `response` as `body`, its content in `encoding`."""
+    response.content = body
+    response.headers['Content-Length'] = str(len(body))
+    response.headers['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response.compressed = True
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if getattr(response, 'compressed', False):
+            # Sent from the response cache's stored bytes; an ETag added
+            # around the cache still has to be weakened
+            self._weaken_etag(response)
+            return response
+        if not _worth_compressing(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _acompress_stream(response.streaming_content, encoding, request)
+            else:
+                response.streaming_content = _compress_stream(response.streaming_content, encoding, request)
+            # The compressed length is only known once the stream ends
+            del response.headers['Content-Length']
+            response.headers['Content-Encoding'] = encoding
+        else:
+            body = compress(response.content, encoding, request)
+            if len(body) >= len(response.content):
+                return response
+            use_encoded(response, encoding, body)
+        self._weaken_etag(response)
+        return response
+
+    def _weaken_etag(self, response):
+        # One representation per coding, so a strong validator would be
+        # wrong (RFC 9110 8.8.1); If-None-Match compares weakly anyway
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
@@ -0,0 +1,48 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from base.models import Book
+
+EXPORT_FIELDS = (
+    'id', 'title', 'author', 'publication_date', 'isbn', 'genre', 'short_description',
+    'page_count', 'average_rating', 'total_ratings', 'about', 'updated_at',
+)
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() hands the line straight back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(since=None):
+    books = Book.objects.order_by('id')
+    if since is not None:
+        # Oldest change first, so book_updated_idx serves the range and the order
+        books = books.filter(updated_at__gte=since).order_by('updated_at', 'id')
+    # values_list() rows instead of model instances; the server-side cursor
+    # is read in chunks so memory stays flat however large the catalog is.
+    return books.values_list(*EXPORT_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+
+
+def stream_ndjson(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'books.ndjson', stream_ndjson),
+    'csv': ('text/csv', 'books.csv', stream_csv),
+}
@@ -0,0 +1,361 @@
+"""
+Per-request instrumentation.
+
+InstrumentationMiddleware records every request under the name of the URL
+pattern it matched (get-books, get-book-by-id, ...):
+
+- wall time, from the outermost middleware to the last byte of the body;
+- database time and query count;
+- duplicate queries: statements whose SQL, placeholders and all, already
+  ran earlier in the same request, so a loop fetching one row per object
+  (the N+1 pattern) shows up however its parameters differ;
+- serializer time, spent in the .data of serializers from serializers.py
+  and in RowEncoder;
+- compression CPU time (see compression.py);
+- response size, in bytes as sent.
+
+Each goes into a per-route Histogram, kept in-process and per worker.
+`registry` renders them for Prometheus at /metrics and, when
+METRICS['LOG_FILE'] is set, appends a JSON snapshot to that file at most
+every METRICS['LOG_INTERVAL'] seconds.
+
+Queries are timed by a database execute wrapper installed on every
+connection, which reads the request being recorded from a context
+variable; that variable follows the request into sync_to_async threads and
+through a streamed body, and outside a request the wrapper only passes the
+call on.
+"""
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.crypto import constant_time_compare
+from rest_framework.permissions import BasePermission
+
+_settings = getattr(settings, 'METRICS', {})
+TOKEN = _settings.get('TOKEN')
+LOG_FILE = _settings.get('LOG_FILE')
+LOG_INTERVAL = _settings.get('LOG_INTERVAL', 60)
+QUANTILES = (0.5, 0.9, 0.99)
+PREFIX = 'bookexplorer_'
+
+# name -> (help text, recorded units per reported unit)
+SERIES = {
+    'request_duration_seconds': ('Wall time to the last byte of the response', 1_000_000),
+    'db_duration_seconds': ('Time spent executing SQL', 1_000_000),
+    'db_queries': ('SQL statements executed', 1),
+    'db_duplicate_queries': ('SQL statements already executed earlier in the same request', 1),
+    'serializer_duration_seconds': ('Time spent serializing response data', 1_000_000),
+    'compression_duration_seconds': ('CPU time spent compressing the response', 1_000_000),
+    'response_size_bytes': ('Response body size as sent', 1),
+}
+
+
+class Histogram:
+    """
+    A log-linear histogram in the manner of HdrHistogram: integer values
+    below 2**SUB_BITS have a bucket each, and every power of two above that
+    is split into 2**SUB_BITS equal buckets, so quantiles are read back
+    within 1/2**SUB_BITS (about 3%) of the recorded value at any magnitude,
+    from a few dozen counters.
+
+    `scale` is how many recorded units make one reported unit: values are
+    recorded in microseconds for a histogram reported in seconds.
+    """
+    SUB_BITS = 5
+
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value):
+        shift = value.bit_length() - cls.SUB_BITS - 1
+        if shift < 0:
+            return value
+        return ((shift + 1) << cls.SUB_BITS) + (value >> shift) - (1 << cls.SUB_BITS)
+
+    @classmethod
+    def _highest(cls, index):
+        # The largest value that falls in bucket `index`
+        shift = (index >> cls.SUB_BITS) - 1
+        if shift < 0:
+            return index
+        return (((index & ((1 << cls.SUB_BITS) - 1)) + (1 << cls.SUB_BITS) + 1) << shift) - 1
+
+    def record(self, value):
+        # Never negative, so this rounds to the nearest unit
+        value = int(value * self.scale + 0.5)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """The smallest bucket bound at or above a fraction `q` of the values, in reported units."""
+        if not self.count:
+            return 0.0
+        rank = max(q * self.count, 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._highest(index), self.max) / self.scale
+        return self.max / self.scale
+
+    def sum(self):
+        return self.total / self.scale
+
+    def snapshot(self):
+        summary = {'count': self.count, 'sum': self.sum(), 'max': self.max / self.scale}
+        summary.update((f'p{round(q * 100)}', self.quantile(q)) for q in QUANTILES)
+        return summary
+
+
+class MetricsRegistry:
+    """The per-route histograms and response counts of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._responses = {}
+        self._next_dump = 0.0
+
+    def record(self, route, status, values):
+        with self._lock:
+            histograms = self._routes.get(route)
+            if histograms is None:
+                histograms = self._routes[route] = {name: Histogram(scale) for name, (_, scale) in SERIES.items()}
+            for name, value in values.items():
+                histograms[name].record(value)
+            self._responses[route, status] = self._responses.get((route, status), 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._responses.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                route: {name: histogram.snapshot() for name, histogram in histograms.items()}
+                for route, histograms in self._routes.items()
+            }
+
+    def prometheus(self):
+        """Everything recorded so far in the Prometheus text exposition format."""
+        lines = [
+            f'# HELP {PREFIX}requests_total Responses sent',
+            f'# TYPE {PREFIX}requests_total counter',
+        ]
+        with self._lock:
+            for (route, status), count in sorted(self._responses.items()):
+                lines.append(f'{PREFIX}requests_total{{route="{_label(route)}",status="{status}"}} {count}')
+            for name, (help_text, _) in SERIES.items():
+                lines.append(f'# HELP {PREFIX}{name} {help_text}')
+                lines.append(f'# TYPE {PREFIX}{name} summary')
+                for route, histograms in sorted(self._routes.items()):
+                    histogram, label = histograms[name], f'route="{_label(route)}"'
+                    for q in QUANTILES:
+                        lines.append(f'{PREFIX}{name}{{{label},quantile="{q}"}} {histogram.quantile(q)}')
+                    lines.append(f'{PREFIX}{name}_sum{{{label}}} {histogram.sum()}')
+                    lines.append(f'{PREFIX}{name}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def dump_if_due(self):
+        """Append a snapshot to METRICS['LOG_FILE'] if LOG_INTERVAL has passed since the last."""
+        now = time.monotonic()
+        if LOG_FILE is None or now < self._next_dump:
+            return
+        with self._lock:
+            # Another thread may have just written it
+            if now < self._next_dump:
+                return
+            self._next_dump = now + LOG_INTERVAL
+        line = json.dumps({
+            'time': datetime.now(timezone.utc).isoformat(),
+            'pid': os.getpid(),
+            'routes': self.snapshot(),
+        })
+        with open(LOG_FILE, 'a') as log:
+            log.write(line + '\n')
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """What one request has spent so far."""
+    __slots__ = ('started', 'db_seconds', 'queries', 'duplicates', 'statements', 'serializer_seconds')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.duplicates = 0
+        self.statements = set()
+        self.serializer_seconds = 0.0
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class recording:
+    """Attribute queries and serializer time in the block to a new RequestMetrics."""
+    __slots__ = ('metrics', 'token')
+
+    def __enter__(self):
+        self.metrics = RequestMetrics()
+        self.token = _current.set(self.metrics)
+        return self.metrics
+
+    def __exit__(self, *exc_info):
+        _current.reset(self.token)
+
+
+class serializing:
+    """Count the block as serializer time of the request being recorded, if any."""
+    __slots__ = ('metrics', 'started')
+
+    def __enter__(self):
+        self.metrics = _current.get()
+        if self.metrics is not None:
+            self.started = perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.metrics is not None:
+            self.metrics.serializer_seconds += perf_counter() - self.started
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_seconds += perf_counter() - started
+        metrics.queries += 1
+        if sql in metrics.statements:
+            metrics.duplicates += 1
+        else:
+            metrics.statements.add(sql)
+
+
+def _install(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+# Connections are per thread; this covers each one opened from now on
+connection_created.connect(_install)
+
+
+class MetricsScraper(BasePermission):
+    """Staff users, or a scraper sending `Authorization: Token <METRICS['TOKEN']>`."""
+
+    def has_permission(self, request, view):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if TOKEN and constant_time_compare(header, f'Token {TOKEN}'):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections this thread opened before the middleware was loaded
+        for alias in connections:
+            _install(None, connections[alias])
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with recording() as metrics:
+            response = self.get_response(request)
+        return self._finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        with recording() as metrics:
+            response = await self.get_response(request)
+        return self._finish(request, response, metrics)
+
+    def _finish(self, request, response, metrics):
+        if not response.streaming:
+            self._record(request, response, metrics, len(response.content))
+            return response
+        # Recorded once the body has been sent, with the queries made while
+        # producing it
+        if response.is_async:
+            response.streaming_content = self._astream(response.streaming_content, request, response, metrics)
+        else:
+            response.streaming_content = self._stream(response.streaming_content, request, response, metrics)
+        return response
+
+    def _stream(self, chunks, request, response, metrics):
+        chunks, size = iter(chunks), 0
+        try:
+            while True:
+                token = _current.set(metrics)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(request, response, metrics, size)
+
+    async def _astream(self, chunks, request, response, metrics):
+        chunks, size = aiter(chunks), 0
+        try:
+            while True:
+                token = _current.set(metrics)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(request, response, metrics, size)
+
+    def _record(self, request, response, metrics, size):
+        match = request.resolver_match
+        registry.record(match.view_name if match else 'unmatched', response.status_code, {
+            'request_duration_seconds': perf_counter() - metrics.started,
+            'db_duration_seconds': metrics.db_seconds,
+            'db_queries': metrics.queries,
+            'db_duplicate_queries': metrics.duplicates,
+            'serializer_duration_seconds': metrics.serializer_seconds,
+            'compression_duration_seconds': getattr(request, 'compression_seconds', 0.0),
+            'response_size_bytes': size,
+        })
+        registry.dump_if_due()
@@ -0,0 +1,155 @@
+import base64
+import datetime
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds, which would skip
+    # rows whose sort key differs from the cursor only below that
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+Cursor = namedtuple('Cursor', ['value', 'pk', 'reverse'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a single sort field with the primary key as the
+    tie-breaker. Each page is fetched with a `WHERE (field, id) > (v, pk)`
+    condition instead of an OFFSET, so deep pages cost the same as the first.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, field, descending=False):
+        self.field = field
+        self.descending = descending
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._set_page(list(self._page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset() for async views, fetching through the async ORM."""
+        return self._set_page([obj async for obj in self._page_queryset(queryset, request)])
+
+    def _page_queryset(self, queryset, request):
+        # Plain Django requests are accepted too: only request.GET is read
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request, self.get_field(queryset))
+        self.reverse = self.cursor is not None and self.cursor.reverse
+        descending = self.descending != self.reverse
+
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_position_filter(self.cursor, descending))
+        queryset = queryset.order_by(*self.get_ordering(descending))
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def get_field(self, queryset):
+        annotation = queryset.query.annotations.get(self.field)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(self.field)
+
+    def get_ordering(self, descending):
+        prefix = '-' if descending else ''
+        return (f'{prefix}{self.field}', f'{prefix}id')
+
+    def get_position_filter(self, cursor, descending):
+        # Written as `field >= v AND (field > v OR id > pk)` rather than the
+        # plain OR: the leading range is what lets the database seek into the
+        # (field, id) index instead of scanning it from the start.
+        lookup = 'lt' if descending else 'gt'
+        return Q(**{f'{self.field}__{lookup}e': cursor.value}) & (
+            Q(**{f'{self.field}__{lookup}': cursor.value}) | Q(**{f'id__{lookup}': cursor.pk})
+        )
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Stepped past the end: the cursor row itself anchors the way back.
+            cursor = Cursor(self.cursor.value, self.cursor.pk, reverse=True)
+            return self._build_link(cursor)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        # `id` rather than `pk`, so named values_list() rows page too
+        return self._build_link(Cursor(getattr(obj, self.field), obj.id, reverse))
+
+    def _build_link(self, cursor):
+        payload = json.dumps(
+            {'v': cursor.value, 'id': cursor.pk, 'r': int(cursor.reverse)},
+            cls=CursorEncoder,
+        )
+        encoded = base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, field):
+        encoded = request.GET.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            value = field.to_python(payload['v'])
+            pk, reverse = payload['id'], payload['r']
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        # Well-formed JSON can still hold values no link of ours carries;
+        # sort columns are never null and a null filter value is an error
+        if value is None or type(pk) is not int or reverse not in (0, 1):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(value, pk, bool(reverse))
@@ -0,0 +1,177 @@
+"""
+Opt-in sampling profiler for slow requests.
+
+With PROFILING['ENABLED'], ProfilingMiddleware has a background thread look
+at the stack of every thread serving a request each INTERVAL seconds, and
+count how often each stack comes up. When the request ends, its samples are
+kept if it took SLOW_REQUEST_SECONDS or longer, or if it carried an
+X-Profile header signed with SECRET_KEY (`manage.py profile_token` makes
+one); otherwise they are dropped. Stacks are counted whether the thread
+is running or waiting on the database, so the profile accounts for wall
+time, as a slow request's latency does.
+
+Kept profiles are written as collapsed stacks, one `caller;callee count`
+line per stack from the middleware down, which flamegraph.pl and
+speedscope read directly, to files under DIRECTORY named by time, route
+and duration. Only the newest MAX_FILES are kept.
+
+Only requests served by sync middleware (WSGI) are sampled; under ASGI
+the middleware lets requests through untouched, since an event loop thread
+runs many requests at once.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+_settings = getattr(settings, 'PROFILING', {})
+ENABLED = _settings.get('ENABLED', False)
+SLOW_REQUEST_SECONDS = _settings.get('SLOW_REQUEST_SECONDS', 1.0)
+INTERVAL = _settings.get('INTERVAL', 0.005)
+MAX_FILES = _settings.get('MAX_FILES', 200)
+TOKEN_MAX_AGE = _settings.get('TOKEN_MAX_AGE', 3600)
+
+HEADER = 'X-Profile'
+_SALT = 'api.profiling'
+
+
+def directory():
+    return Path(_settings.get('DIRECTORY', settings.BASE_DIR / 'var' / 'profiles'))
+
+
+def debug_token():
+    """An X-Profile header value that has requests profiled for TOKEN_MAX_AGE seconds."""
+    return signing.TimestampSigner(salt=_SALT).sign('profile')
+
+
+def _signed(request):
+    token = request.headers.get(HEADER)
+    if not token:
+        return False
+    try:
+        return signing.TimestampSigner(salt=_SALT).unsign(token, max_age=TOKEN_MAX_AGE) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+class Sampler:
+    """Counts the stacks of the threads between start() and stop(), every `interval` seconds."""
+
+    def __init__(self, interval, root):
+        self.interval = interval
+        # Stacks are cut at this code object, the frame that called start()
+        self.root = root
+        self._lock = threading.Lock()
+        self._active = {}
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        samples = Counter()
+        with self._lock:
+            self._active[threading.get_ident()] = samples
+            self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+                self._thread.start()
+        return samples
+
+    def stop(self):
+        with self._lock:
+            return self._active.pop(threading.get_ident(), Counter())
+
+    def _run(self):
+        while True:
+            # Sleeps until a request starts when none is in flight
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[self._stack(frame)] += 1
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}")
+            if code is self.root:
+                break
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+def _filename(route, seconds):
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    route = re.sub(r'[^\w-]', '_', route)
+    return f'{stamp}-{os.getpid()}-{route}-{round(seconds * 1000)}ms.collapsed'
+
+
+def write_profile(samples, route, seconds):
+    """Save `samples` as a collapsed-stack file, prune the oldest beyond MAX_FILES, and return its path."""
+    root = directory()
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / _filename(route, seconds)
+    staging = root / f'.{path.name}'
+    staging.write_text(''.join(f'{stack} {count}\n' for stack, count in samples.most_common()))
+    os.replace(staging, path)
+    # Names start with the time, so they sort oldest first
+    profiles = sorted(p for p in os.listdir(root) if p.endswith('.collapsed') and not p.startswith('.'))
+    for old in profiles[:-MAX_FILES]:
+        try:
+            os.unlink(root / old)
+        except FileNotFoundError:
+            # Another worker pruned it first
+            pass
+    return path
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.sampler = Sampler(INTERVAL, root=type(self).__call__.__code__)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        signed = _signed(request)
+        if SLOW_REQUEST_SECONDS is None and not signed:
+            return self.get_response(request)
+
+        started = perf_counter()
+        self.sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            samples = self.sampler.stop()
+        seconds = perf_counter() - started
+
+        if signed or seconds >= SLOW_REQUEST_SECONDS:
+            match = request.resolver_match
+            path = write_profile(samples, match.view_name if match else 'unmatched', seconds)
+            if signed:
+                response[f'{HEADER}-File'] = path.name
+        return response
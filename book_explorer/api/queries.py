@@ -0,0 +1,181 @@
+"""
+Querysets behind the read endpoints, shared by the sync views in views.py
+and the ASGI-native ones in async_views.py so both stacks return the same
+rows in the same order.
+"""
+from django.db.models import F, Prefetch, Q
+from django.db.models.functions import Lower
+
+from base import facets, ratings, search
+from base.models import Book, BookNote, ReadingList
+
+BOOK_SORT_FIELDS = ('title', 'author', 'publication_date', 'average_rating')
+# Text sorts ignore case and are served by the Lower() indexes on Book
+CASE_INSENSITIVE_SORTS = ('title', 'author')
+# The parameters that narrow the list, and so the only ones facet counts depend on
+FILTER_PARAMS = ('q', 'title', 'author', 'genre')
+GROUP_SORT_FIELDS = ('name', 'book_count', 'average_rating')
+# Everything BookNoteSerializer reads, including its nested user
+NOTE_COLUMNS = (
+    'id', 'book_id', 'content', 'created_at', 'updated_at',
+    'user__id', 'user__username', 'user__email', 'user__first_name', 'user__last_name',
+)
+
+
+# Columns an output field of the same name is read from; see only_columns()
+BOOK_COLUMNS = frozenset(field.name for field in Book._meta.concrete_fields)
+
+
+class InvalidQuery(ValueError):
+    """A query parameter the catalog cannot serve; the message is user-facing."""
+
+
+def _names(params, name):
+    return [value for value in params.get(name, '').split(',') if value]
+
+
+def filtered_books(params):
+    """Books matching the q/title/author/genre filters, unannotated and unordered."""
+    books = Book.objects.all()
+    search_query = params.get('q', None)
+    title_query = params.get('title', None)
+    author_query = params.get('author', None)
+    genre_query = params.get('genre', None)
+
+    if search.is_available():
+        books = search.filter_books(
+            books, search_query, title=title_query, author=author_query, genre=genre_query
+        )
+    else:
+        if search_query:
+            books = books.filter(
+                Q(title__icontains=search_query)
+                | Q(author__icontains=search_query)
+                | Q(genre__icontains=search_query)
+                | Q(about__icontains=search_query)
+            )
+        if title_query:
+            books = books.filter(title__icontains=title_query)
+        if author_query:
+            books = books.filter(author__icontains=author_query)
+        if genre_query:
+            books = books.filter(genre__icontains=genre_query)
+    return books
+
+
+def book_list(params, user):
+    """
+    Return (books, sort_field, descending) for the catalog list parameters:
+    q/title/author/genre filters and sort/order.
+    """
+    books = ratings.annotate_user_rating(filtered_books(params), user)
+    search_query = params.get('q', None)
+
+    # Sorting (search results default to relevance)
+    ranked = bool(search_query) and search.is_available()
+    sort_by = params.get('sort') or ('rank' if ranked else 'title')
+    sort_order = params.get('order', 'asc')
+
+    if sort_by == 'rank' and ranked:
+        books = search.rank_books(books)
+        sort_order = 'asc'
+    elif sort_by not in BOOK_SORT_FIELDS:
+        raise InvalidQuery(f"Sort must be one of: {', '.join(BOOK_SORT_FIELDS)}")
+    elif sort_by in CASE_INSENSITIVE_SORTS:
+        books = books.annotate(**{f'{sort_by}_ci': Lower(sort_by)})
+        sort_by = f'{sort_by}_ci'
+
+    return books, sort_by, sort_order == 'desc'
+
+
+def requested_facets(params):
+    """The facet names in the comma-separated `facets` parameter."""
+    names = _names(params, 'facets')
+    unknown = [name for name in names if name not in facets.FACETS]
+    if unknown:
+        raise InvalidQuery(f"Facets must be among: {', '.join(facets.FACETS)}")
+    return names
+
+
+def selected_fields(params, available, default_exclude=()):
+    """
+    The output fields left by the comma-separated `fields` and `exclude`
+    parameters, in `available` order, or None for all of them. Unless
+    `fields` names them, `default_exclude` are left out too.
+    """
+    requested = _names(params, 'fields')
+    excluded = _names(params, 'exclude')
+    if any(name not in available for name in requested + excluded):
+        raise InvalidQuery(f"Fields must be among: {', '.join(available)}")
+    if not requested:
+        requested = available
+        excluded += default_exclude
+    selected = tuple(name for name in available if name in requested and name not in excluded)
+    return None if selected == tuple(available) else selected
+
+
+def only_columns(books, fields):
+    """Load just the Book columns behind the given output fields, and id; all of them for None."""
+    if fields is None:
+        return books
+    return books.only('id', *(name for name in fields if name in BOOK_COLUMNS))
+
+
+def _filters(params):
+    return {name: params[name] for name in FILTER_PARAMS if params.get(name)}
+
+
+def book_facets(params, names):
+    return facets.count(filtered_books(params), names, _filters(params))
+
+
+async def abook_facets(params, names):
+    return await facets.acount(filtered_books(params), names, _filters(params))
+
+
+def similar_books(book_id, user, fields=None):
+    """The stored neighbours of a book, best first, from the (book, rank) index."""
+    books = Book.objects.filter(neighbor_of__book_id=book_id).annotate(
+        similarity=F('neighbor_of__score'),
+    ).order_by('neighbor_of__rank')
+    return ratings.annotate_user_rating(only_columns(books, fields), user)
+
+
+def books_by_id(book_ids, user, fields=None):
+    """{id: book} for the given ids, with the user's ratings annotated."""
+    return ratings.annotate_user_rating(only_columns(Book.objects.all(), fields), user).in_bulk(book_ids)
+
+
+def wants_snippets(params):
+    return bool(params.get('q') and params.get('highlight') and search.is_available())
+
+
+def book_detail(user, fields=None):
+    return ratings.annotate_user_rating(only_columns(Book.objects.all(), fields), user)
+
+
+def book_notes(book_id):
+    return BookNote.objects.filter(book_id=book_id).select_related('user').only(*NOTE_COLUMNS)
+
+
+def reading_list(user, fields=None):
+    books = ratings.annotate_user_rating(only_columns(Book.objects.all(), fields), user)
+    return ReadingList.objects.filter(user=user).order_by('added_at').prefetch_related(
+        Prefetch('book', queryset=books)
+    )
+
+
+def group_list(model, params):
+    """
+    Return (groups, sort_field, descending) for a Genre or Author list:
+    a name filter and sort/order over the precomputed statistics.
+    """
+    groups = model.objects.all()
+    name_query = params.get('name', None)
+    if name_query:
+        groups = groups.filter(name__icontains=name_query)
+
+    sort_by = params.get('sort') or 'name'
+    if sort_by not in GROUP_SORT_FIELDS:
+        raise InvalidQuery(f"Sort must be one of: {', '.join(GROUP_SORT_FIELDS)}")
+    return groups, sort_by, params.get('order', 'asc') == 'desc'
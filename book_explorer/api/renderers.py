@@ -0,0 +1,54 @@
+"""
+Response renderers.
+
+FastJSONRenderer is JSONRenderer with orjson doing the encoding when it is
+installed. orjson writes the same bytes as DRF's compact, non-ASCII-escaping JSON for
+strings, integers, booleans, None, lists and dicts, several times faster;
+everything else (dates, decimals, lazy strings) is handed back to DRF's
+encoder, and anything orjson refuses (integers past 64 bits, lone
+surrogates) is rendered by JSONRenderer itself. Floats are the exception:
+orjson writes 1e16 where Python writes 1e+16, and null for NaN, so this is
+only for views whose responses hold no floats.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson is not None else 0
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these two, which are newlines to JavaScript.
+        # Both start with 0xE2, and a one-byte search skips the replace()
+        # passes, each slower than the encoding, for mostly-ASCII bodies
+        if b'\xe2' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Text that is already in the Prometheus exposition format."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # An error raised before the view, such as a failed permission check
+            data = f"{data.get('detail', data)}\n"
+        return data.encode(self.charset)
@@ -1,15 +1,54 @@
 from rest_framework import serializers
-from base.models import Book, BookNote, BookRating, ReadingList
+from base.models import Author, Book, BookNote, BookRating, Genre, ReadingList
 from django.contrib.auth.models import User
+from .instrumentation import serializing
+from .rows import RowEncoder
 
-class BookSerializer(serializers.ModelSerializer):
-    user_rating = serializers.SerializerMethodField()
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with serializing():
+            return super().data
+
+
+class ModelSerializer(serializers.ModelSerializer):
+    """
+    Counts the time spent building .data as the request's serializer time
+    (see instrumentation.py); Meta classes extend ModelSerializer.Meta so
+    that many=True gets the same through TimedListSerializer.
+    """
 
     class Meta:
+        list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with serializing():
+            return super().data
+
+
+class BookSerializer(ModelSerializer):
+    user_rating = serializers.SerializerMethodField()
+    # Only present on search results requested with highlight=1
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta(ModelSerializer.Meta):
         model = Book
-        fields = '__all__'
+        exclude = ['rating_sum', 'updated_at', 'genre_ref', 'author_ref']
+
+    def get_fields(self):
+        # Sparse fieldsets: views put the fields= / exclude= choice in the context
+        fields = super().get_fields()
+        chosen = self.context.get('book_fields')
+        if chosen is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in chosen}
 
     def get_user_rating(self, obj):
+        # List views annotate this via base.ratings.annotate_user_rating
+        if hasattr(obj, 'current_user_rating'):
+            return obj.current_user_rating
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             try:
@@ -20,39 +59,60 @@ class BookSerializer(serializers.ModelSerializer):
         return None
 
 
-class UserSerializer(serializers.ModelSerializer):
-    class Meta:
+# BookSerializer's output from values_list() rows, for the list endpoint
+book_rows = RowEncoder(BookSerializer, sources={'user_rating': 'current_user_rating'}, optional=('snippet',))
+
+
+class SimilarBookSerializer(BookSerializer):
+    similarity = serializers.FloatField(read_only=True)
+
+
+class RecommendedBookSerializer(BookSerializer):
+    # None when no model has been trained yet and books are ranked by rating
+    score = serializers.FloatField(read_only=True, allow_null=True)
+
+
+# What fields= and exclude= may name on each kind of book response
+BOOK_FIELDS = tuple(book_rows.fields)
+SIMILAR_BOOK_FIELDS = tuple(SimilarBookSerializer().fields)
+RECOMMENDED_BOOK_FIELDS = tuple(RecommendedBookSerializer().fields)
+# Long prose that list responses leave out unless fields= asks for it
+HEAVY_BOOK_FIELDS = ('short_description', 'about')
+
+
+class UserSerializer(ModelSerializer):
+    class Meta(ModelSerializer.Meta):
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name')
 
-class BookNoteSerializer(serializers.ModelSerializer):
+class BookNoteSerializer(ModelSerializer):
     user = UserSerializer(read_only=True)
     username = serializers.CharField(source='user.username', read_only=True)
     
-    class Meta:
+    class Meta(ModelSerializer.Meta):
         model = BookNote
         fields = ['id', 'book', 'content', 'created_at', 'updated_at', 'user', 'username']
         read_only_fields = ['created_at', 'updated_at', 'user', 'username']
 
-class BookRatingSerializer(serializers.ModelSerializer):
+class BookRatingSerializer(ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     
-    class Meta:
+    class Meta(ModelSerializer.Meta):
         model = BookRating
         fields = ['id', 'rating', 'created_at', 'username']
         read_only_fields = ['created_at', 'username']
 
-class ReadingListSerializer(serializers.ModelSerializer):
+class ReadingListSerializer(ModelSerializer):
     book = BookSerializer(read_only=True)
     
-    class Meta:
+    class Meta(ModelSerializer.Meta):
         model = ReadingList
         fields = ['id', 'book', 'added_at']
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class UserRegistrationSerializer(ModelSerializer):
     password2 = serializers.CharField(style={'input_type': 'password'}, write_only=True)
 
-    class Meta:
+    class Meta(ModelSerializer.Meta):
         model = User
         fields = ['username', 'email', 'password', 'password2', 'first_name', 'last_name']
         extra_kwargs = {
@@ -67,4 +127,16 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data.pop('password2')
         user = User.objects.create_user(**validated_data)
-        return user
\ No newline at end of file
+        return user
+
+GROUP_FIELDS = ['id', 'name', 'book_count', 'total_ratings', 'average_rating', 'top_book_ids']
+
+class GenreSerializer(ModelSerializer):
+    class Meta(ModelSerializer.Meta):
+        model = Genre
+        fields = GROUP_FIELDS
+
+class AuthorSerializer(ModelSerializer):
+    class Meta(ModelSerializer.Meta):
+        model = Author
+        fields = GROUP_FIELDS
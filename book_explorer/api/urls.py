@@ -1,22 +1,38 @@
+from django.conf import settings
 from django.urls import path
-from .import views
+from .import async_views, views
 from rest_framework_simplejwt.views import TokenRefreshView
 
+read_views = async_views if settings.API_ASYNC_READ_VIEWS else views
+
 urlpatterns = [
-    path('books/', views.getBooks, name='get-books'),
-    path('books/<int:pk>/', views.getBookById, name='get-book-by-id'),
+    path('books/', read_views.getBooks, name='get-books'),
+    path('books/<int:pk>/', read_views.getBookById, name='get-book-by-id'),
+    path('books/<int:pk>/similar/', views.get_similar_books, name='get-similar-books'),
+    path('books/export/', views.export_books, name='export-books'),
+
+    path('genres/', views.get_genres, name='get-genres'),
+    path('authors/', views.get_authors, name='get-authors'),
 
-    path('books/<int:book_id>/notes/', views.get_book_notes, name='get-book-notes'),
+    path('books/<int:book_id>/notes/', read_views.get_book_notes, name='get-book-notes'),
     path('books/<int:book_id>/notes/create/', views.create_book_note, name='create-book-note'),
     path('notes/<int:note_id>/update/', views.update_note, name='update-note'),
     path('notes/<int:note_id>/delete/', views.delete_note, name='delete-note'),
 
     path('books/<int:book_id>/rate/', views.rate_book, name='rate-book'),
+    path('ratings/batch/', views.rate_books_batch, name='rate-books-batch'),
 
-    path('reading-list/', views.get_reading_list, name='get-reading-list'),
+    path('recommendations/', views.get_recommendations, name='get-recommendations'),
+
+    path('reading-list/', read_views.get_reading_list, name='get-reading-list'),
     path('reading-list/add/<int:book_id>/', views.add_to_reading_list, name='add-to-reading-list'),
     path('reading-list/remove/<int:book_id>/', views.remove_from_reading_list, name='remove-from-reading-list'),
+    path('reading-list/bulk-add/', views.bulk_add_to_reading_list, name='bulk-add-to-reading-list'),
+    path('reading-list/bulk-remove/', views.bulk_remove_from_reading_list, name='bulk-remove-from-reading-list'),
+    path('reading-list/contains/', views.reading_list_membership, name='reading-list-membership'),
 
     path('auth/register/', views.register_user, name='register'),
     path('auth/login/', views.login_user, name='login'),
+
+    path('cache/stats/', views.get_cache_stats, name='cache-stats'),
 ]
\ No newline at end of file
@@ -1,60 +1,163 @@
+from datetime import datetime, time
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
-from base.models import Book, BookNote, BookRating, ReadingList
-from .serializers import BookSerializer, BookNoteSerializer, UserSerializer, UserRegistrationSerializer, BookRatingSerializer, ReadingListSerializer
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+from base import cache as catalog_cache
+from base import group_stats, ratings, recommendations, search
+from base.hashers import HashingBusy
+from base.models import Author, Book, BookNote, BookRating, Genre, ReadingList
+from .serializers import BOOK_FIELDS, HEAVY_BOOK_FIELDS, RECOMMENDED_BOOK_FIELDS, SIMILAR_BOOK_FIELDS, book_rows, AuthorSerializer, BookSerializer, BookNoteSerializer, GenreSerializer, RecommendedBookSerializer, SimilarBookSerializer, UserSerializer, UserRegistrationSerializer, BookRatingSerializer, ReadingListSerializer
+from . import compression, instrumentation, queries
+from .instrumentation import MetricsScraper
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer, PrometheusRenderer
+from .caching import cache_anonymous_response, authors_key, books_key, book_key, genres_key, notes_key, similar_key, stats as cache_stats
+from .export import EXPORT_FORMATS, export_rows
+from .conditional import book_etag, book_last_modified, notes_etag, notes_last_modified
 
+RATING_BATCH_LIMIT = 1000
+RECOMMENDATION_LIMIT = 20
+READING_LIST_BATCH_LIMIT = 500
+READING_LIST_MEMBERSHIP_LIMIT = 100
+
+@cache_anonymous_response(books_key)
 @api_view(['GET'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
 @permission_classes([AllowAny])
 def getBooks(request):
-    books = Book.objects.all()
-    
-    # Filtering
-    title_query = request.query_params.get('title', None)
-    author_query = request.query_params.get('author', None)
-    genre_query = request.query_params.get('genre', None)
-    
-    if title_query:
-        books = books.filter(title__icontains=title_query)
-    if author_query:
-        books = books.filter(author__icontains=author_query)
-    if genre_query:
-        books = books.filter(genre__icontains=genre_query)
-    
-    # Sorting
-    sort_by = request.query_params.get('sort', 'title')
-    sort_order = request.query_params.get('order', 'asc')
-    
-    if sort_order == 'desc':
-        sort_by = f'-{sort_by}'
-    
-    books = books.order_by(sort_by)
-    
-    serializer = BookSerializer(books, many=True)
-    return Response(serializer.data)
+    try:
+        books, sort_by, descending = queries.book_list(request.query_params, request.user)
+        facet_names = queries.requested_facets(request.query_params)
+        fields = queries.selected_fields(request.query_params, BOOK_FIELDS, default_exclude=HEAVY_BOOK_FIELDS)
+    except queries.InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Pagination (keyset on the sort field, id as tie-breaker) over plain
+    # rows of just the chosen fields, which book_rows turns into
+    # BookSerializer's output
+    paginator = KeysetPagination(sort_by, descending=descending)
+    page = paginator.paginate_queryset(book_rows.values(books, sort_by, fields=fields), request)
+
+    snippets = None
+    if queries.wants_snippets(request.query_params) and (fields is None or 'snippet' in fields):
+        snippets = search.snippets([row.id for row in page], request.query_params['q'])
+
+    data = paginator.get_paginated_data(book_rows.encode(page, fields=fields, snippet=snippets))
+    if facet_names:
+        data['facets'] = queries.book_facets(request.query_params, facet_names)
+    return Response(data)
+
+def _group_list(request, model, serializer_class):
+    try:
+        groups, sort_by, descending = queries.group_list(model, request.query_params)
+    except queries.InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = KeysetPagination(sort_by, descending=descending)
+    page = paginator.paginate_queryset(groups, request)
+    serializer = serializer_class(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+@cache_anonymous_response(genres_key)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_genres(request):
+    return _group_list(request, Genre, GenreSerializer)
+
+@cache_anonymous_response(authors_key)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_authors(request):
+    return _group_list(request, Author, AuthorSerializer)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def export_books(request):
+    export_type = request.query_params.get('type', 'ndjson')
+    if export_type not in EXPORT_FORMATS:
+        return Response(
+            {"error": f"Type must be one of: {', '.join(EXPORT_FORMATS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    since = request.query_params.get('since')
+    if since:
+        try:
+            parsed = parse_datetime(since)
+            if parsed is None and parse_date(since) is not None:
+                parsed = datetime.combine(parse_date(since), time.min)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            return Response(
+                {"error": "Since must be an ISO 8601 date or datetime"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        since = parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+    content_type, filename, stream = EXPORT_FORMATS[export_type]
+    response = StreamingHttpResponse(stream(export_rows(since)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
+@condition(etag_func=book_etag, last_modified_func=book_last_modified)
+@vary_on_headers('Authorization')
+@cache_anonymous_response(book_key)
 @api_view(['GET'])
 def getBookById(request, pk):
     try:
-        book = Book.objects.get(id=pk)
-        serializer = BookSerializer(book, context={'request': request})
+        fields = queries.selected_fields(request.query_params, BOOK_FIELDS)
+        book = queries.book_detail(request.user, fields).get(id=pk)
+        serializer = BookSerializer(book, context={'request': request, 'book_fields': fields})
         return Response(serializer.data)
+    except queries.InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Book.DoesNotExist:
         return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
 
+@vary_on_headers('Authorization')
+@cache_anonymous_response(similar_key)
 @api_view(['GET'])
 @permission_classes([AllowAny])
-def get_book_notes(request, book_id):
+def get_similar_books(request, pk):
     try:
-        book = Book.objects.get(id=book_id)
-        notes = BookNote.objects.filter(book=book)
-        serializer = BookNoteSerializer(notes, many=True)
-        return Response(serializer.data)
-    except Book.DoesNotExist:
+        fields = queries.selected_fields(
+            request.query_params, SIMILAR_BOOK_FIELDS, default_exclude=HEAVY_BOOK_FIELDS
+        )
+    except queries.InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    books = list(queries.similar_books(pk, request.user, fields))
+    # Neighbours prove the book exists; only an empty answer needs the check
+    if not books and not Book.objects.filter(id=pk).exists():
         return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+    serializer = SimilarBookSerializer(books, many=True, context={'request': request, 'book_fields': fields})
+    return Response(serializer.data)
+
+@condition(etag_func=notes_etag, last_modified_func=notes_last_modified)
+@vary_on_headers('Authorization')
+@cache_anonymous_response(notes_key)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_book_notes(request, book_id):
+    notes = queries.book_notes(book_id)
+    paginator = KeysetPagination('created_at', descending=True)
+    page = paginator.paginate_queryset(notes, request)
+    # Any note on the page proves the book exists; only an empty page needs the check
+    if not page and not Book.objects.filter(id=book_id).exists():
+        return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+    serializer = BookNoteSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -107,55 +210,157 @@ def delete_note(request, note_id):
 @permission_classes([IsAuthenticated])
 def rate_book(request, book_id):
     try:
-        book = Book.objects.get(id=book_id)
         rating = int(request.data.get('rating'))
-        
-        if not 1 <= rating <= 10:
-            return Response(
-                {"error": "Rating must be between 1 and 10"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+    except (TypeError, ValueError):
+        rating = None
+
+    if rating is None or not 1 <= rating <= 10:
+        return Response(
+            {"error": "Rating must be between 1 and 10"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    groups = Book.objects.filter(id=book_id).values_list('genre_ref_id', 'author_ref_id').first()
+    if groups is None:
+        return Response(
+            {"error": "Book not found"}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # The aggregates are shifted with F() expressions, never read-modify-written,
+    # so concurrent raters cannot lose each other's updates. The book's genre
+    # and author are only marked; refresh_group_stats catches them up.
+    with transaction.atomic():
+        existing_rating = BookRating.objects.select_for_update().filter(
+            book_id=book_id, user=request.user
+        ).first()
 
-        existing_rating = BookRating.objects.filter(book=book, user=request.user).first()
-        
         if existing_rating:
-            old_rating = existing_rating.rating
+            delta = rating - existing_rating.rating
             existing_rating.rating = rating
-            existing_rating.save()
-            
-            total_rating = book.average_rating * book.total_ratings
-            new_total = total_rating - old_rating + rating
-            book.average_rating = new_total / book.total_ratings
-            book.save()
-            
+            existing_rating.save(update_fields=['rating'])
+            Book.objects.filter(id=book_id).update(**ratings.aggregate_delta(delta, 0))
+            group_stats.mark_stale(*groups)
+
             serializer = BookRatingSerializer(existing_rating)
             return Response(serializer.data)
-        
+
         new_rating = BookRating.objects.create(
-            book=book,
+            book_id=book_id,
             user=request.user,
             rating=rating
         )
-        
-        total_rating = book.average_rating * book.total_ratings
-        book.total_ratings += 1
-        book.average_rating = (total_rating + rating) / book.total_ratings
-        book.save()
-        
-        serializer = BookRatingSerializer(new_rating)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-        
-    except Book.DoesNotExist:
+        Book.objects.filter(id=book_id).update(**ratings.aggregate_delta(rating, 1))
+        group_stats.mark_stale(*groups)
+
+    serializer = BookRatingSerializer(new_rating)
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def rate_books_batch(request):
+    items = request.data
+    if not isinstance(items, list) or not items:
         return Response(
-            {"error": "Book not found"}, 
-            status=status.HTTP_404_NOT_FOUND
+            {"error": "Expected a non-empty list of {book_id, rating} objects"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > RATING_BATCH_LIMIT:
+        return Response(
+            {"error": f"At most {RATING_BATCH_LIMIT} ratings per batch"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Validate the shape of every item first, then check all books in one query
+    errors = []
+    valid = {}
+    for index, item in enumerate(items):
+        try:
+            book_id = int(item['book_id'])
+            rating = int(item['rating'])
+        except (TypeError, ValueError, KeyError):
+            errors.append({"index": index, "error": "Each item needs an integer book_id and rating"})
+            continue
+        if not 1 <= rating <= 10:
+            errors.append({"index": index, "error": "Rating must be between 1 and 10"})
+            continue
+        # A book rated twice in one batch keeps its last rating
+        valid[book_id] = (index, rating)
+
+    # The groups come along so their statistics can be refreshed without another read
+    found = {
+        book_id: refs
+        for book_id, *refs in Book.objects.filter(id__in=valid).values_list('id', 'genre_ref_id', 'author_ref_id')
+    }
+    errors.extend(
+        {"index": index, "error": "Book not found"}
+        for book_id, (index, _) in valid.items() if book_id not in found
+    )
+    if errors:
+        return Response({"errors": sorted(errors, key=lambda e: e["index"])}, status=status.HTTP_400_BAD_REQUEST)
+
+    book_ids = list(valid)
+    with transaction.atomic():
+        already_rated = set(
+            BookRating.objects.filter(user=request.user, book_id__in=book_ids).values_list('book_id', flat=True)
+        )
+        BookRating.objects.bulk_create(
+            [BookRating(book_id=book_id, user=request.user, rating=rating) for book_id, (_, rating) in valid.items()],
+            update_conflicts=True,
+            unique_fields=['book', 'user'],
+            update_fields=['rating'],
+        )
+        ratings.rebuild_aggregates(Book, BookRating, book_ids=book_ids)
+        group_stats.refresh(group_stats.groups_of(found.values()))
+    # bulk_create() sends no signals
+    catalog_cache.invalidate_books(book_ids)
+    catalog_cache.invalidate_recommendations(request.user.id)
+
+    return Response({
+        "created": len(book_ids) - len(already_rated),
+        "updated": len(already_rated),
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_recommendations(request):
+    try:
+        limit = int(request.query_params.get('limit', RECOMMENDATION_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= recommendations.MAX_RESULTS:
+        return Response(
+            {"error": f"Limit must be between 1 and {recommendations.MAX_RESULTS}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        fields = queries.selected_fields(
+            request.query_params, RECOMMENDED_BOOK_FIELDS, default_exclude=HEAVY_BOOK_FIELDS
         )
+    except queries.InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    ranked = recommendations.recommend(request.user)[:limit]
+    books = queries.books_by_id([book_id for book_id, _ in ranked], request.user, fields)
+    # A book deleted since the ranking was cached is skipped
+    results = []
+    for book_id, score in ranked:
+        if book_id in books:
+            books[book_id].score = score
+            results.append(books[book_id])
+    serializer = RecommendedBookSerializer(results, many=True, context={'request': request, 'book_fields': fields})
+    return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_reading_list(request):
-    reading_list = ReadingList.objects.filter(user=request.user)
-    serializer = ReadingListSerializer(reading_list, many=True)
+    try:
+        fields = queries.selected_fields(request.query_params, BOOK_FIELDS, default_exclude=HEAVY_BOOK_FIELDS)
+    except queries.InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = ReadingListSerializer(
+        queries.reading_list(request.user, fields), many=True, context={'request': request, 'book_fields': fields}
+    )
     return Response(serializer.data)
 
 @api_view(['POST'])
@@ -168,6 +373,7 @@ def add_to_reading_list(request, book_id):
             book=book
         )
         if created:
+            catalog_cache.invalidate_recommendations(request.user.id)
             return Response({"message": "Book added to reading list"}, status=status.HTTP_201_CREATED)
         return Response({"message": "Book already in reading list"}, status=status.HTTP_200_OK)
     except Book.DoesNotExist:
@@ -182,10 +388,76 @@ def remove_from_reading_list(request, book_id):
             book_id=book_id
         )
         reading_list_item.delete()
+        catalog_cache.invalidate_recommendations(request.user.id)
         return Response({"message": "Book removed from reading list"}, status=status.HTTP_204_NO_CONTENT)
     except ReadingList.DoesNotExist:
         return Response({"error": "Book not found in reading list"}, status=status.HTTP_404_NOT_FOUND)
 
+def _book_id_list(values, limit):
+    """Parse a list of book ids; returns (ids, error message)."""
+    if not isinstance(values, list) or not values:
+        return None, "Expected a non-empty list of book ids"
+    if len(values) > limit:
+        return None, f"At most {limit} book ids per request"
+    try:
+        return list(dict.fromkeys(int(value) for value in values)), None
+    except (TypeError, ValueError):
+        return None, "Book ids must be integers"
+
+def _body_book_ids(request):
+    """The book_ids list of a {"book_ids": [...]} body; returns (ids, error message)."""
+    if not isinstance(request.data, dict):
+        return None, "Expected an object with a book_ids list"
+    return _book_id_list(request.data.get('book_ids'), READING_LIST_BATCH_LIMIT)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_add_to_reading_list(request):
+    book_ids, error = _body_book_ids(request)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+    missing = set(book_ids) - set(Book.objects.filter(id__in=book_ids).values_list('id', flat=True))
+    if missing:
+        return Response(
+            {"error": "Books not found", "book_ids": sorted(missing)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    listed = set(
+        ReadingList.objects.filter(user=request.user, book_id__in=book_ids).values_list('book_id', flat=True)
+    )
+    new_items = [ReadingList(user=request.user, book_id=book_id) for book_id in book_ids if book_id not in listed]
+    # ignore_conflicts covers a concurrent request adding the same books
+    ReadingList.objects.bulk_create(new_items, ignore_conflicts=True)
+    # Saved books drop out of recommendations; ReadingList has no signals to do this
+    catalog_cache.invalidate_recommendations(request.user.id)
+    return Response({"added": len(new_items)}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_remove_from_reading_list(request):
+    book_ids, error = _body_book_ids(request)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+    # No signals or cascades hang off ReadingList, so this is one DELETE ... IN
+    removed, _ = ReadingList.objects.filter(user=request.user, book_id__in=book_ids).delete()
+    catalog_cache.invalidate_recommendations(request.user.id)
+    return Response({"removed": removed}, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reading_list_membership(request):
+    ids = [value for value in request.query_params.get('ids', '').split(',') if value]
+    book_ids, error = _book_id_list(ids, READING_LIST_MEMBERSHIP_LIMIT)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Answered from the unique (user, book) index
+    listed = ReadingList.objects.filter(user=request.user, book_id__in=book_ids).values_list('book_id', flat=True)
+    return Response({"book_ids": sorted(listed)})
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register_user(request):
@@ -212,7 +484,14 @@ def login_user(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    user = authenticate(username=username, password=password)
+    try:
+        user = authenticate(username=username, password=password)
+    except HashingBusy:
+        return Response(
+            {'error': 'Too many logins in progress, please retry shortly'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': '1'},
+        )
 
     if user:
         refresh = RefreshToken.for_user(user)
@@ -231,4 +510,15 @@ def login_user(request):
         return Response(
             {'error': 'Invalid credentials'},
             status=status.HTTP_401_UNAUTHORIZED
-        )
\ No newline at end of file
+        )
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_cache_stats(request):
+    return Response({**cache_stats.snapshot(), 'compression': compression.stats.snapshot()})
+
+@api_view(['GET'])
+@renderer_classes([PrometheusRenderer])
+@permission_classes([MetricsScraper])
+def get_metrics(request):
+    return Response(instrumentation.registry.prometheus())
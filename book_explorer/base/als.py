@@ -0,0 +1,94 @@
+"""
+Training the recommendation model.
+
+train() factorises the explicit rating matrix with alternating least
+squares. Ratings are first reduced to residuals against the global mean
+and a damped per-book bias, and ALS then fits `factors`-dimensional user
+and book vectors whose dot products predict those residuals; each half
+step solves one small regularised least-squares problem per user (or
+book) over just the entries it rated.
+
+Only the book side is saved (see recommendations.py): a user's vector is
+re-solved from their current ratings at request time, which also covers
+people who rated their first books after the model was trained.
+
+Needs NumPy and SciPy; only the train_recommendations command imports
+this module.
+"""
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import sparse
+
+from .models import BookRating
+from .recommendations import solve_user, write_model
+
+
+@dataclass
+class TrainReport:
+    ratings: int = 0
+    users: int = 0
+    books: int = 0
+    rmse: float = 0.0
+    version: str = ''
+    seconds: float = 0.0
+
+
+def _load_ratings(batch_size):
+    rows = BookRating.objects.order_by().values_list('user_id', 'book_id', 'rating').iterator(chunk_size=batch_size)
+    table = np.fromiter(rows, dtype=[('user', np.int64), ('book', np.int64), ('rating', np.float32)])
+    return table['user'], table['book'], table['rating']
+
+
+def _half_step(matrix, fixed, regularization):
+    """Solve every row of `matrix` (CSR) against the factors of its columns."""
+    solved = np.zeros((matrix.shape[0], fixed.shape[1]), dtype=np.float32)
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+        solved[row] = solve_user(fixed[matrix.indices[start:end]], matrix.data[start:end], regularization)
+    return solved
+
+
+def train(factors=32, iterations=10, regularization=0.1, bias_damping=5.0, batch_size=5000, seed=42, keep=3):
+    # Without it a user or book with fewer ratings than `factors` has a
+    # singular system, which float32 solves into garbage rather than failing
+    if regularization <= 0:
+        raise ValueError(f'regularization must be positive, not {regularization}')
+    started = time.perf_counter()
+    report = TrainReport()
+    user_ids, book_ids, values = _load_ratings(batch_size)
+    report.ratings = len(values)
+
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    books, book_index = np.unique(book_ids, return_inverse=True)
+    del user_ids, book_ids
+    report.users, report.books = len(users), len(books)
+
+    mean = float(values.mean()) if len(values) else 0.0
+    # Damped towards zero, so a book with one 10 is not taken for a classic
+    bias = (
+        np.bincount(book_index, weights=values - mean, minlength=len(books))
+        / (np.bincount(book_index, minlength=len(books)) + bias_damping)
+    ).astype(np.float32)
+    residuals = values - mean - bias[book_index]
+
+    by_user = sparse.csr_matrix((residuals, (user_index, book_index)), shape=(len(users), len(books)), dtype=np.float32)
+    by_book = by_user.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    book_factors = (rng.standard_normal((len(books), factors)) * 0.01).astype(np.float32)
+    user_factors = np.zeros((len(users), factors), dtype=np.float32)
+    for _ in range(iterations):
+        user_factors = _half_step(by_user, book_factors, regularization)
+        book_factors = _half_step(by_book, user_factors, regularization)
+
+    if len(values):
+        predicted = np.einsum('ij,ij->i', user_factors[user_index], book_factors[book_index])
+        report.rmse = float(np.sqrt(np.mean((residuals - predicted) ** 2)))
+
+    report.version = write_model(books, bias, book_factors, mean, regularization, keep=keep)
+    report.seconds = time.perf_counter() - started
+    return report
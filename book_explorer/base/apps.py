@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_triggers(sender, using, **kwargs):
+    from .search import ensure_triggers
+    ensure_triggers(connections[using])
 
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        from . import cache, signals  # noqa: F401 -- connects the receivers
+        post_migrate.connect(ensure_search_triggers, sender=self)
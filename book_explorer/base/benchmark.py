@@ -0,0 +1,596 @@
+"""
+Synthetic-catalog benchmark for the API.
+
+seed() fills the current database with bulk inserts; run() then replays every
+route in api/urls.py through the test client and records latency
+percentiles, SQL query counts and peak Python memory per route.
+run_concurrency() loads the read routes with many requests in flight at
+once and compares their sync and async views, run_auth_cache() times the
+authenticated routes with and without the JWT user cache, run_login() measures
+login throughput per core for each password hasher, and run_serialization()
+compares the book list's two serialization paths. The benchmark_api management
+command wraps all of these around a throwaway database.
+"""
+import asyncio
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers, make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, Value
+from django.db.models.functions import Now
+from django.db.models.utils import create_namedtuple_class
+from django.test import AsyncRequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import group_stats, similarity
+from .models import Book, BookNote, BookRating, ReadingList
+from .cache import invalidate_all
+from .ratings import rebuild_aggregates
+
+SCALES = {
+    'tiny': {'books': 200, 'users': 50, 'ratings': 2_000, 'notes': 500},
+    'small': {'books': 10_000, 'users': 1_000, 'ratings': 100_000, 'notes': 20_000},
+    'medium': {'books': 100_000, 'users': 10_000, 'ratings': 1_000_000, 'notes': 200_000},
+    'large': {'books': 1_000_000, 'users': 100_000, 'ratings': 10_000_000, 'notes': 2_000_000},
+}
+
+BENCH_PASSWORD = 'bench-password-123'
+GENRES = ('Fiction', 'Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography', 'Poetry')
+WORDS = (
+    'river', 'shadow', 'garden', 'empire', 'silent', 'winter', 'machine', 'stone', 'ocean', 'crown',
+    'forest', 'letter', 'house', 'storm', 'glass', 'fire', 'night', 'island', 'mirror', 'journey',
+)
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(books, users, ratings, notes, batch_size=5000, rng_seed=42, log=None):
+    """Bulk-insert a synthetic catalog. Rating pairs are unique per (book, user)."""
+    rng = random.Random(rng_seed)
+    log = log or (lambda message: None)
+    password = make_password(BENCH_PASSWORD)
+
+    def book_rows():
+        for i in range(books):
+            title = ' '.join(rng.choice(WORDS) for _ in range(3)).title()
+            yield Book(
+                title=f'{title} {i}',
+                author=f'{rng.choice(WORDS).title()} Author{i % max(books // 20, 1)}',
+                publication_date=date(1900, 1, 1) + timedelta(days=rng.randrange(45_000)),
+                isbn=f'{i:013d}',
+                genre=rng.choice(GENRES),
+                short_description=' '.join(rng.choice(WORDS) for _ in range(30)),
+                page_count=rng.randrange(50, 1500),
+                about=' '.join(rng.choice(WORDS) for _ in range(150)),
+            )
+
+    def user_rows():
+        for i in range(users):
+            yield User(username=f'bench{i}', email=f'bench{i}@example.com', password=password)
+
+    with transaction.atomic():
+        for batch in _batches(book_rows(), batch_size):
+            Book.objects.bulk_create(batch)
+        log(f'seeded {books} books')
+        for batch in _batches(user_rows(), batch_size):
+            User.objects.bulk_create(batch)
+        log(f'seeded {users} users')
+
+        book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+        # Migrations seed a few users with ratings of their own; leave them out
+        user_ids = list(
+            User.objects.filter(username__startswith='bench').order_by('id').values_list('id', flat=True)
+        )
+        per_user = min(max(ratings // max(users, 1), 1), len(book_ids))
+
+        def rating_rows():
+            created = 0
+            for user_id in user_ids:
+                for index in rng.sample(range(len(book_ids)), per_user):
+                    if created >= ratings:
+                        return
+                    created += 1
+                    yield BookRating(book_id=book_ids[index], user_id=user_id, rating=rng.randint(1, 10))
+
+        for batch in _batches(rating_rows(), batch_size):
+            BookRating.objects.bulk_create(batch)
+        rebuild_aggregates(Book, BookRating)
+        group_stats.rebuild()
+        similarity.build(k=10)
+        log(f'seeded {BookRating.objects.count()} ratings')
+
+        def note_rows():
+            for _ in range(notes):
+                yield BookNote(
+                    book_id=rng.choice(book_ids),
+                    user_id=rng.choice(user_ids),
+                    content=' '.join(rng.choice(WORDS) for _ in range(20)),
+                )
+
+        for batch in _batches(note_rows(), batch_size):
+            BookNote.objects.bulk_create(batch)
+        # bulk_create() skips the signals that keep these current
+        Book.objects.update(notes_version=F('notes_version') + 1, notes_updated_at=Now())
+        log(f'seeded {notes} notes')
+    invalidate_all()
+
+
+@dataclass
+class Scenario:
+    method: str
+    kwargs: callable = lambda ctx: {}
+    data: callable = lambda ctx: None
+    params: callable = lambda ctx: None
+    auth: bool = False
+    # Runs before each timed call, e.g. to create the note a delete removes
+    setup: callable = None
+
+
+@dataclass
+class Context:
+    user: User
+    book_id: int
+    popular_book_id: int
+    counter: int = 0
+    state: dict = field(default_factory=dict)
+
+
+def _new_note(ctx):
+    ctx.state['note_id'] = BookNote.objects.create(user=ctx.user, book_id=ctx.book_id, content='bench').id
+
+
+def _ensure_listed(ctx):
+    ReadingList.objects.get_or_create(user=ctx.user, book_id=ctx.book_id)
+
+
+def _batch_books(ctx):
+    if 'batch_ids' not in ctx.state:
+        ctx.state['batch_ids'] = list(Book.objects.order_by('id').values_list('id', flat=True)[:200])
+
+
+def _clear_batch_listing(ctx):
+    _batch_books(ctx)
+    ReadingList.objects.filter(user=ctx.user, book_id__in=ctx.state['batch_ids']).delete()
+
+
+def _list_batch(ctx):
+    _batch_books(ctx)
+    ReadingList.objects.bulk_create(
+        [ReadingList(user=ctx.user, book_id=book_id) for book_id in ctx.state['batch_ids'][:100]],
+        ignore_conflicts=True,
+    )
+
+
+def _next_username(ctx):
+    ctx.counter += 1
+    return {
+        'username': f'bench-new-{ctx.counter}',
+        'email': f'bench-new-{ctx.counter}@example.com',
+        'password': BENCH_PASSWORD,
+        'password2': BENCH_PASSWORD,
+    }
+
+
+SCENARIOS = {
+    'get-books': Scenario('get', params=lambda ctx: {'sort': 'average_rating', 'order': 'desc'}),
+    'get-book-by-id': Scenario('get', kwargs=lambda ctx: {'pk': ctx.book_id}),
+    'get-similar-books': Scenario('get', kwargs=lambda ctx: {'pk': ctx.popular_book_id}),
+    'export-books': Scenario('get', params=lambda ctx: {'type': 'ndjson'}),
+    'get-genres': Scenario('get', params=lambda ctx: {'sort': 'average_rating', 'order': 'desc'}),
+    'get-authors': Scenario('get', params=lambda ctx: {'sort': 'book_count', 'order': 'desc'}),
+    'get-book-notes': Scenario('get', kwargs=lambda ctx: {'book_id': ctx.popular_book_id}),
+    'create-book-note': Scenario(
+        'post', kwargs=lambda ctx: {'book_id': ctx.book_id}, data=lambda ctx: {'content': 'bench note'}, auth=True
+    ),
+    'update-note': Scenario(
+        'put', kwargs=lambda ctx: {'note_id': ctx.state['note_id']},
+        data=lambda ctx: {'content': 'updated'}, auth=True, setup=_new_note,
+    ),
+    'delete-note': Scenario(
+        'delete', kwargs=lambda ctx: {'note_id': ctx.state['note_id']}, auth=True, setup=_new_note
+    ),
+    'rate-book': Scenario(
+        'post', kwargs=lambda ctx: {'book_id': ctx.book_id},
+        data=lambda ctx: {'rating': random.randint(1, 10)}, auth=True,
+    ),
+    'rate-books-batch': Scenario(
+        'post', data=lambda ctx: [{'book_id': b, 'rating': random.randint(1, 10)} for b in ctx.state['batch_ids']],
+        auth=True, setup=_batch_books,
+    ),
+    'get-recommendations': Scenario('get', auth=True),
+    'get-reading-list': Scenario('get', auth=True, setup=_ensure_listed),
+    'add-to-reading-list': Scenario('post', kwargs=lambda ctx: {'book_id': ctx.book_id}, auth=True),
+    'remove-from-reading-list': Scenario(
+        'delete', kwargs=lambda ctx: {'book_id': ctx.book_id}, auth=True, setup=_ensure_listed
+    ),
+    'bulk-add-to-reading-list': Scenario(
+        'post', data=lambda ctx: {'book_ids': ctx.state['batch_ids'][:100]}, auth=True, setup=_clear_batch_listing,
+    ),
+    'bulk-remove-from-reading-list': Scenario(
+        'post', data=lambda ctx: {'book_ids': ctx.state['batch_ids'][:100]}, auth=True, setup=_list_batch,
+    ),
+    'reading-list-membership': Scenario(
+        'get', params=lambda ctx: {'ids': ','.join(map(str, ctx.state['batch_ids'][:100]))},
+        auth=True, setup=_list_batch,
+    ),
+    'register': Scenario('post', data=_next_username),
+    'login': Scenario('post', data=lambda ctx: {'username': ctx.user.username, 'password': BENCH_PASSWORD}),
+    'cache-stats': Scenario('get', auth=True),
+}
+
+
+# Read routes that also have an ASGI-native view in api.async_views
+ASYNC_READ_VIEWS = {
+    'get-books': 'getBooks',
+    'get-book-by-id': 'getBookById',
+    'get-book-notes': 'get_book_notes',
+    'get-reading-list': 'get_reading_list',
+}
+
+
+def api_route_names():
+    from api import urls
+    return [pattern.name for pattern in urls.urlpatterns if pattern.name]
+
+
+def _consume(response):
+    # Streaming bodies are only produced as they are read
+    if getattr(response, 'streaming', False):
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def seeded():
+    """Whether seed() has run on this database; migrations add books of their own, but no bench users."""
+    return User.objects.filter(username='bench0').exists()
+
+
+def _prepare():
+    """The benchmark user, its scenario context and a bearer token for it."""
+    user = User.objects.get(username='bench0')
+    user.set_password(BENCH_PASSWORD)
+    # Staff, so admin-only routes are measured on their success path
+    user.is_staff = True
+    user.save(update_fields=['password', 'is_staff'])
+    popular = BookNote.objects.values('book').order_by().annotate(n=Count('id')).order_by('-n').first()
+    ctx = Context(
+        user=user,
+        book_id=Book.objects.order_by('id').values_list('id', flat=True).first(),
+        popular_book_id=popular['book'] if popular else Book.objects.values_list('id', flat=True).first(),
+    )
+    return ctx, str(RefreshToken.for_user(user).access_token)
+
+
+def run(iterations=20, warmup=3, routes=None, log=None):
+    """Replay each route and return {route: metrics}. Requires seeded data."""
+    log = log or (lambda message: None)
+    names = routes or api_route_names()
+    missing = [name for name in names if name not in SCENARIOS]
+    if missing:
+        raise ValueError(f'No benchmark scenario for routes: {", ".join(missing)}')
+
+    ctx, token = _prepare()
+
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name]
+        client = APIClient()
+        if scenario.auth:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        def call():
+            # Prepare outside the timed section and return the bare request
+            if scenario.setup:
+                scenario.setup(ctx)
+            url = reverse(name, kwargs=scenario.kwargs(ctx))
+            send = getattr(client, scenario.method)
+            if scenario.method == 'get':
+                return lambda: _consume(send(url, scenario.params(ctx)))
+            return lambda: _consume(send(url, scenario.data(ctx), format='json'))
+
+        for _ in range(warmup):
+            call()()
+
+        timings = []
+        queries = []
+        status_codes = set()
+        for _ in range(iterations):
+            request = call()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured.captured_queries))
+            status_codes.add(response.status_code)
+
+        request = call()
+        tracemalloc.start()
+        try:
+            request()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        results[name] = {
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'queries': max(queries),
+            'peak_kb': round(peak / 1024, 1),
+            'status': sorted(status_codes),
+        }
+        log(f'{name}: p50={results[name]["p50_ms"]}ms p95={results[name]["p95_ms"]}ms '
+            f'queries={results[name]["queries"]} peak={results[name]["peak_kb"]}KB')
+    return results
+
+
+def _render(view):
+    # What Django's ASGI handler does with a sync view: run it, and render
+    # the response it returns, in the single thread kept for sync code
+    def call(request, **kwargs):
+        response = view(request, **kwargs)
+        return response if getattr(response, 'is_rendered', True) else response.render()
+    return sync_to_async(call)
+
+
+async def _load(handler, build_request, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+    status_codes = set()
+
+    async def one():
+        async with semaphore:
+            request = build_request()
+            start = time.perf_counter()
+            response = await handler(request)
+            timings.append((time.perf_counter() - start) * 1000)
+            status_codes.add(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests_per_s': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'status': sorted(status_codes),
+    }
+
+
+def run_concurrency(concurrency=50, requests=500, routes=None, log=None):
+    """
+    Send `requests` calls to each read route with up to `concurrency` in
+    flight, once through its sync view and once through its async view, and
+    return {route: {'sync': metrics, 'async': metrics}}. Calls are
+    authenticated so they reach the database rather than the response cache.
+    """
+    from api import async_views, views
+
+    log = log or (lambda message: None)
+    names = [name for name in (routes or ASYNC_READ_VIEWS) if name in ASYNC_READ_VIEWS]
+    ctx, token = _prepare()
+    factory = AsyncRequestFactory()
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name]
+        if scenario.setup:
+            scenario.setup(ctx)
+        kwargs = scenario.kwargs(ctx)
+        url = reverse(name, kwargs=kwargs)
+
+        def build_request():
+            return factory.get(url, scenario.params(ctx), headers={'Authorization': f'Bearer {token}'})
+
+        stacks = {
+            'sync': _render(getattr(views, ASYNC_READ_VIEWS[name])),
+            'async': getattr(async_views, ASYNC_READ_VIEWS[name]),
+        }
+        results[name] = {}
+        for stack, view in stacks.items():
+            handler = lambda request, view=view: view(request, **kwargs)
+            results[name][stack] = async_to_sync(_load)(handler, build_request, requests, concurrency)
+            metrics = results[name][stack]
+            log(f'{name} [{stack}, concurrency={concurrency}]: {metrics["requests_per_s"]} req/s '
+                f'p50={metrics["p50_ms"]}ms p95={metrics["p95_ms"]}ms')
+    return results
+
+
+@contextmanager
+def _authenticating_with(auth_class):
+    """
+    Have every API view authenticate with `auth_class` inside the block.
+    Views copy DEFAULT_AUTHENTICATION_CLASSES when they are defined, so the
+    setting alone would not reach them.
+    """
+    from api import urls
+    from api.authentication import user_cache
+
+    views = [pattern.callback.cls for pattern in urls.urlpatterns if hasattr(pattern.callback, 'cls')]
+    saved = [view.authentication_classes for view in views]
+    rest_framework = dict(settings.REST_FRAMEWORK, DEFAULT_AUTHENTICATION_CLASSES=(auth_class,))
+    user_cache.clear()
+    try:
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            for view in views:
+                view.authentication_classes = [import_string(auth_class)]
+            yield
+    finally:
+        for view, classes in zip(views, saved):
+            view.authentication_classes = classes
+        user_cache.clear()
+
+
+# Authentication classes compared by run_auth_cache()
+AUTHENTICATION_MODES = {
+    'uncached': 'rest_framework_simplejwt.authentication.JWTAuthentication',
+    'cached': 'api.authentication.CachedJWTAuthentication',
+}
+
+
+def run_auth_cache(iterations=20, warmup=3, routes=None, log=None):
+    """
+    run() the authenticated routes once with simplejwt's JWTAuthentication
+    and once with CachedJWTAuthentication (AUTH_USER_CACHE['ENABLED']), and
+    return {route: {'uncached': metrics, 'cached': metrics}}.
+    """
+    log = log or (lambda message: None)
+    names = [name for name in (routes or api_route_names()) if name in SCENARIOS and SCENARIOS[name].auth]
+    runs = {}
+    for mode, auth_class in AUTHENTICATION_MODES.items():
+        with _authenticating_with(auth_class):
+            runs[mode] = run(
+                iterations=iterations, warmup=warmup, routes=names, log=lambda message: log(f'[{mode}] {message}')
+            )
+    return {name: {mode: runs[mode][name] for mode in runs} for name in names}
+
+
+def run_login(iterations=10, log=None):
+    """
+    Log in `iterations` times with the stored hash made by each configured
+    hasher and return {algorithm: metrics}, including logins per second of
+    process CPU time (i.e. per core). The hash is reset before every call,
+    so for all but the first hasher each login also pays for the upgrade.
+    """
+    log = log or (lambda message: None)
+    ctx, _ = _prepare()
+    client = APIClient()
+    url = reverse('login')
+    credentials = {'username': ctx.user.username, 'password': BENCH_PASSWORD}
+    results = {}
+    for hasher in get_hashers():
+        encoded = hasher.encode(BENCH_PASSWORD, hasher.salt())
+        timings = []
+        cpu = 0.0
+        status_codes = set()
+        for _ in range(iterations):
+            User.objects.filter(pk=ctx.user.pk).update(password=encoded)
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            response = client.post(url, credentials, format='json')
+            timings.append((time.perf_counter() - start) * 1000)
+            cpu += time.process_time() - cpu_start
+            status_codes.add(response.status_code)
+        results[hasher.algorithm] = {
+            'logins_per_core_s': round(iterations / cpu, 2) if cpu else None,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'status': sorted(status_codes),
+        }
+        log(f'login [{hasher.algorithm}]: {results[hasher.algorithm]["logins_per_core_s"]} logins/s per core '
+            f'p50={results[hasher.algorithm]["p50_ms"]}ms')
+    return results
+
+
+def _serialization_books(count, rng):
+    """`count` unsaved books with a user rating set, as a list view would annotate."""
+    books = []
+    for i in range(count):
+        book = Book(
+            id=i + 1,
+            title=' '.join(rng.choice(WORDS) for _ in range(3)).title(),
+            author=f'{rng.choice(WORDS).title()} Author{i % 500}',
+            publication_date=date(1900, 1, 1) + timedelta(days=rng.randrange(45_000)),
+            isbn=f'{i:013d}',
+            genre=rng.choice(GENRES),
+            short_description=' '.join(rng.choice(WORDS) for _ in range(30)),
+            page_count=rng.randrange(50, 1500),
+            # Quantized to one place, as the database converter returns it
+            average_rating=Decimal(rng.randrange(0, 101)).scaleb(-1),
+            total_ratings=rng.randrange(1000),
+            about=' '.join(rng.choice(WORDS) for _ in range(150)),
+        )
+        book.current_user_rating = rng.choice((None, rng.randint(1, 10)))
+        books.append(book)
+    return books
+
+
+def run_serialization(sizes=(1_000, 10_000, 100_000), repeat=3, log=None):
+    """
+    Time BookSerializer plus JSONRenderer against the row encoder plus
+    FastJSONRenderer over the same synthetic books, serialization only, and
+    return {rows: metrics}, each the best of `repeat` runs. Needs no data.
+    """
+    from api.renderers import FastJSONRenderer, orjson
+    from api.serializers import BookSerializer, book_rows
+
+    log = log or (lambda message: None)
+    rng = random.Random(42)
+    results = {}
+    for size in sizes:
+        books = _serialization_books(size, rng)
+        # The rows values() would fetch for an authenticated list request
+        row_class = create_namedtuple_class(*book_rows.values(Book.objects.annotate(
+            current_user_rating=Value(None, IntegerField())
+        ))._fields)
+        rows = [row_class(*(getattr(book, column) for column in row_class._fields)) for book in books]
+
+        paths = {
+            'serializer': lambda: JSONRenderer().render(BookSerializer(books, many=True).data),
+            'rows': lambda: FastJSONRenderer().render(book_rows.encode(rows)),
+        }
+        timings = {name: [] for name in paths}
+        output = {}
+        for _ in range(repeat):
+            for name, path in paths.items():
+                start = time.perf_counter()
+                output[name] = path()
+                timings[name].append((time.perf_counter() - start) * 1000)
+
+        best = {name: min(samples) for name, samples in timings.items()}
+        results[size] = {
+            'serializer_ms': round(best['serializer'], 3),
+            'rows_ms': round(best['rows'], 3),
+            'speedup': round(best['serializer'] / best['rows'], 2) if best['rows'] else None,
+            'identical': output['serializer'] == output['rows'],
+            'renderer': 'orjson' if orjson is not None else 'json',
+        }
+        log(f'serialize {size} rows: serializer={results[size]["serializer_ms"]}ms '
+            f'rows={results[size]["rows_ms"]}ms ({results[size]["speedup"]}x, {results[size]["renderer"]}) '
+            f'identical={results[size]["identical"]}')
+    return results
+
+
+def compare(results, baseline, latency_tolerance=0.2):
+    """
+    List regressions against a stored report: any increase in query count,
+    or p95 latency above the baseline by more than `latency_tolerance`.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        previous = baseline.get('routes', {}).get(name)
+        if not previous:
+            continue
+        if metrics['queries'] > previous['queries']:
+            regressions.append(f'{name}: queries {previous["queries"]} -> {metrics["queries"]}')
+        if metrics['p95_ms'] > previous['p95_ms'] * (1 + latency_tolerance):
+            regressions.append(f'{name}: p95 {previous["p95_ms"]}ms -> {metrics["p95_ms"]}ms')
+    return regressions
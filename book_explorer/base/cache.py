@@ -0,0 +1,152 @@
+"""
+Version counters for cached catalog responses.
+
+Cached entries are never deleted; instead their keys embed version numbers
+that writes bump, so stale entries simply stop being looked up and age out
+of the cache on their own:
+
+- the catalog generation changes whenever any book or rating does, which
+  covers every list response;
+- the books version changes only when a book itself is created, edited or
+  deleted, for what depends on book columns but not on ratings;
+- each book has its own version for its detail response;
+- each book's notes have their own version, so a new note does not evict
+  the catalog;
+- each user's recommendations have their own version, bumped when the
+  user rates or saves a book;
+- an epoch shared by every key is bumped by bulk writes that bypass model
+  signals (QuerySet.update(), bulk_create()) and may touch any book.
+"""
+import random
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Book, BookNote, BookRating
+
+CACHE_ALIAS = 'catalog'
+EPOCH_KEY = 'catalog:epoch'
+GENERATION_KEY = 'catalog:generation'
+BOOKS_KEY = 'catalog:books'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _book_key(book_id):
+    return f'catalog:book:{book_id}'
+
+
+def _notes_key(book_id):
+    return f'catalog:notes:{book_id}'
+
+
+def _recommendations_key(user_id):
+    return f'catalog:recommendations:{user_id}'
+
+
+def _fresh_version():
+    # A counter that was evicted must not restart at a value that old entries
+    # were stored under, so start from a random point instead of zero.
+    return random.getrandbits(48)
+
+
+def get_versions(*keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _fresh_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh_version(), timeout=None)
+
+
+def catalog_versions():
+    return get_versions(EPOCH_KEY, GENERATION_KEY)
+
+
+def facet_versions():
+    """(epoch, books version, generation): facets other than ratings need only the first two."""
+    return get_versions(EPOCH_KEY, BOOKS_KEY, GENERATION_KEY)
+
+
+def book_versions(book_id):
+    return get_versions(EPOCH_KEY, _book_key(book_id))
+
+
+def notes_versions(book_id):
+    """A notes response depends on its book as well as on the notes."""
+    return get_versions(EPOCH_KEY, _book_key(book_id), _notes_key(book_id))
+
+
+def recommendation_versions(user_id):
+    return get_versions(EPOCH_KEY, _recommendations_key(user_id))
+
+
+def invalidate_all():
+    """Call after bulk writes that bypass model signals."""
+    _bump(EPOCH_KEY)
+
+
+def invalidate_book(book_id):
+    _bump(_book_key(book_id))
+    _bump(GENERATION_KEY)
+
+
+def invalidate_book_row(book_id):
+    """invalidate_book() for a write to the book itself rather than its ratings."""
+    invalidate_book(book_id)
+    _bump(BOOKS_KEY)
+
+
+def invalidate_books(book_ids):
+    """invalidate_book() for a bulk write to known books, bumping the generation once."""
+    def invalidate():
+        for book_id in book_ids:
+            _bump(_book_key(book_id))
+        _bump(GENERATION_KEY)
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def invalidate_notes(book_id):
+    _bump(_notes_key(book_id))
+
+
+def invalidate_recommendations(user_id):
+    _bump(_recommendations_key(user_id))
+
+
+def _on_write(invalidate, book_id):
+    # Bump now and again at commit: a reader that cached the old rows while
+    # the transaction was still open would otherwise keep them until the
+    # next write.
+    invalidate(book_id)
+    transaction.on_commit(lambda: invalidate(book_id))
+
+
+@receiver([post_save, post_delete], sender=Book)
+def _book_changed(sender, instance, **kwargs):
+    _on_write(invalidate_book_row, instance.pk)
+
+
+@receiver([post_save, post_delete], sender=BookRating)
+def _rating_changed(sender, instance, **kwargs):
+    _on_write(invalidate_book, instance.book_id)
+    _on_write(invalidate_recommendations, instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=BookNote)
+def _note_changed(sender, instance, **kwargs):
+    _on_write(invalidate_notes, instance.book_id)
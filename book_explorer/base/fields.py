@@ -0,0 +1,40 @@
+from django.db import models
+from django.db.models import FloatField, Func, Lookup, TextField, Value
+
+
+class SearchDocumentField(models.TextField):
+    """
+    The hidden FTS5 column that carries the table's name. It is only useful
+    as the left-hand side of MATCH and as the first argument of the FTS5
+    auxiliary functions (bm25, snippet, highlight).
+    """
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+class BM25(Func):
+    """bm25() score of the current match; lower is more relevant."""
+    function = 'bm25'
+    output_field = FloatField()
+
+    def __init__(self, document, weights=(), **extra):
+        super().__init__(document, *(Value(float(w)) for w in weights), **extra)
+
+
+class Snippet(Func):
+    """Highlighted fragment of one indexed column around the matched terms."""
+    function = 'snippet'
+    output_field = TextField()
+
+    def __init__(self, document, column, start='<mark>', end='</mark>', ellipsis='…', tokens=16, **extra):
+        super().__init__(
+            document, Value(column), Value(start), Value(end), Value(ellipsis), Value(tokens), **extra
+        )
@@ -0,0 +1,136 @@
+"""
+Per-genre and per-author statistics.
+
+Genre and Author rows hold their book count, rating totals, mean rating and
+top-K book ids, so "top rated in genre X" is one primary-key read instead of
+a scan of Book. They are kept current at the point of each write:
+
+- mark_stale() records that a single rating changed a book's two groups,
+  so the rating itself writes nothing but its book's row and an idempotent
+  mark, and raters of the same genre never wait on its row;
+- refresh_stale() recomputes the marked groups in one batch, run by
+  `manage.py refresh_group_stats`, so until then their totals and top K
+  trail single ratings;
+- refresh() recomputes given groups from their books, for book saves that
+  move a book or change its ratings, book deletes and batch ratings;
+- rebuild() links every book to its groups and recomputes them all, for
+  bulk loads that bypass model signals.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from .models import Author, Book, Genre, StaleGroup
+from .ratings import average_expression
+
+TOP_K = 10
+
+# Each group model with the Book column it groups by and the foreign key to it
+GROUPS = (
+    (Genre, 'genre', 'genre_ref'),
+    (Author, 'author', 'author_ref'),
+)
+
+TOP_ORDER = (F('average_rating').desc(), F('total_ratings').desc(), F('id').asc())
+
+
+def _totals(rating_sum, total_ratings):
+    return {
+        'rating_sum': rating_sum,
+        'total_ratings': total_ratings,
+        'average_rating': average_expression(rating_sum, total_ratings),
+    }
+
+
+def groups_of(rows):
+    """{group model: set of ids} from (genre_ref_id, author_ref_id) rows."""
+    found = {Genre: set(), Author: set()}
+    for genre_id, author_id in rows:
+        found[Genre].add(genre_id)
+        found[Author].add(author_id)
+    return {model: ids - {None} for model, ids in found.items()}
+
+
+def _rank(model, fk, group_ids=None):
+    """Store the top-K book ids of each group, or of the given ones, from one windowed query."""
+    books = Book.objects.filter(**{f'{fk}__isnull': False})
+    groups = model.objects.all()
+    if group_ids is not None:
+        books = books.filter(**{f'{fk}__in': group_ids})
+        groups = groups.filter(id__in=group_ids)
+    ranked = books.annotate(
+        position=Window(RowNumber(), partition_by=F(fk), order_by=TOP_ORDER),
+    ).filter(position__lte=TOP_K).order_by(fk, 'position').values_list(f'{fk}_id', 'id', 'average_rating')
+
+    tops = defaultdict(list)
+    for group_id, book_id, average in ranked:
+        tops[group_id].append((book_id, average))
+    changed = []
+    for group in groups.only('id', 'top_book_ids', 'top_floor'):
+        top = tops.get(group.id, [])
+        group.top_book_ids = [book_id for book_id, _ in top]
+        group.top_floor = top[-1][1] if len(top) == TOP_K else None
+        changed.append(group)
+    model.objects.bulk_update(changed, ['top_book_ids', 'top_floor'], batch_size=1000)
+
+
+def refresh(groups=None):
+    """Recompute the given groups ({model: ids}), or all of them, from their books."""
+    for model, column, fk in GROUPS:
+        ids = None if groups is None else groups.get(model)
+        if groups is not None and not ids:
+            continue
+        per_group = Book.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+        rating_sum = Coalesce(Subquery(per_group.annotate(s=Sum('rating_sum')).values('s')), 0)
+        total_ratings = Coalesce(Subquery(per_group.annotate(c=Sum('total_ratings')).values('c')), 0)
+        targets = model.objects.all() if ids is None else model.objects.filter(id__in=ids)
+        targets.update(
+            book_count=Coalesce(Subquery(per_group.annotate(c=Count('id')).values('c')), 0),
+            **_totals(rating_sum, total_ratings),
+        )
+        _rank(model, fk, ids)
+
+
+def refresh_for_books(book_ids):
+    refresh(groups_of(Book.objects.filter(id__in=book_ids).values_list('genre_ref_id', 'author_ref_id')))
+
+
+def mark_stale(genre_id, author_id):
+    """Queue a rated book's groups for refresh_stale()."""
+    marks = [
+        StaleGroup(kind=column, group_id=group_id)
+        for (_, column, _), group_id in zip(GROUPS, (genre_id, author_id)) if group_id is not None
+    ]
+    StaleGroup.objects.bulk_create(marks, ignore_conflicts=True)
+
+
+def refresh_stale(batch_size=500):
+    """Refresh the groups queued by mark_stale(), `batch_size` at a time; returns how many."""
+    with transaction.atomic():
+        marks = list(StaleGroup.objects.values_list('id', 'kind', 'group_id'))
+        # Only these: marks made from here on are for ratings this refresh may not see
+        for start in range(0, len(marks), batch_size):
+            StaleGroup.objects.filter(id__in=[mark_id for mark_id, _, _ in marks[start:start + batch_size]]).delete()
+    for model, column, _ in GROUPS:
+        ids = sorted(group_id for _, kind, group_id in marks if kind == column)
+        for start in range(0, len(ids), batch_size):
+            refresh({model: ids[start:start + batch_size]})
+    return len(marks)
+
+
+def link(book):
+    """Point a book at the groups named by its genre and author, creating them as needed."""
+    for model, column, fk in GROUPS:
+        group, _ = model.objects.get_or_create(name=getattr(book, column))
+        setattr(book, fk, group)
+
+
+def rebuild():
+    """Create missing groups, relink every book and recompute every group."""
+    for model, column, fk in GROUPS:
+        names = Book.objects.order_by().values_list(column, flat=True).distinct()
+        model.objects.bulk_create([model(name=name) for name in names], ignore_conflicts=True, batch_size=1000)
+        Book.objects.update(**{fk: Subquery(model.objects.filter(name=OuterRef(column)).values('id')[:1])})
+    refresh()
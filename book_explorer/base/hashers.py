@@ -0,0 +1,91 @@
+"""
+Password hashing.
+
+The hasher here is Django's scrypt hasher with its cost parameters taken
+from settings.PASSWORD_HASHING, so they can be tuned per deployment. It
+keeps Django's algorithm name: a stored hash made with other parameters,
+or by any hasher after the first in PASSWORD_HASHERS, is rehashed on the
+user's next successful login. scrypt needs nothing beyond the standard
+library, so every host can verify every stored hash.
+
+Verifying a password is deliberately expensive, so logins hash on a small
+bounded pool (PooledModelBackend). A burst of logins then queues for those
+workers, and past the queue limit is turned away, instead of tying up every
+thread that also serves catalog reads.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import ScryptPasswordHasher, make_password, verify_password
+
+HASHING = getattr(settings, 'PASSWORD_HASHING', {})
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    work_factor = HASHING.get('SCRYPT', {}).get('work_factor', ScryptPasswordHasher.work_factor)
+    block_size = HASHING.get('SCRYPT', {}).get('block_size', ScryptPasswordHasher.block_size)
+    parallelism = HASHING.get('SCRYPT', {}).get('parallelism', ScryptPasswordHasher.parallelism)
+
+
+class HashingBusy(Exception):
+    """Every hashing worker is busy and the queue is full."""
+
+
+class HashingPool:
+    def __init__(self, workers, queue):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        # Running plus waiting jobs; past this, callers are refused at once
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+
+hashing_pool = HashingPool(
+    workers=HASHING.get('WORKERS') or max((os.cpu_count() or 2) // 2, 1),
+    queue=HASHING.get('QUEUE', 32),
+)
+
+
+def _verify(password, encoded):
+    """(is_correct, new_hash); new_hash is set when the stored one is outdated."""
+    is_correct, must_update = verify_password(password, encoded)
+    return is_correct, make_password(password) if is_correct and must_update else None
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend that verifies, and when due upgrades, passwords on
+    hashing_pool. The database reads and writes stay on the calling thread.
+    Raises HashingBusy when the pool is saturated.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash once anyway so a missing user takes as long as a wrong password
+            hashing_pool.run(make_password, password)
+            return
+        is_correct, new_hash = hashing_pool.run(_verify, password, user.password)
+        if not is_correct:
+            return
+        if new_hash is not None:
+            user.password = new_hash
+            user.save(update_fields=['password'])
+        if self.user_can_authenticate(user):
+            return user
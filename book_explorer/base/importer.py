@@ -0,0 +1,204 @@
+"""
+Bulk catalog import.
+
+Rows are read and validated in one streaming pass and upserted on `isbn` in
+batches with bulk_create(update_conflicts=True). Secondary indexes and the
+full-text index are dropped for the duration of the load and rebuilt once
+at the end, which is far cheaper than maintaining them row by row.
+"""
+import csv
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from . import group_stats, search
+from .cache import invalidate_all
+from .models import Book
+
+REQUIRED_FIELDS = ('title', 'author', 'publication_date', 'isbn', 'genre', 'short_description', 'page_count')
+OPTIONAL_FIELDS = ('about',)
+# Everything an import may change on an existing book; ratings are never imported
+UPDATE_FIELDS = [f for f in REQUIRED_FIELDS + OPTIONAL_FIELDS if f != 'isbn'] + ['updated_at']
+
+
+@dataclass
+class ImportReport:
+    read: int = 0
+    upserted: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+    rejects: list = field(default_factory=list)
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+
+def iter_json_array(fp, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+
+    def skip(chars):
+        nonlocal pos
+        while pos < len(buffer) and buffer[pos] in chars:
+            pos += 1
+
+    while True:
+        skip(' \t\r\n,' if started else ' \t\r\n')
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('Expected a JSON array')
+                pos += 1
+                started = True
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(buffer) or eof:
+                    pos = end
+                    yield item
+                    continue
+        elif eof:
+            raise ValueError('Unterminated JSON array')
+        chunk = fp.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+class RowError(Exception):
+    """Yielded by a reader in place of a row it could not parse."""
+
+
+def iter_ndjson(fp):
+    for line in fp:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield RowError(f'Invalid JSON: {e}')
+
+
+def iter_csv(fp):
+    yield from csv.DictReader(fp)
+
+
+READERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+    'jsonl': iter_ndjson,
+    'json': iter_json_array,
+}
+
+
+def validate_row(row):
+    """Return (Book, None) for a valid row or (None, errors) otherwise."""
+    if isinstance(row, RowError):
+        return None, {'row': [str(row)]}
+    if not isinstance(row, dict):
+        return None, {'row': ['Expected an object']}
+    values = {}
+    errors = {}
+    for name in REQUIRED_FIELDS + OPTIONAL_FIELDS:
+        raw = row.get(name)
+        if isinstance(raw, str):
+            raw = raw.strip()
+        if raw in (None, ''):
+            if name in REQUIRED_FIELDS:
+                errors[name] = ['This field is required.']
+            continue
+        try:
+            values[name] = Book._meta.get_field(name).clean(raw, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+    if errors:
+        return None, errors
+    return Book(**values), None
+
+
+@contextmanager
+def deferred_indexes(model):
+    """Drop the model's Meta.indexes during a bulk load and recreate them afterwards."""
+    indexes = list(model._meta.indexes)
+    if not indexes:
+        yield
+        return
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.add_index(model, index)
+
+
+def _upsert(batch):
+    # The same isbn twice in one statement is an error on some backends; keep the last
+    unique = list({book.isbn: book for book in batch}.values())
+    with transaction.atomic():
+        Book.objects.bulk_create(
+            unique,
+            update_conflicts=True,
+            unique_fields=['isbn'],
+            update_fields=UPDATE_FIELDS,
+        )
+    return len(unique)
+
+
+def import_books(rows, batch_size=5000, max_rejects=1000, defer_indexes=True, progress=None):
+    """
+    Validate and upsert an iterable of row dicts. Rejected rows are recorded
+    (up to `max_rejects` of them) with their 1-based row number and errors.
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    batch = []
+
+    def load():
+        for number, row in enumerate(rows, start=1):
+            report.read += 1
+            book, errors = validate_row(row)
+            if errors:
+                report.rejected += 1
+                if len(report.rejects) < max_rejects:
+                    report.rejects.append({'row': number, 'errors': errors})
+                continue
+            batch.append(book)
+            if len(batch) >= batch_size:
+                report.upserted += _upsert(batch)
+                batch.clear()
+                if progress:
+                    progress(report)
+        if batch:
+            report.upserted += _upsert(batch)
+            batch.clear()
+
+    if defer_indexes:
+        with search.deferred_sync(), deferred_indexes(Book):
+            load()
+    else:
+        load()
+    # Bulk upserts skip the Book signals that keep genres and authors linked
+    group_stats.rebuild()
+    invalidate_all()
+    report.seconds = time.perf_counter() - started
+    return report
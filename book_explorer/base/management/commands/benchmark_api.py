@@ -0,0 +1,115 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from base import benchmark
+
+KEPT_SQLITE_DB = settings.BASE_DIR / 'var' / 'benchmark.sqlite3'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic catalog into a throwaway database and record p50/p95 latency, "
+        "query count and peak memory for every API route."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=benchmark.SCALES, default='small')
+        parser.add_argument('--books', type=int, help='Override the number of books for the scale')
+        parser.add_argument('--users', type=int, help='Override the number of users for the scale')
+        parser.add_argument('--ratings', type=int, help='Override the number of ratings for the scale')
+        parser.add_argument('--notes', type=int, help='Override the number of notes for the scale')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--route', action='append', dest='routes', help='Only benchmark this route name')
+        parser.add_argument('--output', default='benchmark-report.json', help='Where to write the JSON report')
+        parser.add_argument('--baseline', help='Report to compare against; regressions fail the command')
+        parser.add_argument(
+            '--latency-tolerance', type=float, default=0.2,
+            help='Allowed p95 increase over the baseline, as a fraction (default 0.2)'
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the benchmark database between runs')
+        parser.add_argument(
+            '--concurrency', type=int,
+            help='Also load the read routes with this many requests in flight, sync views against async views'
+        )
+        parser.add_argument(
+            '--login', action='store_true',
+            help='Also measure login throughput per core for each configured password hasher'
+        )
+        parser.add_argument(
+            '--auth-cache', action='store_true',
+            help='Also time the authenticated routes with the JWT user cache off and on'
+        )
+        parser.add_argument(
+            '--serialization', action='store_true',
+            help='Also time BookSerializer against the row encoder at 1k, 10k and 100k books'
+        )
+        parser.add_argument(
+            '--concurrent-requests', type=int, default=500,
+            help='Requests per route and stack for --concurrency (default 500)'
+        )
+
+    def handle(self, *args, **options):
+        scale = dict(benchmark.SCALES[options['scale']])
+        for key in scale:
+            if options[key] is not None:
+                scale[key] = options[key]
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        log = lambda message: self.stdout.write(message)
+        if options['keepdb'] and connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+            # SQLite's default test database is in memory and gone when
+            # the command exits, so there would be nothing to keep
+            KEPT_SQLITE_DB.parent.mkdir(parents=True, exist_ok=True)
+            connection.settings_dict['TEST']['NAME'] = str(KEPT_SQLITE_DB)
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not options['keepdb'] or not benchmark.seeded():
+                benchmark.seed(**scale, log=log)
+            results = benchmark.run(
+                iterations=options['iterations'], warmup=options['warmup'], routes=options['routes'], log=log
+            )
+            auth_cache = None
+            if options['auth_cache']:
+                auth_cache = benchmark.run_auth_cache(
+                    iterations=options['iterations'], warmup=options['warmup'], routes=options['routes'], log=log
+                )
+            logins = benchmark.run_login(iterations=options['iterations'], log=log) if options['login'] else None
+            serialization = benchmark.run_serialization(log=log) if options['serialization'] else None
+            concurrency = None
+            if options['concurrency']:
+                concurrency = benchmark.run_concurrency(
+                    concurrency=options['concurrency'], requests=options['concurrent_requests'],
+                    routes=options['routes'], log=log,
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = {'scale': scale, 'iterations': options['iterations'], 'routes': results}
+        if auth_cache is not None:
+            report['auth_cache'] = auth_cache
+        if logins is not None:
+            report['login'] = logins
+        if serialization is not None:
+            report['serialization'] = serialization
+        if concurrency is not None:
+            report['concurrency'] = {'in_flight': options['concurrency'], 'routes': concurrency}
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options['latency_tolerance'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
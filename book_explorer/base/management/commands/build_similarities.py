@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base.cache import invalidate_all
+from base.similarity import build
+
+
+class Command(BaseCommand):
+    help = "Recompute every book's most similar books from BookRating (needs NumPy and SciPy)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=20, help='Neighbours to keep per book')
+        parser.add_argument(
+            '--adjusted', action='store_true',
+            help="Centre each rating on its user's mean first (adjusted cosine)"
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Books per similarity block; lower it to bound memory'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per database read and write')
+
+    def handle(self, *args, **options):
+        for name in ('k', 'chunk_size', 'batch_size'):
+            if options[name] <= 0:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+
+        report = build(
+            k=options['k'],
+            adjusted=options['adjusted'],
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+            progress=lambda r, done: self.stdout.write(f'  {done} of {r.books} books, {r.neighbours} neighbours'),
+        )
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {report.neighbours} neighbours for {report.books} books '
+            f'from {report.ratings} ratings in {report.seconds:.1f}s'
+        ))
@@ -0,0 +1,57 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.importer import READERS, import_books
+
+
+class Command(BaseCommand):
+    help = "Upsert books on isbn from CSV, NDJSON or JSON array files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Files to import')
+        parser.add_argument('--format', choices=READERS, help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--rejects', help='Write rejected rows with their errors to this NDJSON file')
+        parser.add_argument('--max-rejects', type=int, default=1000, help='How many rejected rows to keep in detail')
+        parser.add_argument(
+            '--no-defer-indexes', action='store_false', dest='defer_indexes',
+            help='Keep secondary and full-text indexes live during the load'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        rejects = []
+        for path in map(Path, options['paths']):
+            fmt = options['format'] or path.suffix.lstrip('.').lower()
+            if fmt not in READERS:
+                raise CommandError(f'Cannot tell the format of {path}; pass --format')
+            if not path.exists():
+                raise CommandError(f'{path} does not exist')
+
+            self.stdout.write(f'Importing {path} ({fmt})')
+            with path.open(newline='', encoding='utf-8') as fp:
+                report = import_books(
+                    READERS[fmt](fp),
+                    batch_size=options['batch_size'],
+                    max_rejects=options['max_rejects'],
+                    defer_indexes=options['defer_indexes'],
+                    progress=lambda r: self.stdout.write(f'  {r.read} rows read, {r.upserted} upserted'),
+                )
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{path}: {report.read} rows read, {report.upserted} upserted, {report.rejected} rejected '
+                f'in {report.seconds:.1f}s ({report.rows_per_second:,.0f} rows/s)'
+            ))
+            for reject in report.rejects[:10]:
+                self.stdout.write(self.style.WARNING(f"  row {reject['row']}: {reject['errors']}"))
+            rejects.extend({'file': str(path), **reject} for reject in report.rejects)
+
+        if options['rejects']:
+            with open(options['rejects'], 'w') as f:
+                for reject in rejects:
+                    f.write(json.dumps(reject) + '\n')
+            self.stdout.write(f"Wrote {len(rejects)} rejected rows to {options['rejects']}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "Print an X-Profile header that has requests carrying it profiled (see api/profiling.py) "
+        "while PROFILING['ENABLED'] is set."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{profiling.HEADER}: {profiling.debug_token()}')
+        if not profiling.ENABLED:
+            self.stderr.write(self.style.WARNING("PROFILING['ENABLED'] is off, so the header has no effect"))
+        self.stdout.write(f'Valid for {profiling.TOKEN_MAX_AGE} seconds; profiles go to {profiling.directory()}')
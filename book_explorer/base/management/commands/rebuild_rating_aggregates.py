@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from base import group_stats
+from base.cache import invalidate_all
+from base.models import Book, BookRating
+from base.ratings import rebuild_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute every book's rating_sum, total_ratings and average_rating from BookRating, then every genre's and author's statistics."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_aggregates(Book, BookRating)
+            group_stats.rebuild()
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} books'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from base import group_stats
+from base.cache import invalidate_all
+
+
+class Command(BaseCommand):
+    help = "Recompute the statistics of the genres and authors whose books were rated since the last run; run it every minute or so."
+
+    def handle(self, *args, **options):
+        refreshed = group_stats.refresh_stale()
+        if refreshed:
+            invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} genres and authors'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base.als import train
+from base.recommendations import model_dir
+
+
+class Command(BaseCommand):
+    help = "Train the recommendation model on BookRating with ALS and make it the current version (needs NumPy and SciPy)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=32, help='Latent dimensions per user and book')
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument(
+            '--regularization', type=float, default=0.1,
+            help='Ridge penalty; above zero so users and books with fewer ratings than factors stay solvable'
+        )
+        parser.add_argument('--keep', type=int, default=3, help='Model versions to keep on disk, the new one included')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Ratings per database read')
+
+    def handle(self, *args, **options):
+        for name in ('factors', 'iterations', 'keep', 'batch_size'):
+            if options[name] <= 0:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        if options['regularization'] <= 0:
+            raise CommandError('--regularization must be positive')
+
+        report = train(
+            factors=options['factors'],
+            iterations=options['iterations'],
+            regularization=options['regularization'],
+            batch_size=options['batch_size'],
+            keep=options['keep'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Trained version {report.version} on {report.ratings} ratings '
+            f'({report.users} users, {report.books} books, training RMSE {report.rmse:.3f}) '
+            f'in {report.seconds:.1f}s; written to {model_dir() / report.version}'
+        ))
@@ -0,0 +1,69 @@
+# Generated by Django 5.2 on 2026-10-18 07:32
+
+import base.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# The FTS5 index as base.search defined it when this migration was written,
+# spelled out so that later changes to that module never alter history
+FORWARD_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS base_book_fts USING fts5("
+    "title, author, genre, short_description, about, content='base_book', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS base_book_fts_ai AFTER INSERT ON base_book BEGIN "
+    "INSERT INTO base_book_fts(rowid, title, author, genre, short_description, about) "
+    "VALUES (new.id, new.title, new.author, new.genre, new.short_description, new.about); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS base_book_fts_ad AFTER DELETE ON base_book BEGIN "
+    "INSERT INTO base_book_fts(base_book_fts, rowid, title, author, genre, short_description, about) "
+    "VALUES ('delete', old.id, old.title, old.author, old.genre, old.short_description, old.about); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS base_book_fts_au AFTER UPDATE OF title, author, genre, short_description, about "
+    "ON base_book BEGIN "
+    "INSERT INTO base_book_fts(base_book_fts, rowid, title, author, genre, short_description, about) "
+    "VALUES ('delete', old.id, old.title, old.author, old.genre, old.short_description, old.about); "
+    "INSERT INTO base_book_fts(rowid, title, author, genre, short_description, about) "
+    "VALUES (new.id, new.title, new.author, new.genre, new.short_description, new.about); "
+    "END",
+    "INSERT INTO base_book_fts(base_book_fts) VALUES ('rebuild')",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS base_book_fts_ai",
+    "DROP TRIGGER IF EXISTS base_book_fts_ad",
+    "DROP TRIGGER IF EXISTS base_book_fts_au",
+    "DROP TABLE IF EXISTS base_book_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite's; other databases fall back to icontains filters
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql, params=None)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_update_book_about'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchIndex',
+            fields=[
+                ('book', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='base.book')),
+                ('document', base.fields.SearchDocumentField(db_column='base_book_fts')),
+            ],
+            options={
+                'db_table': 'base_book_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(_run(FORWARD_SQL), _run(REVERSE_SQL)),
+    ]
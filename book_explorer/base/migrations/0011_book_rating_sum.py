@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 07:33
+
+from django.db import migrations, models
+from django.db.models import Case, Count, DecimalField, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
+
+
+def backfill_rating_sums(apps, schema_editor):
+    Book = apps.get_model('base', 'Book')
+    BookRating = apps.get_model('base', 'BookRating')
+    per_book = BookRating.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    rating_sum = Coalesce(Subquery(per_book.annotate(s=Sum('rating')).values('s')), 0)
+    total_ratings = Coalesce(Subquery(per_book.annotate(c=Count('id')).values('c')), 0)
+    # base.ratings.average_expression, copied so replaying history never imports app code
+    average_rating = Case(
+        When(GreaterThan(total_ratings, 0), then=Round(Cast(rating_sum, FloatField()) / total_ratings, 1)),
+        default=Value(0),
+        output_field=DecimalField(max_digits=3, decimal_places=1),
+    )
+    Book.objects.update(rating_sum=rating_sum, total_ratings=total_ratings, average_rating=average_rating)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_sums, migrations.RunPython.noop),
+    ]
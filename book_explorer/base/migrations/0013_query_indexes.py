@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 07:47
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_book_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.text.Lower('title'), models.F('id'), name='book_title_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.text.Lower('author'), models.F('id'), name='book_author_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['publication_date', 'id'], name='book_pubdate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['average_rating', 'id'], name='book_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booknote',
+            index=models.Index(fields=['book', 'created_at', 'id'], name='booknote_book_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='readinglist',
+            index=models.Index(fields=['user', 'added_at'], name='readinglist_user_added_idx'),
+        ),
+    ]
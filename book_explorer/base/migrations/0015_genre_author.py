@@ -0,0 +1,117 @@
+# Generated by Django 5.2 on 2026-10-18 08:09
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, DecimalField, F, FloatField, OuterRef, Subquery, Sum, Value, When, Window
+from django.db.models.functions import Cast, Coalesce, Round, RowNumber
+from django.db.models.lookups import GreaterThan
+
+TOP_K = 10
+
+
+def backfill_groups(apps, schema_editor):
+    Book = apps.get_model('base', 'Book')
+    for model_name, column, fk in (('Genre', 'genre', 'genre_ref'), ('Author', 'author', 'author_ref')):
+        Group = apps.get_model('base', model_name)
+        names = Book.objects.order_by().values_list(column, flat=True).distinct()
+        Group.objects.bulk_create([Group(name=name) for name in names], ignore_conflicts=True, batch_size=1000)
+        Book.objects.update(**{fk: Subquery(Group.objects.filter(name=OuterRef(column)).values('id')[:1])})
+
+        per_group = Book.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+        rating_sum = Coalesce(Subquery(per_group.annotate(s=Sum('rating_sum')).values('s')), 0)
+        total_ratings = Coalesce(Subquery(per_group.annotate(c=Sum('total_ratings')).values('c')), 0)
+        # base.ratings.average_expression, copied so replaying history never imports app code
+        average_rating = Case(
+            When(GreaterThan(total_ratings, 0), then=Round(Cast(rating_sum, FloatField()) / total_ratings, 1)),
+            default=Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=1),
+        )
+        Group.objects.update(
+            book_count=Coalesce(Subquery(per_group.annotate(c=Count('id')).values('c')), 0),
+            rating_sum=rating_sum,
+            total_ratings=total_ratings,
+            average_rating=average_rating,
+        )
+
+        ranked = Book.objects.annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F(fk),
+                order_by=(F('average_rating').desc(), F('total_ratings').desc(), F('id').asc()),
+            ),
+        ).filter(position__lte=TOP_K).order_by(fk, 'position').values_list(f'{fk}_id', 'id', 'average_rating')
+        tops = defaultdict(list)
+        for group_id, book_id, average in ranked:
+            tops[group_id].append((book_id, average))
+        groups = []
+        for group in Group.objects.filter(id__in=tops):
+            top = tops[group.id]
+            group.top_book_ids = [book_id for book_id, _ in top]
+            group.top_floor = top[-1][1] if len(top) == TOP_K else None
+            groups.append(group)
+        Group.objects.bulk_update(groups, ['top_book_ids', 'top_floor'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveBigIntegerField(default=0)),
+                ('total_ratings', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.DecimalField(decimal_places=1, default=0.0, max_digits=3)),
+                ('top_book_ids', models.JSONField(default=list)),
+                ('top_floor', models.DecimalField(decimal_places=1, max_digits=3, null=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveBigIntegerField(default=0)),
+                ('total_ratings', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.DecimalField(decimal_places=1, default=0.0, max_digits=3)),
+                ('top_book_ids', models.JSONField(default=list)),
+                ('top_floor', models.DecimalField(decimal_places=1, max_digits=3, null=True)),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='books', to='base.author'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='genre_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='books', to='base.genre'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(models.F('genre_ref'), models.OrderBy(models.F('average_rating'), descending=True), models.OrderBy(models.F('total_ratings'), descending=True), models.F('id'), name='book_genre_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(models.F('author_ref'), models.OrderBy(models.F('average_rating'), descending=True), models.OrderBy(models.F('total_ratings'), descending=True), models.F('id'), name='book_author_rank_idx'),
+        ),
+        migrations.RunPython(backfill_groups, migrations.RunPython.noop),
+    ]
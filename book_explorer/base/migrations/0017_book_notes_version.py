@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 09:11
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_notes_state(apps, schema_editor):
+    Book = apps.get_model('base', 'Book')
+    BookNote = apps.get_model('base', 'BookNote')
+    per_book = BookNote.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    Book.objects.update(
+        notes_version=Coalesce(Subquery(per_book.annotate(c=Count('id')).values('c')), 0),
+        notes_updated_at=Subquery(per_book.annotate(m=Max('updated_at')).values('m')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0016_book_similarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='notes_updated_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='notes_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_notes_state, migrations.RunPython.noop),
+    ]
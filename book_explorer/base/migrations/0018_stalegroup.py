@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0017_book_notes_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=6)),
+                ('group_id', models.PositiveIntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'group_id'), name='stalegroup_kind_group_uniq')],
+            },
+        ),
+    ]
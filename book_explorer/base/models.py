@@ -1,5 +1,54 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
+from .fields import SearchDocumentField
+
+class BookGroup(models.Model):
+    """
+    A value of one of Book's free-text grouping columns, with statistics over
+    its books that base.group_stats keeps up to date.
+    """
+    book_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveBigIntegerField(default=0)
+    total_ratings = models.PositiveIntegerField(default=0)
+    # Mean of every rating given to the group's books
+    average_rating = models.DecimalField(max_digits=3, decimal_places=1, default=0.0)
+    # Best-rated books first, see group_stats.TOP_K
+    top_book_ids = models.JSONField(default=list)
+    # average_rating of the last of top_book_ids, or None while fewer than TOP_K
+    top_floor = models.DecimalField(max_digits=3, decimal_places=1, null=True)
+
+    class Meta:
+        abstract = True
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class Genre(BookGroup):
+    name = models.CharField(max_length=100, unique=True)
+
+
+class Author(BookGroup):
+    name = models.CharField(max_length=255, unique=True)
+
+
+class StaleGroup(models.Model):
+    """
+    A Genre or Author whose statistics lag its books' ratings until
+    group_stats.refresh_stale() recomputes it.
+    """
+    # The Book column the group comes from: 'genre' or 'author'
+    kind = models.CharField(max_length=6)
+    group_id = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'group_id'], name='stalegroup_kind_group_uniq'),
+        ]
+
 
 class Book(models.Model):
     title = models.CharField(max_length=255)
@@ -11,10 +60,60 @@ class Book(models.Model):
     page_count = models.PositiveIntegerField()
     average_rating = models.DecimalField(max_digits=3, decimal_places=1, default=0.0)
     total_ratings = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveBigIntegerField(default=0)
     about = models.TextField(default='')
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped by every note write (see signals.py), so the notes endpoint's
+    # validators read this row instead of the notes
+    notes_version = models.PositiveIntegerField(default=0)
+    notes_updated_at = models.DateTimeField(null=True)
+    # Set from genre and author on save; group_stats.rebuild() links bulk writes
+    genre_ref = models.ForeignKey(Genre, null=True, on_delete=models.SET_NULL, related_name='books', db_index=False)
+    author_ref = models.ForeignKey(Author, null=True, on_delete=models.SET_NULL, related_name='books', db_index=False)
+
+    class Meta:
+        # One per getBooks sort, each ending in id for the keyset tie-breaker
+        indexes = [
+            models.Index(Lower('title'), 'id', name='book_title_ci_idx'),
+            models.Index(Lower('author'), 'id', name='book_author_ci_idx'),
+            models.Index(fields=['publication_date', 'id'], name='book_pubdate_idx'),
+            models.Index(fields=['average_rating', 'id'], name='book_rating_idx'),
+            # Incremental exports: since= filters and orders on it
+            models.Index(fields=['updated_at', 'id'], name='book_updated_idx'),
+            # A group's books in top-K order; also serve as the foreign key indexes
+            models.Index(
+                'genre_ref', F('average_rating').desc(), F('total_ratings').desc(), 'id', name='book_genre_rank_idx'
+            ),
+            models.Index(
+                'author_ref', F('average_rating').desc(), F('total_ratings').desc(), 'id', name='book_author_rank_idx'
+            ),
+        ]
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # pre_save relinks a book whose genre or author changes, so the
+        # links must be written along with them
+        if update_fields is not None and {'genre', 'author'} & set(update_fields):
+            update_fields = {*update_fields, 'genre_ref', 'author_ref'}
+        super().save(*args, update_fields=update_fields, **kwargs)
 
     def __str__(self):
         return self.title
+
+
+class BookSearchIndex(models.Model):
+    """
+    Read-only view of the FTS5 index over Book (see base.search). The table
+    and the triggers that fill it are created by migration, not by Django.
+    """
+    book = models.OneToOneField(
+        Book, primary_key=True, db_column='rowid',
+        on_delete=models.DO_NOTHING, related_name='search_index'
+    )
+    document = SearchDocumentField(db_column='base_book_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'base_book_fts'
     
 class BookNote(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -28,6 +127,10 @@ class BookNote(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Ascending so a backward scan serves (-created_at, -id), the notes page order
+            models.Index(fields=['book', 'created_at', 'id'], name='booknote_book_created_idx'),
+        ]
 
 class BookRating(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='ratings')
@@ -48,6 +151,26 @@ class ReadingList(models.Model):
 
     class Meta:
         unique_together = ('user', 'book')
+        indexes = [
+            models.Index(fields=['user', 'added_at'], name='readinglist_user_added_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}'s reading list - {self.book.title}"
+
+class BookSimilarity(models.Model):
+    """A book's nearest neighbours by rating similarity, written by build_similarities."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+', db_index=False)
+    # Indexed so deleting a book does not scan the table for its appearances
+    neighbor = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbor_of')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index that serves a book's neighbours in rank order
+            models.UniqueConstraint(fields=['book', 'rank'], name='booksimilarity_book_rank_uniq'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username}'s reading list - {self.book.title}"
\ No newline at end of file
+        return f"{self.neighbor_id} is #{self.rank} for {self.book_id}"
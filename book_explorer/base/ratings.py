@@ -0,0 +1,69 @@
+"""
+Book rating aggregates.
+
+Each Book stores the exact `rating_sum` and `total_ratings` of its
+BookRatings; `average_rating` is always derived from those two in the same
+UPDATE, so rounding never accumulates and concurrent raters never overwrite
+each other's work with a stale read.
+"""
+from django.db.models import Case, Count, DecimalField, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Now, Round
+from django.db.models.lookups import GreaterThan
+
+from .models import BookRating
+
+
+def average_expression(rating_sum, total_ratings):
+    return Case(
+        When(
+            GreaterThan(total_ratings, 0),
+            then=Round(Cast(rating_sum, FloatField()) / total_ratings, 1),
+        ),
+        default=Value(0),
+        output_field=DecimalField(max_digits=3, decimal_places=1),
+    )
+
+
+def aggregate_delta(sum_delta, count_delta):
+    """
+    Keyword arguments for QuerySet.update() that shift a book's aggregates by
+    the given amounts entirely inside the database.
+    """
+    rating_sum = F('rating_sum') + sum_delta
+    total_ratings = F('total_ratings') + count_delta
+    return {
+        'rating_sum': rating_sum,
+        'total_ratings': total_ratings,
+        'average_rating': average_expression(rating_sum, total_ratings),
+        # update() skips auto_now, and conditional GETs rely on this
+        'updated_at': Now(),
+    }
+
+
+def rebuild_aggregates(book_model, rating_model, book_ids=None):
+    """
+    Recompute the aggregates of every book, or of just `book_ids`, from its
+    ratings in one UPDATE driven by per-book grouped subqueries. Returns the
+    number of books updated.
+    """
+    per_book = rating_model.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    rating_sum = Coalesce(Subquery(per_book.annotate(s=Sum('rating')).values('s')), 0)
+    total_ratings = Coalesce(Subquery(per_book.annotate(c=Count('id')).values('c')), 0)
+    books = book_model.objects.all() if book_ids is None else book_model.objects.filter(id__in=book_ids)
+    return books.update(
+        rating_sum=rating_sum,
+        total_ratings=total_ratings,
+        average_rating=average_expression(rating_sum, total_ratings),
+        updated_at=Now(),
+    )
+
+
+def annotate_user_rating(queryset, user):
+    """
+    Annotate `current_user_rating` on a Book queryset with `user`'s rating of
+    each book (None when unrated), so serializers never query per row.
+    """
+    if not user.is_authenticated:
+        return queryset
+    user_rating = BookRating.objects.filter(book=OuterRef('pk'), user=user).values('rating')[:1]
+    return queryset.annotate(current_user_rating=Subquery(user_rating))
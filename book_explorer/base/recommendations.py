@@ -0,0 +1,169 @@
+"""
+Personalised "for you" recommendations.
+
+The model that `manage.py train_recommendations` writes (see als.py) is a
+directory per version under settings.RECOMMENDATIONS['MODEL_DIR'], holding
+book_ids.npy, book_bias.npy, book_factors.npy and meta.json, with a CURRENT
+file naming the live one. Workers open the arrays with mmap_mode='r', so
+every process on a host reads the same page-cache copy instead of loading
+its own; a worker notices a new CURRENT on its next request and switches.
+
+Scoring a user re-solves their vector against the factors of the books
+they have rated, one small least-squares problem, then scores every book
+as its bias plus the dot product, leaves out what they rated or saved and
+keeps the best MAX_RESULTS. Users who have rated nothing the model knows
+get the books with the highest bias; without a model, the best rated.
+
+Results are cached per user under the model version and a per-user
+version bumped whenever the user rates or saves a book.
+"""
+import json
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from . import cache as catalog_cache
+from .models import Book, BookRating, ReadingList
+
+MAX_RESULTS = 100
+
+_settings = getattr(settings, 'RECOMMENDATIONS', {})
+
+
+def model_dir():
+    return Path(_settings.get('MODEL_DIR', settings.BASE_DIR / 'var' / 'recommendations'))
+
+
+def solve_user(factors, residuals, regularization):
+    """
+    The vector that best predicts `residuals` from the rows of `factors`,
+    with ridge regularisation scaled by how many there are (ALS-WR).
+    """
+    k = factors.shape[1]
+    gram = factors.T @ factors + regularization * len(residuals) * np.eye(k, dtype=np.float32)
+    return np.linalg.solve(gram, factors.T @ residuals)
+
+
+@dataclass
+class Model:
+    version: str
+    book_ids: np.ndarray
+    bias: np.ndarray
+    factors: np.ndarray
+    mean: float
+    regularization: float
+
+    def positions(self, book_ids):
+        """Indices of the given books in the model, and which of them it has."""
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        positions = np.searchsorted(self.book_ids, book_ids).clip(max=max(len(self.book_ids) - 1, 0))
+        known = self.book_ids[positions] == book_ids if len(self.book_ids) else np.zeros(len(book_ids), bool)
+        return positions, known
+
+
+def write_model(book_ids, bias, factors, mean, regularization, keep=3):
+    """Save a new version, make it current, and prune all but the `keep` newest."""
+    root = model_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    staging = root / f'.{version}'
+    staging.mkdir()
+    np.save(staging / 'book_ids.npy', np.asarray(book_ids, dtype=np.int64))
+    np.save(staging / 'book_bias.npy', np.asarray(bias, dtype=np.float32))
+    np.save(staging / 'book_factors.npy', np.ascontiguousarray(factors, dtype=np.float32))
+    (staging / 'meta.json').write_text(json.dumps({
+        'version': version,
+        'mean': mean,
+        'regularization': regularization,
+        'factors': int(factors.shape[1]),
+    }))
+    # Renames, so a worker never sees a half-written version or pointer
+    os.rename(staging, root / version)
+    (root / 'CURRENT.tmp').write_text(version)
+    os.replace(root / 'CURRENT.tmp', root / 'CURRENT')
+
+    # Workers still mapping an older version keep reading it after the unlink
+    versions = sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    for old in versions[:-keep]:
+        shutil.rmtree(root / old, ignore_errors=True)
+    return version
+
+
+def load_model(version):
+    path = model_dir() / version
+    meta = json.loads((path / 'meta.json').read_text())
+    return Model(
+        version=version,
+        book_ids=np.load(path / 'book_ids.npy', mmap_mode='r'),
+        bias=np.load(path / 'book_bias.npy', mmap_mode='r'),
+        factors=np.load(path / 'book_factors.npy', mmap_mode='r'),
+        mean=meta['mean'],
+        regularization=meta['regularization'],
+    )
+
+
+_lock = threading.Lock()
+_loaded = {'stamp': None, 'model': None}
+
+
+def current_model():
+    """The live model, reopened only when CURRENT changes; None before the first training."""
+    pointer = model_dir() / 'CURRENT'
+    try:
+        stat = pointer.stat()
+    except FileNotFoundError:
+        return None
+    stamp = (stat.st_mtime_ns, stat.st_ino)
+    with _lock:
+        if _loaded['stamp'] != stamp:
+            _loaded['model'] = load_model(pointer.read_text().strip())
+            _loaded['stamp'] = stamp
+        return _loaded['model']
+
+
+def _score(model, rated, excluded):
+    """[(book_id, score)] best first, from the model."""
+    scores = np.array(model.bias, dtype=np.float32)
+    positions, known = model.positions([book_id for book_id, _ in rated])
+    if known.any():
+        positions = positions[known]
+        values = np.array([rating for _, rating in rated], dtype=np.float32)[known]
+        factors = np.asarray(model.factors[positions])
+        user = solve_user(factors, values - model.mean - scores[positions], model.regularization)
+        scores += np.asarray(model.factors) @ user.astype(np.float32)
+
+    positions, known = model.positions(list(excluded))
+    scores[positions[known]] = -np.inf
+    count = min(MAX_RESULTS, int(np.isfinite(scores).sum()))
+    if count == 0:
+        return []
+    best = np.argpartition(-scores, count - 1)[:count]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return [(int(model.book_ids[i]), float(scores[i])) for i in best]
+
+
+def _best_rated(excluded):
+    books = Book.objects.exclude(id__in=excluded).order_by('-average_rating', '-id')
+    return [(book_id, None) for book_id in books.values_list('id', flat=True)[:MAX_RESULTS]]
+
+
+def recommend(user):
+    """Up to MAX_RESULTS (book_id, score) pairs for `user`, best first; score is None without a model."""
+    model = current_model()
+    versions = catalog_cache.recommendation_versions(user.id)
+    key = ':'.join(str(part) for part in ('recommendations', model.version if model else '-', *versions, user.id))
+    cache = catalog_cache.get_cache()
+    ranked = cache.get(key)
+    if ranked is None:
+        rated = list(BookRating.objects.filter(user=user).values_list('book_id', 'rating'))
+        excluded = {book_id for book_id, _ in rated}
+        excluded.update(ReadingList.objects.filter(user=user).values_list('book_id', flat=True))
+        ranked = _score(model, rated, excluded) if model is not None else _best_rated(excluded)
+        cache.set(key, ranked, timeout=_settings.get('CACHE_TIMEOUT', 3600))
+    return ranked
@@ -0,0 +1,188 @@
+"""
+Full-text search over the book catalog.
+
+On SQLite the searchable Book columns are indexed by an external-content FTS5
+table (base_book_fts). Triggers on base_book keep it in sync for every write
+path, including bulk_create() and QuerySet.update(), so nothing in the
+application has to remember to reindex.
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import connection as default_connection
+from django.db.models import F
+
+from .fields import BM25, Snippet
+
+SEARCH_TABLE = 'base_book_fts'
+SEARCH_COLUMNS = ('title', 'author', 'genre', 'short_description', 'about')
+# bm25() column weights, in SEARCH_COLUMNS order
+SEARCH_WEIGHTS = (10.0, 5.0, 3.0, 1.0, 0.5)
+SNIPPET_COLUMNS = ('short_description', 'about')
+
+TOKEN_RE = re.compile(r'\w+')
+
+_columns = ', '.join(SEARCH_COLUMNS)
+_new_values = ', '.join(f'new.{c}' for c in SEARCH_COLUMNS)
+_old_values = ', '.join(f'old.{c}' for c in SEARCH_COLUMNS)
+
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"{_columns}, content='base_book', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+TRIGGERS = {
+    f'{SEARCH_TABLE}_ai': (
+        f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON base_book BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); "
+        f"END"
+    ),
+    f'{SEARCH_TABLE}_ad': (
+        f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON base_book BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_columns}) "
+        f"VALUES ('delete', old.id, {_old_values}); "
+        f"END"
+    ),
+    f'{SEARCH_TABLE}_au': (
+        f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF {_columns} ON base_book BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_columns}) "
+        f"VALUES ('delete', old.id, {_old_values}); "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); "
+        f"END"
+    ),
+}
+
+
+def is_available(connection=default_connection):
+    return connection.vendor == 'sqlite'
+
+
+def create_index(cursor):
+    cursor.execute(CREATE_TABLE_SQL)
+    for sql in TRIGGERS.values():
+        cursor.execute(sql)
+    rebuild_index(cursor)
+
+
+def drop_index(cursor):
+    for name in TRIGGERS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def rebuild_index(cursor):
+    cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def ensure_triggers(connection=default_connection):
+    """
+    SQLite drops a table's triggers whenever a migration rebuilds base_book,
+    so reinstall them and reindex anything written while they were missing.
+    """
+    if not is_available(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'base_book'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [sql for name, sql in TRIGGERS.items() if name not in existing]
+        for sql in missing:
+            cursor.execute(sql)
+        if missing:
+            rebuild_index(cursor)
+
+
+@contextmanager
+def deferred_sync(connection=default_connection):
+    """
+    Drop the sync triggers for the duration of a bulk load and rebuild the
+    index once at the end, instead of updating it row by row.
+    """
+    if not is_available(connection):
+        yield
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    try:
+        yield
+    finally:
+        ensure_triggers(connection)
+
+
+def build_match_query(text, column=None):
+    """
+    Turn free user input into an FTS5 expression in which every word is a
+    quoted prefix term, so punctuation can never be parsed as FTS syntax.
+    """
+    terms = ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(text or ''))
+    if not terms:
+        return ''
+    if column:
+        return f'{column} : ({terms})'
+    return f'({terms})'
+
+
+def filter_books(queryset, query=None, **column_queries):
+    """
+    Restrict a Book queryset to rows matching `query` across every indexed
+    column and each `column=text` pair against that column alone.
+    """
+    clauses = []
+    for column, text in (('', query), *column_queries.items()):
+        if not text:
+            continue
+        clause = build_match_query(text, column)
+        if not clause:
+            return queryset.none()
+        clauses.append(clause)
+    if not clauses:
+        return queryset
+    return queryset.filter(search_index__document__match=' AND '.join(clauses))
+
+
+def rank_books(queryset):
+    """Annotate `rank` (bm25, lower is better) on a queryset from filter_books()."""
+    return queryset.annotate(rank=BM25(F('search_index__document'), SEARCH_WEIGHTS))
+
+
+def snippets(book_ids, query):
+    """
+    {book_id: highlighted fragment of its description, or None} for the
+    given books, computed for a page only rather than for every match; None
+    when the query has nothing to highlight.
+    """
+    rows = _snippet_rows(book_ids, query)
+    return _collect_snippets(list(rows)) if rows is not None else None
+
+
+async def asnippets(book_ids, query):
+    """snippets() for async views."""
+    rows = _snippet_rows(book_ids, query)
+    return _collect_snippets([row async for row in rows]) if rows is not None else None
+
+
+def _snippet_rows(book_ids, query):
+    from .models import BookSearchIndex
+
+    match = build_match_query(query)
+    if not book_ids or not match:
+        return None
+    return BookSearchIndex.objects.filter(
+        document__match=match,
+        book_id__in=book_ids,
+    ).annotate(**{
+        column: Snippet(F('document'), SEARCH_COLUMNS.index(column))
+        for column in SNIPPET_COLUMNS
+    }).values_list('book_id', *SNIPPET_COLUMNS)
+
+
+def _collect_snippets(rows):
+    snippets = {}
+    for book_id, *fragments in rows:
+        highlighted = [f for f in fragments if f and '<mark>' in f]
+        snippets[book_id] = highlighted[0] if highlighted else None
+    return snippets
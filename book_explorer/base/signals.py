@@ -0,0 +1,65 @@
+from django.db.models import F
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import group_stats
+from .models import Author, Book, BookNote, Genre
+
+
+@receiver([post_save, post_delete], sender=BookNote)
+def bump_notes_version(sender, instance, **kwargs):
+    # A deletion moves Last-Modified forward too, though the newest
+    # remaining note can be older than the one removed
+    Book.objects.filter(id=instance.book_id).update(
+        notes_version=F('notes_version') + 1, notes_updated_at=Now()
+    )
+
+
+# Book fields the Genre and Author rows are computed from
+GROUP_FIELDS = ('genre_ref', 'author_ref', 'rating_sum', 'total_ratings', 'average_rating')
+GROUP_COLUMNS = tuple(Book._meta.get_field(name).attname for name in GROUP_FIELDS)
+
+
+@receiver(pre_save, sender=Book)
+def link_book_groups(sender, instance, update_fields=None, **kwargs):
+    # None unless the save moves the book or changes its ratings; then the
+    # groups it is leaving, so both sides get refreshed
+    instance._previous_groups = None
+    if update_fields is not None and not {'genre', 'author', *GROUP_FIELDS} & set(update_fields):
+        return
+    stored = None
+    if instance.pk is not None:
+        stored = Book.objects.filter(pk=instance.pk).values('genre', 'author', *GROUP_COLUMNS).first()
+    if stored is None:
+        stored = dict.fromkeys(('genre', 'author', *GROUP_COLUMNS))
+
+    if update_fields is None or {'genre', 'author'} & set(update_fields):
+        # Groups are looked up by name only when the name or link changed
+        if (instance.genre, instance.author) != (stored['genre'], stored['author']) or None in (
+            instance.genre_ref_id, instance.author_ref_id
+        ):
+            group_stats.link(instance)
+    saved = GROUP_COLUMNS if update_fields is None else [
+        column for name, column in zip(GROUP_FIELDS, GROUP_COLUMNS) if name in update_fields
+    ]
+    if any(getattr(instance, column) != stored[column] for column in saved):
+        instance._previous_groups = {Genre: {stored['genre_ref_id']}, Author: {stored['author_ref_id']}}
+
+
+@receiver(post_save, sender=Book)
+def refresh_book_groups(sender, instance, **kwargs):
+    groups = getattr(instance, '_previous_groups', None)
+    if groups is None:
+        return
+    groups[Genre].add(instance.genre_ref_id)
+    groups[Author].add(instance.author_ref_id)
+    group_stats.refresh({model: ids - {None} for model, ids in groups.items()})
+
+
+@receiver(post_delete, sender=Book)
+def refresh_groups_on_book_delete(sender, instance, **kwargs):
+    group_stats.refresh({
+        Genre: {instance.genre_ref_id} - {None},
+        Author: {instance.author_ref_id} - {None},
+    })
@@ -1,10 +1,82 @@
-from django.test import TestCase
-from django.contrib.auth.models import User
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db.models.functions import Lower
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import AnonymousUser, User
 from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import RefreshToken
 from datetime import date
-from base.models import Book, BookNote, BookRating, ReadingList
+from api import async_views, compression, instrumentation, profiling, queries, views
+from api.authentication import CachedJWTAuthentication, UserCache, user_cache
+from api.caching import stats as cache_stats
+from api.pagination import KeysetPagination
+from api.renderers import FastJSONRenderer
+from api.rows import RowEncoder
+from api.serializers import BOOK_FIELDS, HEAVY_BOOK_FIELDS, BookSerializer, ReadingListSerializer
+from base import benchmark
+from base.hashers import HashingBusy, HashingPool, hashing_pool
+from base import cache as catalog_cache
+from base import als, group_stats, ratings, recommendations, search, similarity
+from base.models import Author, Book, BookNote, BookRating, BookSimilarity, Genre, ReadingList, StaleGroup
+
+
+def book_fields(number, isbn_prefix, **fields):
+    """
+    The fields of test book `number`: an ISBN made of `isbn_prefix` and the
+    number, the defaults below, and `fields`, where a callable is called
+    with the number.
+    """
+    values = {
+        'title': f"Test Book {number}",
+        'author': "Test Author",
+        'publication_date': date(2023, 1, 1),
+        'isbn': f"{isbn_prefix}{number:0{13 - len(isbn_prefix)}d}",
+        'genre': "Fiction",
+        'short_description': "Test description",
+        'page_count': 200,
+    }
+    values.update((name, value(number) if callable(value) else value) for name, value in fields.items())
+    return values
+
+
+def create_books(count, isbn_prefix, **fields):
+    """`count` test books saved one at a time, so model signals run."""
+    return [Book.objects.create(**book_fields(i, isbn_prefix, **fields)) for i in range(count)]
+
+
+def bulk_create_books(count, isbn_prefix, **fields):
+    """`count` test books in one bulk insert, bypassing model signals."""
+    return Book.objects.bulk_create(Book(**book_fields(i, isbn_prefix, **fields)) for i in range(count))
+
+
+def create_book(isbn, **fields):
+    """One test book with the given ISBN; see book_fields()."""
+    return Book.objects.create(**book_fields(0, '', isbn=isbn, **fields))
+
 
 class ModelTests(TestCase):
     def setUp(self):
@@ -96,7 +168,7 @@ class APITests(APITestCase):
     def test_get_books_list(self):
         response = self.client.get('/api/books/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertTrue(len(response.data) > 0)
+        self.assertTrue(len(response.data['results']) > 0)
 
     def test_get_book_detail(self):
         response = self.client.get(f'/api/books/{self.book.id}/')
@@ -118,7 +190,7 @@ class APITests(APITestCase):
         # Test getting notes
         get_response = self.client.get(f'/api/books/{self.book.id}/notes/')
         self.assertEqual(get_response.status_code, status.HTTP_200_OK)
-        self.assertTrue(len(get_response.data) > 0)
+        self.assertTrue(len(get_response.data['results']) > 0)
 
         # Test updating a note
         update_response = self.client.put(
@@ -179,15 +251,1581 @@ class APITests(APITestCase):
     def test_book_filtering(self):
         response = self.client.get('/api/books/', {'title': 'Test'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertTrue(len(response.data) > 0)
+        self.assertTrue(len(response.data['results']) > 0)
 
         response = self.client.get('/api/books/', {'author': 'Test Author'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertTrue(len(response.data) > 0)
+        self.assertTrue(len(response.data['results']) > 0)
 
     def tearDown(self):
         # Clean up after each test
         Book.objects.all().delete()
         BookRating.objects.all().delete()
         BookNote.objects.all().delete()
-        User.objects.all().delete()
\ No newline at end of file
+        User.objects.all().delete()
+
+class BookPaginationTests(APITestCase):
+    def setUp(self):
+        Book.objects.all().delete()
+        # Duplicate sort values so the id tie-breaker is exercised
+        create_books(
+            7, '',
+            title=lambda i: f"Book {i % 3}" if i % 2 else f"book {i % 3}",
+            author=lambda i: f"Author {i % 2}",
+            publication_date=lambda i: date(2000 + i % 4, 1, 1),
+            page_count=lambda i: 100 + i,
+            average_rating=lambda i: i % 3,
+        )
+
+    def walk(self, params, start='/api/books/'):
+        ids = []
+        response = self.client.get(start, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(book['id'] for book in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_catalog_for_every_sort(self):
+        for sort in ('title', 'author', 'publication_date', 'average_rating'):
+            for order in ('asc', 'desc'):
+                ids, _ = self.walk({'sort': sort, 'order': order, 'page_size': 2})
+                prefix = '-' if order == 'desc' else ''
+                expected = list(
+                    Book.objects.annotate(title_ci=Lower('title'), author_ci=Lower('author'))
+                    .order_by(f'{prefix}{sort}_ci' if sort in ('title', 'author') else f'{prefix}{sort}', f'{prefix}id')
+                    .values_list('id', flat=True)
+                )
+                self.assertEqual(ids, expected, f'{sort} {order}')
+
+    def test_previous_link_returns_prior_page(self):
+        first = self.client.get('/api/books/', {'page_size': 3})
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [b['id'] for b in back.data['results']],
+            [b['id'] for b in first.data['results']],
+        )
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetPagination, 'max_page_size', 5):
+            response = self.client.get('/api/books/', {'page_size': 10000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor_and_sort(self):
+        response = self.client.get('/api/books/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        for payload in ({'v': None, 'id': 1, 'r': 1}, {'v': 'a', 'id': '1', 'r': 0}, {'v': 'a', 'id': 1, 'r': 2}, [1]):
+            with self.subTest(payload=payload):
+                cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+                response = self.client.get('/api/books/', {'sort': 'title', 'cursor': cursor})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get('/api/books/', {'sort': 'isbn'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BookSearchTests(APITestCase):
+    def setUp(self):
+        Book.objects.all().delete()
+        self.hobbit = Book.objects.create(
+            title="The Hobbit",
+            author="J.R.R. Tolkien",
+            publication_date=date(1937, 9, 21),
+            isbn="9780547928227",
+            genre="Fantasy",
+            short_description="A hobbit is swept into a quest for dragon gold.",
+            page_count=310,
+        )
+        self.rings = Book.objects.create(
+            title="The Lord of the Rings",
+            author="J.R.R. Tolkien",
+            publication_date=date(1954, 7, 29),
+            isbn="9780618640157",
+            genre="Fantasy",
+            short_description="The quest to destroy the One Ring.",
+            page_count=1178,
+            about="Frodo the hobbit carries the Ring to Mordor.",
+        )
+        self.orwell = Book.objects.create(
+            title="1984",
+            author="George Orwell",
+            publication_date=date(1949, 6, 8),
+            isbn="9780451524935",
+            genre="Dystopian",
+            short_description="Big Brother is watching.",
+            page_count=328,
+        )
+
+    def search(self, **params):
+        response = self.client.get('/api/books/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+
+    def test_prefix_match_ranks_title_hits_first(self):
+        results = self.search(q='hobb')
+        self.assertEqual([b['id'] for b in results], [self.hobbit.id, self.rings.id])
+
+    def test_column_filters_use_index(self):
+        results = self.search(author='tolk', title='lord')
+        self.assertEqual([b['id'] for b in results], [self.rings.id])
+        self.assertEqual(self.search(title='!!!'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        Book.objects.filter(id=self.orwell.id).update(title="Nineteen Eighty-Four")
+        self.assertEqual([b['id'] for b in self.search(q='nineteen')], [self.orwell.id])
+        self.orwell.delete()
+        self.assertEqual(self.search(q='nineteen'), [])
+
+    def test_highlighted_snippets(self):
+        results = self.search(q='mordor', highlight='1')
+        self.assertEqual(len(results), 1)
+        self.assertIn('<mark>Mordor</mark>', results[0]['snippet'])
+        self.assertNotIn('snippet', self.search(q='mordor')[0])
+
+    def test_ranked_results_paginate(self):
+        first = self.client.get('/api/books/', {'q': 'hobbit', 'page_size': 1})
+        second = self.client.get(first.data['next'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [first.data['results'][0]['id'], second.data['results'][0]['id']],
+            [self.hobbit.id, self.rings.id],
+        )
+        self.assertIsNone(second.data['next'])
+
+
+class RatingAggregateTests(APITestCase):
+    def setUp(self):
+        Book.objects.all().delete()
+        self.users = [
+            User.objects.create_user(username=f'rater{i}', password='testpass123')
+            for i in range(3)
+        ]
+        self.book = create_book("1234567890123", title="Test Book")
+
+    def rate(self, user, rating):
+        self.client.force_authenticate(user=user)
+        return self.client.post(f'/api/books/{self.book.id}/rate/', {'rating': rating})
+
+    def test_aggregates_are_exact(self):
+        for user, rating in zip(self.users, (7, 8, 8)):
+            self.assertEqual(self.rate(user, rating).status_code, status.HTTP_201_CREATED)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_sum, self.book.total_ratings), (23, 3))
+        self.assertEqual(self.book.average_rating, Decimal('7.7'))
+
+        # Changing a rating only moves the sum
+        self.assertEqual(self.rate(self.users[0], 10).status_code, status.HTTP_200_OK)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_sum, self.book.total_ratings), (26, 3))
+        self.assertEqual(self.book.average_rating, Decimal('8.7'))
+
+    def test_missing_book_and_rating(self):
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.post('/api/books/999999/rate/', {'rating': 5})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(f'/api/books/{self.book.id}/rate/', {})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command(self):
+        for user, rating in zip(self.users, (3, 4, 4)):
+            BookRating.objects.create(book=self.book, user=user, rating=rating)
+        out = StringIO()
+        call_command('rebuild_rating_aggregates', stdout=out)
+        self.assertIn('1 books', out.getvalue())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_sum, self.book.total_ratings), (11, 3))
+        self.assertEqual(self.book.average_rating, Decimal('3.7'))
+
+
+class UserRatingQueryTests(APITestCase):
+    def setUp(self):
+        Book.objects.all().delete()
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.books = create_books(5, '', title=lambda i: f"Book {i}")
+        for book in self.books:
+            ReadingList.objects.create(user=self.user, book=book)
+        BookRating.objects.create(user=self.user, book=self.books[0], rating=9)
+        self.client.force_authenticate(user=self.user)
+
+    def test_reading_list_query_count_is_constant(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/reading-list/')
+        ratings = {item['book']['id']: item['book']['user_rating'] for item in response.data}
+        self.assertEqual(ratings[self.books[0].id], 9)
+        self.assertIsNone(ratings[self.books[1].id])
+
+    def test_book_list_query_count_is_constant(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/books/', {'sort': 'author'})
+        ratings = {book['id']: book['user_rating'] for book in response.data['results']}
+        self.assertEqual(ratings[self.books[0].id], 9)
+        self.assertIsNone(ratings[self.books[1].id])
+
+
+class BenchmarkTests(TestCase):
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(
+            sorted(name for name in benchmark.api_route_names() if name not in benchmark.SCENARIOS), []
+        )
+
+    def test_seed_and_run(self):
+        # Migrations seed books, which must not pass for a seeded catalog
+        self.assertTrue(Book.objects.exists())
+        self.assertFalse(benchmark.seeded())
+        benchmark.seed(books=30, users=5, ratings=40, notes=10)
+        self.assertTrue(benchmark.seeded())
+        self.assertEqual(BookRating.objects.filter(user__username__startswith='bench').count(), 40)
+
+        results = benchmark.run(iterations=2, warmup=0, routes=['get-books', 'get-reading-list'])
+        self.assertEqual(set(results), {'get-books', 'get-reading-list'})
+        self.assertEqual(results['get-books']['status'], [200])
+        self.assertEqual(results['get-books']['queries'], 1)
+
+        regressed = dict(results, **{'get-books': dict(results['get-books'], queries=5)})
+        self.assertEqual(len(benchmark.compare(regressed, {'routes': results})), 1)
+
+    def test_auth_cache_saves_the_user_query(self):
+        benchmark.seed(books=30, users=5, ratings=40, notes=10)
+        results = benchmark.run_auth_cache(iterations=2, warmup=1, routes=['get-books', 'get-reading-list'])
+        # get-books is not authenticated
+        self.assertEqual(set(results), {'get-reading-list'})
+        uncached, cached = results['get-reading-list']['uncached'], results['get-reading-list']['cached']
+        self.assertEqual((uncached['status'], cached['status']), ([200], [200]))
+        self.assertEqual(cached['queries'], uncached['queries'] - 1)
+        # The views are back on the configured class
+        self.assertEqual(views.get_reading_list.cls.authentication_classes, APIView.authentication_classes)
+
+    def test_serialization_paths_agree(self):
+        results = benchmark.run_serialization(sizes=(50,), repeat=1)
+        self.assertTrue(results[50]['identical'])
+
+    def test_concurrency_compares_both_stacks(self):
+        benchmark.seed(books=30, users=5, ratings=40, notes=10)
+        results = benchmark.run_concurrency(concurrency=4, requests=8)
+        self.assertEqual(set(results), set(benchmark.ASYNC_READ_VIEWS))
+        for stacks in results.values():
+            self.assertEqual({stack: m['status'] for stack, m in stacks.items()}, {'sync': [200], 'async': [200]})
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        Book.objects.all().delete()
+        catalog_cache.get_cache().clear()
+        cache_stats.reset()
+        self.user = User.objects.create_user(username='cacher', password='testpass123')
+        self.book = create_book("1234567890123", title="Cached Book")
+
+    def test_repeat_reads_are_served_from_cache(self):
+        first = self.client.get('/api/books/', {'sort': 'title', 'author': ''})
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/books/', {'sort': 'title'})
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['Content-Type'], second['Content-Type'])
+        self.assertEqual(cache_stats.snapshot()['views']['getBooks'], {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_writes_invalidate_affected_entries(self):
+        self.client.get(f'/api/books/{self.book.id}/')
+        self.client.get(f'/api/books/{self.book.id}/notes/')
+        self.client.get('/api/books/')
+
+        BookNote.objects.create(user=self.user, book=self.book, content="New note")
+        # Only the ETag lookup; the body still comes from the cache
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/books/{self.book.id}/')
+        self.assertEqual(len(self.client.get(f'/api/books/{self.book.id}/notes/').data['results']), 1)
+
+        BookRating.objects.create(user=self.user, book=self.book, rating=5)
+        Book.objects.filter(id=self.book.id).update(average_rating=5, total_ratings=1)
+        self.assertEqual(self.client.get(f'/api/books/{self.book.id}/').data['total_ratings'], 1)
+        self.assertEqual(self.client.get('/api/books/').data['results'][0]['total_ratings'], 1)
+
+    def test_authenticated_reads_bypass_cache(self):
+        self.client.get(f'/api/books/{self.book.id}/')
+        BookRating.objects.create(user=self.user, book=self.book, rating=7)
+        self.client.get(f'/api/books/{self.book.id}/')
+        self.client.force_authenticate(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer token')
+        response = self.client.get(f'/api/books/{self.book.id}/')
+        self.assertEqual(response.data['user_rating'], 7)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        Book.objects.all().delete()
+        catalog_cache.get_cache().clear()
+        self.user = User.objects.create_user(username='poller', password='testpass123')
+        self.book = create_book("1234567890123", title="Polled Book")
+        self.note = BookNote.objects.create(user=self.user, book=self.book, content="First")
+
+    def test_book_detail_etag(self):
+        url = f'/api/books/{self.book.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        BookRating.objects.create(user=self.user, book=self.book, rating=4)
+        Book.objects.filter(id=self.book.id).update(**ratings.aggregate_delta(4, 1))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_notes_etag_follows_note_changes(self):
+        url = f'/api/books/{self.book.id}/notes/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.note.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+    def test_notes_validators_read_only_the_book_row(self):
+        url = f'/api/books/{self.book.id}/notes/'
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(captured.captured_queries), 1)
+        self.assertNotIn('booknote', captured.captured_queries[0]['sql'])
+
+        self.note.content = "Edited"
+        self.note.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_missing_book_is_not_conditional(self):
+        response = self.client.get('/api/books/999999/notes/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CatalogExportTests(APITestCase):
+    def setUp(self):
+        Book.objects.all().delete()
+        create_books(3, '', title=lambda i: f"Export, \"Book\" {i}")
+
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        response = self.client.get('/api/books/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['isbn'] for row in rows], ['0000000000000', '0000000000001', '0000000000002'])
+        self.assertEqual(rows[0]['publication_date'], '2023-01-01')
+        self.assertNotIn('rating_sum', rows[0])
+
+    def test_csv_export(self):
+        response = self.client.get('/api/books/export/', {'type': 'csv'})
+        rows = list(csv.reader(io.StringIO(self.read(response))))
+        self.assertEqual(rows[0][:3], ['id', 'title', 'author'])
+        self.assertEqual(rows[1][1], 'Export, "Book" 0')
+        self.assertEqual(len(rows), 4)
+
+    def test_incremental_export(self):
+        later = timezone.now() + timezone.timedelta(days=1)
+        Book.objects.filter(isbn='0000000000002').update(updated_at=later)
+        response = self.client.get('/api/books/export/', {'since': later.date().isoformat()})
+        self.assertEqual(len(self.read(response).splitlines()), 1)
+
+        response = self.client.get('/api/books/export/', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/books/export/', {'type': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportBooksTests(TransactionTestCase):
+    def setUp(self):
+        Book.objects.all().delete()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', newline='') as f:
+            f.write(content)
+        return path
+
+    def row(self, isbn, **overrides):
+        row = {
+            'title': f'Imported {isbn}',
+            'author': 'Importer',
+            'publication_date': '2001-02-03',
+            'isbn': isbn,
+            'genre': 'Fiction',
+            'short_description': 'Imported description',
+            'page_count': 123,
+        }
+        row.update(overrides)
+        return row
+
+    def test_csv_upsert_and_rejects(self):
+        Book.objects.create(**dict(self.row('0000000000001'), title='Old title'))
+        rows = [self.row('0000000000001', title='New title'), self.row('0000000000002'), self.row('bad', page_count='x')]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        path = self.write('books.csv', buffer.getvalue())
+        rejects = os.path.join(self.tmp.name, 'rejects.ndjson')
+
+        out = StringIO()
+        call_command('import_books', path, '--batch-size', '1', '--rejects', rejects, stdout=out)
+        self.assertIn('3 rows read, 2 upserted, 1 rejected', out.getvalue())
+        self.assertEqual(Book.objects.get(isbn='0000000000001').title, 'New title')
+        self.assertEqual(Book.objects.count(), 2)
+        with open(rejects) as f:
+            reject = json.loads(f.readline())
+        self.assertEqual(reject['row'], 3)
+        self.assertIn('page_count', reject['errors'])
+
+        # The search index is rebuilt once the load is done
+        self.assertEqual(search.filter_books(Book.objects.all(), 'new title').count(), 1)
+
+    def test_json_and_ndjson(self):
+        array = self.write('books.json', json.dumps([self.row('0000000000003'), self.row('0000000000004')]))
+        lines = self.write('books.ndjson', json.dumps(self.row('0000000000005')) + '\n{not json\n')
+        call_command('import_books', array, lines, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 3)
+        # Bulk upserts skip the Book signals, so the groups are rebuilt afterwards
+        self.assertEqual(Author.objects.get(name='Importer').book_count, 3)
+        self.assertFalse(Book.objects.filter(author_ref__isnull=True).exists())
+
+
+class QueryPlanTests(TestCase):
+    """The hot queries must be answered from the indexes added for them."""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_book_sorts(self):
+        books = Book.objects.all()
+        self.assertUsesIndex(
+            books.annotate(title_ci=Lower('title')).filter(title_ci__gte='m').order_by('title_ci', 'id')[:20],
+            'book_title_ci_idx',
+        )
+        self.assertUsesIndex(
+            books.annotate(author_ci=Lower('author')).order_by('-author_ci', '-id')[:20], 'book_author_ci_idx'
+        )
+        self.assertUsesIndex(books.order_by('publication_date', 'id')[:20], 'book_pubdate_idx')
+        self.assertUsesIndex(
+            books.filter(average_rating__lte=5).order_by('-average_rating', '-id')[:20], 'book_rating_idx'
+        )
+        since = timezone.now() - timezone.timedelta(days=1)
+        self.assertUsesIndex(books.filter(updated_at__gte=since).order_by('updated_at', 'id'), 'book_updated_idx')
+
+    def test_notes_by_book(self):
+        self.assertUsesIndex(
+            BookNote.objects.filter(book_id=1).order_by('-created_at', '-id')[:20], 'booknote_book_created_idx'
+        )
+
+    def test_reading_list_by_user(self):
+        self.assertUsesIndex(ReadingList.objects.filter(user_id=1).order_by('added_at'), 'readinglist_user_added_idx')
+
+
+class BookNotesTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.book = create_book("9990000000001", title="Noted Book")
+        users = [User.objects.create_user(username=f'reader{i}', password='testpass123') for i in range(5)]
+        BookNote.objects.bulk_create(
+            BookNote(user=users[i % 5], book=self.book, content=f"Note {i}") for i in range(25)
+        )
+
+    def test_notes_are_paginated_newest_first(self):
+        url = f'/api/books/{self.book.id}/notes/'
+        seen = []
+        while url:
+            response = self.client.get(url, {'page_size': 10} if not seen else None)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(response.data['results'])
+            url = response.data['next']
+        expected = list(self.book.booknote_set.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual([note['id'] for note in seen], expected)
+        self.assertEqual(seen[0]['username'], seen[0]['user']['username'])
+
+    def test_users_are_not_fetched_per_note(self):
+        # The conditional-GET validator, then the page with its users joined in
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/books/{self.book.id}/notes/', {'page_size': 25})
+        self.assertEqual(len(response.data['results']), 25)
+
+    def test_missing_book(self):
+        response = self.client.get('/api/books/999999/notes/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_book_without_notes(self):
+        BookNote.objects.all().delete()
+        response = self.client.get(f'/api/books/{self.book.id}/notes/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+
+class AsyncReadViewTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.user = User.objects.create_user(username='asyncreader', password='testpass123')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        books = create_books(
+            3, '888', title=lambda i: f"Async Book {i}", publication_date=lambda i: date(2023, 1, 1 + i)
+        )
+        for i, book in enumerate(books):
+            BookNote.objects.create(user=self.user, book=book, content=f"Note {i}")
+        self.book = books[-1]
+        BookRating.objects.create(user=self.user, book=self.book, rating=8)
+        ReadingList.objects.create(user=self.user, book=self.book)
+        self.factory = AsyncRequestFactory()
+
+    def async_get(self, view, url, token=None, headers=None, **kwargs):
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        path, _, query = url.partition('?')
+        request = self.factory.get(path, QUERY_STRING=query, headers=headers)
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_responses_match_sync_views(self):
+        cases = [
+            (async_views.getBooks, '/api/books/?sort=publication_date&order=desc&page_size=2', {}),
+            (async_views.getBookById, f'/api/books/{self.book.id}/', {'pk': self.book.id}),
+            (async_views.get_book_notes, f'/api/books/{self.book.id}/notes/', {'book_id': self.book.id}),
+            (async_views.get_reading_list, '/api/reading-list/', {}),
+        ]
+        for view, url, kwargs in cases:
+            with self.subTest(url=url):
+                catalog_cache.get_cache().clear()
+                self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+                expected = self.client.get(url)
+                response = self.async_get(view, url, token=self.token, **kwargs)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+
+    def test_errors_match_sync_views(self):
+        response = self.async_get(async_views.getBooks, '/api/books/?sort=isbn')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.content, self.client.get('/api/books/?sort=isbn').content)
+
+        response = self.async_get(async_views.getBookById, '/api/books/999999/', pk=999999)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.async_get(async_views.getBooks, '/api/books/?cursor=garbage')
+        self.assertEqual(json.loads(response.content), {'detail': 'Invalid cursor'})
+
+    def test_reading_list_requires_authentication(self):
+        response = self.async_get(async_views.get_reading_list, '/api/reading-list/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+        response = self.async_get(async_views.get_reading_list, '/api/reading-list/', token='not-a-token')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(json.loads(response.content)['code'], 'token_not_valid')
+
+    def test_conditional_get_and_cache(self):
+        url = f'/api/books/{self.book.id}/'
+        first = self.async_get(async_views.getBookById, url, pk=self.book.id)
+        self.assertEqual(first['ETag'], self.client.get(url)['ETag'])
+
+        response = self.async_get(async_views.getBookById, url, headers={'If-None-Match': first['ETag']}, pk=self.book.id)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        cache_stats.reset()
+        self.async_get(async_views.getBooks, '/api/books/')
+        self.async_get(async_views.getBooks, '/api/books/')
+        self.assertEqual(cache_stats.snapshot()['views']['getBooks']['hits'], 1)
+
+
+class CachedAuthenticationTests(TestCase):
+    # Called directly: the API views keep simplejwt's class unless
+    # AUTH_USER_CACHE['ENABLED'] is set
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username='cached', password='testpass123')
+        self.book = create_book("7770000000001", title="Cached Book")
+        self.request = RequestFactory().get(
+            '/api/reading-list/', HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+
+    def authenticate(self):
+        return CachedJWTAuthentication().authenticate(self.request)[0]
+
+    def test_user_row_is_read_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(), self.user)
+
+    def test_password_hash_is_not_cached(self):
+        self.authenticate()
+        values, revoke_claim = user_cache.get(self.user.id)
+        self.assertNotIn(self.user.password, values)
+        self.assertIsNone(revoke_claim)
+
+    def test_deactivation_takes_effect_immediately(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed) as failure:
+            self.authenticate()
+        self.assertEqual(failure.exception.detail['code'], 'user_inactive')
+
+    def test_request_user_is_usable_as_a_model(self):
+        self.authenticate()
+        user = self.authenticate()
+        self.assertEqual(user.username, 'cached')
+        self.assertFalse(user.is_staff)
+        note = BookNote.objects.create(book=self.book, user=user, content='Cached')
+        self.assertEqual(note.user_id, self.user.id)
+
+    def test_lru_and_ttl(self):
+        cache = UserCache(max_entries=2, timeout=60)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+        self.assertEqual((cache.get(1), cache.get(2), cache.get(3)), ('a', None, 'c'))
+
+        cache = UserCache(timeout=0)
+        cache.set(1, 'a')
+        self.assertIsNone(cache.get(1))
+
+
+class PasswordHashingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='hasher', password='testpass123')
+
+    def login(self, password='testpass123'):
+        return self.client.post('/api/auth/login/', {'username': 'hasher', 'password': password}, format='json')
+
+    def test_new_passwords_use_the_preferred_hasher(self):
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+
+    def test_login_upgrades_outdated_hashes(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('testpass123', hasher='pbkdf2_sha256'))
+        self.assertEqual(self.login('wrong').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+    def test_unknown_user(self):
+        response = self.client.post('/api/auth/login/', {'username': 'nobody', 'password': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_saturated_pool_refuses_logins(self):
+        with mock.patch.object(hashing_pool, 'run', side_effect=HashingBusy):
+            response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_pool_bounds_waiting_jobs(self):
+        pool = HashingPool(workers=1, queue=0)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+            return 'done'
+
+        worker = threading.Thread(target=pool.run, args=(block,))
+        worker.start()
+        started.wait(5)
+        with self.assertRaises(HashingBusy):
+            pool.run(lambda: None)
+        release.set()
+        worker.join()
+        self.assertEqual(pool.run(lambda: 'free'), 'free')
+
+
+class RatingBatchTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.user = User.objects.create_user(username='batchrater', password='testpass123')
+        self.other = User.objects.create_user(username='otherrater', password='testpass123')
+        self.books = bulk_create_books(50, '666000000', title=lambda i: f"Batch Book {i}")
+        BookRating.objects.create(user=self.other, book=self.books[0], rating=2)
+        BookRating.objects.create(user=self.user, book=self.books[0], rating=4)
+        ratings.rebuild_aggregates(Book, BookRating)
+        group_stats.rebuild()
+        self.client.force_authenticate(user=self.user)
+
+    def test_upserts_and_recomputes_aggregates(self):
+        payload = [{'book_id': book.id, 'rating': 8} for book in self.books]
+        # Book check, existing ratings, upsert and one aggregate UPDATE, plus the
+        # savepoint; then per group table a totals UPDATE, the ranking and its write
+        with self.assertNumQueries(14):
+            response = self.client.post('/api/ratings/batch/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'created': 49, 'updated': 1})
+
+        first = Book.objects.get(id=self.books[0].id)
+        self.assertEqual((first.rating_sum, first.total_ratings, first.average_rating), (10, 2, Decimal('5.0')))
+        last = Book.objects.get(id=self.books[-1].id)
+        self.assertEqual((last.rating_sum, last.total_ratings, last.average_rating), (8, 1, Decimal('8.0')))
+        self.assertEqual(BookRating.objects.filter(user=self.user).count(), 50)
+
+    def test_last_rating_of_a_book_wins(self):
+        book_id = self.books[1].id
+        response = self.client.post(
+            '/api/ratings/batch/', [{'book_id': book_id, 'rating': 3}, {'book_id': book_id, 'rating': 9}], format='json'
+        )
+        self.assertEqual(response.data, {'created': 1, 'updated': 0})
+        self.assertEqual(BookRating.objects.get(user=self.user, book_id=book_id).rating, 9)
+
+    def test_invalid_items_reject_the_whole_batch(self):
+        payload = [
+            {'book_id': self.books[1].id, 'rating': 5},
+            {'book_id': self.books[2].id, 'rating': 11},
+            {'book_id': 999999, 'rating': 5},
+            {'rating': 5},
+        ]
+        response = self.client.post('/api/ratings/batch/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([e['index'] for e in response.data['errors']], [1, 2, 3])
+        self.assertEqual(BookRating.objects.filter(user=self.user).count(), 1)
+
+        response = self.client.post('/api/ratings/batch/', {'book_id': 1, 'rating': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalidates_cached_books(self):
+        self.client.force_authenticate(user=None)
+        url = f'/api/books/{self.books[3].id}/'
+        self.assertEqual(self.client.get(url).data['total_ratings'], 0)
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/ratings/batch/', [{'book_id': self.books[3].id, 'rating': 6}], format='json')
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(url).data['total_ratings'], 1)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.post('/api/ratings/batch/', [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ReadingListBulkTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulkreader', password='testpass123')
+        self.books = bulk_create_books(30, '555000000', title=lambda i: f"Listed Book {i}")
+        self.ids = [book.id for book in self.books]
+        ReadingList.objects.create(user=self.user, book=self.books[0])
+        self.client.force_authenticate(user=self.user)
+
+    def test_bulk_add(self):
+        # Book check, current membership, one INSERT
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/reading-list/bulk-add/', {'book_ids': self.ids}, format='json')
+        self.assertEqual(response.data, {'added': 29})
+        self.assertEqual(ReadingList.objects.filter(user=self.user).count(), 30)
+
+        response = self.client.post('/api/reading-list/bulk-add/', {'book_ids': self.ids[:3]}, format='json')
+        self.assertEqual(response.data, {'added': 0})
+
+    def test_bulk_add_rejects_unknown_books(self):
+        response = self.client.post('/api/reading-list/bulk-add/', {'book_ids': [self.ids[1], 999999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['book_ids'], [999999])
+        self.assertEqual(ReadingList.objects.filter(user=self.user).count(), 1)
+
+        response = self.client.post('/api/reading-list/bulk-add/', {'book_ids': ['x']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_remove(self):
+        self.client.post('/api/reading-list/bulk-add/', {'book_ids': self.ids[:10]}, format='json')
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/reading-list/bulk-remove/', {'book_ids': self.ids[5:15]}, format='json')
+        self.assertEqual(response.data, {'removed': 5})
+        self.assertEqual(
+            sorted(ReadingList.objects.filter(user=self.user).values_list('book_id', flat=True)), self.ids[:5]
+        )
+
+    def test_bulk_endpoints_reject_bodies_that_are_not_objects(self):
+        for url in ('/api/reading-list/bulk-add/', '/api/reading-list/bulk-remove/'):
+            with self.subTest(url=url):
+                response = self.client.post(url, self.ids[:2], format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(response.data, {'error': 'Expected an object with a book_ids list'})
+
+    def test_membership(self):
+        other = User.objects.create_user(username='otherreader', password='testpass123')
+        ReadingList.objects.create(user=other, book=self.books[1])
+        ReadingList.objects.create(user=self.user, book=self.books[2])
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/reading-list/contains/', {'ids': ','.join(map(str, self.ids))})
+        self.assertEqual(response.data, {'book_ids': [self.ids[0], self.ids[2]]})
+
+        too_many = ','.join(str(i) for i in range(1, 102))
+        response = self.client.get('/api/reading-list/contains/', {'ids': too_many})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_membership_plan_uses_the_unique_index(self):
+        plan = ReadingList.objects.filter(user=self.user, book_id__in=self.ids).values_list('book_id').explain()
+        self.assertIn('USING COVERING INDEX', plan)
+
+
+class GroupStatsTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.user = User.objects.create_user(username='grouprater', password='testpass123')
+        self.books = create_books(
+            4, '777000000',
+            title=lambda i: f"Group Book {i}",
+            author=lambda i: "Group Author" if i < 3 else "Other Group Author",
+            genre="Group Genre",
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_seeded_books_are_backfilled(self):
+        # The migration linked every seeded book and counted it
+        self.assertFalse(Book.objects.exclude(id__in=[b.id for b in self.books]).filter(genre_ref__isnull=True).exists())
+        genre = Book.objects.exclude(id__in=[b.id for b in self.books]).first().genre_ref
+        self.assertEqual(genre.book_count, Book.objects.filter(genre=genre.name).count())
+
+    def test_saving_a_book_links_and_counts_it(self):
+        genre = Genre.objects.get(name="Group Genre")
+        self.assertEqual(genre.book_count, 4)
+        self.assertEqual(Author.objects.get(name="Group Author").book_count, 3)
+        self.assertEqual(self.books[0].genre_ref, genre)
+
+    def test_rating_only_marks_the_groups(self):
+        genre = Genre.objects.get(name="Group Genre")
+        # The book's groups, the savepoint pair, the rating lookup and insert,
+        # the book's aggregates and the marks; no Genre or Author row
+        with self.assertNumQueries(7):
+            self.client.post(f'/api/books/{self.books[2].id}/rate/', {'rating': 9}, format='json')
+        self.client.post(f'/api/books/{self.books[1].id}/rate/', {'rating': 5}, format='json')
+        self.assertEqual(Genre.objects.get(id=genre.id).total_ratings, 0)
+        # One mark per group however often it is rated
+        self.assertEqual(StaleGroup.objects.count(), 2)
+
+        out = StringIO()
+        call_command('refresh_group_stats', stdout=out)
+        self.assertIn('Refreshed 2 genres and authors', out.getvalue())
+        self.assertFalse(StaleGroup.objects.exists())
+        self.assertEqual(Genre.objects.get(id=genre.id).total_ratings, 2)
+        self.assertEqual(group_stats.refresh_stale(), 0)
+
+    def test_rating_updates_totals_and_top_books(self):
+        self.client.post(f'/api/books/{self.books[2].id}/rate/', {'rating': 9}, format='json')
+        self.client.post(f'/api/books/{self.books[1].id}/rate/', {'rating': 5}, format='json')
+        group_stats.refresh_stale()
+        genre = Genre.objects.get(name="Group Genre")
+        self.assertEqual((genre.rating_sum, genre.total_ratings, genre.average_rating), (14, 2, Decimal('7.0')))
+        self.assertEqual(genre.top_book_ids[:2], [self.books[2].id, self.books[1].id])
+
+        # Changing a rating shifts the totals without adding a rating
+        self.client.post(f'/api/books/{self.books[2].id}/rate/', {'rating': 1}, format='json')
+        group_stats.refresh_stale()
+        genre.refresh_from_db()
+        self.assertEqual((genre.rating_sum, genre.total_ratings), (6, 2))
+        self.assertEqual(genre.top_book_ids[0], self.books[1].id)
+
+    def test_incremental_updates_match_a_rebuild(self):
+        for i, book in enumerate(self.books):
+            self.client.post(f'/api/books/{book.id}/rate/', {'rating': i + 3}, format='json')
+        self.client.post('/api/ratings/batch/', [{'book_id': self.books[0].id, 'rating': 10}], format='json')
+        group_stats.refresh_stale()
+        columns = ('book_count', 'rating_sum', 'total_ratings', 'average_rating', 'top_book_ids', 'top_floor')
+        before = list(Author.objects.values_list(*columns)) + list(Genre.objects.values_list(*columns))
+        group_stats.rebuild()
+        after = list(Author.objects.values_list(*columns)) + list(Genre.objects.values_list(*columns))
+        self.assertEqual(before, after)
+
+    def test_changing_author_moves_the_book(self):
+        book = self.books[0]
+        BookRating.objects.create(user=self.user, book=book, rating=6)
+        ratings.rebuild_aggregates(Book, BookRating, book_ids=[book.id])
+        book.refresh_from_db()
+        book.author = "Other Group Author"
+        book.save()
+        old, new = Author.objects.get(name="Group Author"), Author.objects.get(name="Other Group Author")
+        self.assertEqual((old.book_count, old.total_ratings), (2, 0))
+        self.assertEqual((new.book_count, new.total_ratings, new.rating_sum), (2, 1, 6))
+        self.assertEqual(new.top_book_ids[0], book.id)
+
+    def test_saves_that_leave_the_groups_alone_skip_the_refresh(self):
+        book = Book.objects.get(id=self.books[0].id)
+        book.title = "Renamed Group Book"
+        with mock.patch.object(group_stats, 'refresh') as refresh, mock.patch.object(group_stats, 'link') as link:
+            book.save()
+            book.save(update_fields=['page_count'])
+        refresh.assert_not_called()
+        link.assert_not_called()
+
+        book.total_ratings, book.rating_sum, book.average_rating = 1, 8, Decimal('8.0')
+        book.save()
+        genre = Genre.objects.get(name="Group Genre")
+        self.assertEqual((genre.total_ratings, genre.top_book_ids[0]), (1, book.id))
+
+    def test_update_fields_saves_the_new_group_link(self):
+        book = self.books[3]
+        book.genre = "Moved Group Genre"
+        book.save(update_fields=['genre'])
+        book.refresh_from_db()
+        self.assertEqual(book.genre_ref.name, "Moved Group Genre")
+        self.assertEqual(book.genre_ref.book_count, 1)
+        self.assertEqual(Genre.objects.get(name="Group Genre").book_count, 3)
+
+    def test_deleting_a_book_uncounts_it(self):
+        self.books[3].delete()
+        self.assertEqual(Author.objects.get(name="Other Group Author").book_count, 0)
+        self.assertEqual(Genre.objects.get(name="Group Genre").book_count, 3)
+
+    def test_top_books_are_capped(self):
+        genre = Genre.objects.get(name="Group Genre")
+        bulk_create_books(
+            group_stats.TOP_K + 2, '777100000', author="Group Author", genre="Group Genre",
+            average_rating=Decimal('5.0'), total_ratings=1, rating_sum=5,
+        )
+        group_stats.rebuild()
+        genre.refresh_from_db()
+        self.assertEqual(len(genre.top_book_ids), group_stats.TOP_K)
+        self.assertEqual(genre.top_floor, Decimal('5.0'))
+
+    def test_list_endpoints(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get('/api/genres/', {'name': 'group genre'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['book_count'], 4)
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'id', 'name', 'book_count', 'total_ratings', 'average_rating', 'top_book_ids'},
+        )
+
+        response = self.client.get('/api/authors/', {'name': 'group author', 'sort': 'book_count', 'order': 'desc'})
+        self.assertEqual([a['name'] for a in response.data['results']], ["Group Author", "Other Group Author"])
+
+        response = self.client.get('/api/authors/', {'sort': 'bogus'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_is_refreshed_after_a_rating(self):
+        self.client.force_authenticate(user=None)
+        first = self.client.get('/api/genres/', {'name': 'group genre'}).json()
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/api/books/{self.books[0].id}/rate/', {'rating': 7}, format='json')
+        call_command('refresh_group_stats', stdout=StringIO())
+        self.client.force_authenticate(user=None)
+        second = self.client.get('/api/genres/', {'name': 'group genre'}).json()
+        self.assertEqual(first['results'][0]['total_ratings'], 0)
+        self.assertEqual(second['results'][0]['total_ratings'], 1)
+
+
+class FacetTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.books = create_books(
+            4, '888000000',
+            title=lambda i: f"Facet Book {i}",
+            author="Facet Author",
+            publication_date=lambda i: date(1988 + i * 4, 6, 1),
+            genre=lambda i: "Facet Genre" if i < 3 else "Other Facet Genre",
+            page_count=lambda i: 150 + i * 100,
+        )
+        Book.objects.filter(id=self.books[0].id).update(rating_sum=19, total_ratings=2, average_rating=Decimal('9.5'))
+        Book.objects.filter(id=self.books[1].id).update(rating_sum=4, total_ratings=1, average_rating=Decimal('4.0'))
+
+    def test_counts_every_facet_in_the_envelope(self):
+        response = self.client.get('/api/books/', {
+            'author': 'facet author', 'page_size': 1, 'facets': 'genre,decade,pages,rating',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['facets'], {
+            'genre': [{'value': 'Facet Genre', 'count': 3}, {'value': 'Other Facet Genre', 'count': 1}],
+            'decade': [{'value': 1980, 'count': 1}, {'value': 1990, 'count': 2}, {'value': 2000, 'count': 1}],
+            'pages': [
+                {'value': '100-199', 'count': 1}, {'value': '200-299', 'count': 1},
+                {'value': '300-399', 'count': 1}, {'value': '400-499', 'count': 1},
+            ],
+            'rating': [{'value': None, 'count': 2}, {'value': 4, 'count': 1}, {'value': 9, 'count': 1}],
+        })
+
+    def test_one_aggregate_query_and_cached_across_pages(self):
+        # Signed in, so only the facet counts can come from the cache
+        self.client.force_authenticate(user=User.objects.create_user(username='faceter', password='testpass123'))
+        params = {'genre': 'other facet', 'facets': 'decade,pages'}
+        # The page, the date range, then every bucket of both facets in one aggregate
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/books/', params)
+        self.assertEqual(response.data['facets']['pages'], [{'value': '400-499', 'count': 1}])
+        # Another order or page reuses the counts
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/books/', dict(params, order='desc', page_size=1))
+        self.assertEqual(response.data['facets']['decade'], [{'value': 2000, 'count': 1}])
+
+    def test_ratings_only_recount_the_rating_facet(self):
+        user = User.objects.create_user(username='facet rater', password='testpass123')
+        self.client.force_authenticate(user=user)
+        params = {'author': 'facet author', 'facets': 'genre,pages,rating'}
+        self.client.get('/api/books/', params)
+        self.client.post(f'/api/books/{self.books[3].id}/rate/', {'rating': 7}, format='json')
+        # The page and the rating buckets; genre and page counts stay cached
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/books/', params)
+        self.assertIn({'value': 7, 'count': 1}, response.data['facets']['rating'])
+        self.assertEqual(response.data['facets']['genre'][0], {'value': 'Facet Genre', 'count': 3})
+
+        Book.objects.get(id=self.books[3].id).save()
+        with self.assertNumQueries(3):
+            self.client.get('/api/books/', params)
+
+    def test_counts_follow_writes(self):
+        params = {'author': 'facet author', 'facets': 'rating'}
+        self.client.get('/api/books/', params)
+        self.books[2].delete()
+        response = self.client.get('/api/books/', params)
+        self.assertEqual(response.data['facets']['rating'][0], {'value': None, 'count': 1})
+
+    def test_omitted_unless_requested(self):
+        response = self.client.get('/api/books/')
+        self.assertNotIn('facets', response.data)
+        response = self.client.get('/api/books/', {'facets': 'genre,colour'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_async_view_matches(self):
+        request = AsyncRequestFactory().get('/api/books/', {'author': 'facet author', 'facets': 'genre,decade'})
+        response = async_to_sync(async_views.getBooks)(request)
+        sync = self.client.get('/api/books/', {'author': 'facet author', 'facets': 'genre,decade'})
+        self.assertEqual(json.loads(response.content)['facets'], sync.json()['facets'])
+
+
+class SimilarityTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        BookRating.objects.all().delete()
+        self.books = bulk_create_books(4, '999000000', title=lambda i: f"Similar Book {i}")
+        self.users = [User.objects.create_user(username=f'similar{i}', password='testpass123') for i in range(3)]
+        # Books 0 and 1 are rated alike by everyone; book 2 only by one reader; book 3 by nobody
+        for user, (a, b, c) in zip(self.users, [(9, 9, 2), (8, 8, None), (3, 2, None)]):
+            for book, rating in zip(self.books, (a, b, c)):
+                if rating is not None:
+                    BookRating.objects.create(user=user, book=book, rating=rating)
+
+    def test_builds_ranked_neighbours(self):
+        out = StringIO()
+        call_command('build_similarities', '--k', '1', '--chunk-size', '1', stdout=out)
+        self.assertIn('Stored 3 neighbours for 3 books from 7 ratings', out.getvalue())
+        first, second, third = self.books[:3]
+        rows = {row.book_id: row for row in BookSimilarity.objects.all()}
+        self.assertEqual(rows[first.id].neighbor_id, second.id)
+        self.assertEqual(rows[second.id].neighbor_id, first.id)
+        # Book 2's only reader makes up more of book 1's ratings than of book 0's
+        self.assertEqual(rows[third.id].neighbor_id, second.id)
+        self.assertEqual({row.rank for row in rows.values()}, {1})
+        self.assertGreater(rows[first.id].score, 0.99)
+
+        # A rebuild replaces the table rather than adding to it
+        call_command('build_similarities', '--k', '2', stdout=StringIO())
+        self.assertEqual(
+            list(BookSimilarity.objects.filter(book=first).order_by('rank').values_list('neighbor_id', 'rank')),
+            [(second.id, 1), (third.id, 2)],
+        )
+
+    def test_table_is_only_written_once_every_neighbour_is_found(self):
+        similarity.build(k=1)
+        before = list(BookSimilarity.objects.values_list('book_id', 'neighbor_id', 'rank'))
+        seen = []
+        similarity.build(k=2, chunk_size=1, progress=lambda report, done: seen.append(
+            list(BookSimilarity.objects.values_list('book_id', 'neighbor_id', 'rank'))
+        ))
+        # The old neighbours stay in place while the new ones are computed
+        self.assertEqual(seen, [before] * 3)
+        self.assertEqual(BookSimilarity.objects.filter(book=self.books[0]).count(), 2)
+
+    def test_adjusted_cosine_drops_books_rated_against_the_grain(self):
+        call_command('build_similarities', '--adjusted', stdout=StringIO())
+        # Book 2 is the lowest rating of its only reader, so it leans away from both others
+        self.assertFalse(BookSimilarity.objects.filter(neighbor=self.books[2]).exists())
+        self.assertTrue(BookSimilarity.objects.filter(book=self.books[0], neighbor=self.books[1]).exists())
+
+    def test_endpoint_serves_neighbours_in_one_query(self):
+        call_command('build_similarities', stdout=StringIO())
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/books/{self.books[0].id}/similar/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['id'] for book in response.data], [self.books[1].id, self.books[2].id])
+        self.assertIn('similarity', response.data[0])
+        self.assertGreaterEqual(response.data[0]['similarity'], response.data[1]['similarity'])
+
+    def test_endpoint_uses_the_book_rank_index(self):
+        plan = queries.similar_books(self.books[0].id, AnonymousUser()).explain()
+        # SQLite names the unique (book, rank) constraint's index itself; no sort step is needed
+        self.assertIn('SEARCH base_booksimilarity USING INDEX', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_unrated_and_missing_books(self):
+        response = self.client.get(f'/api/books/{self.books[3].id}/similar/')
+        self.assertEqual(response.data, [])
+        response = self.client.get('/api/books/999999/similar/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rejects_bad_options(self):
+        with self.assertRaises(CommandError):
+            call_command('build_similarities', '--chunk-size', '0', stdout=StringIO())
+
+
+class RecommendationTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        BookRating.objects.all().delete()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.dict(recommendations._settings, {'MODEL_DIR': self.tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.books = bulk_create_books(6, '555000000', title=lambda i: f"Recommended Book {i}")
+        self.users = [User.objects.create_user(username=f'reco{i}', password='testpass123') for i in range(6)]
+        # Two tastes: books 0-2 and books 3-5, each loved by three readers
+        for i, user in enumerate(self.users):
+            liked = self.books[:3] if i < 3 else self.books[3:]
+            disliked = self.books[3:] if i < 3 else self.books[:3]
+            for book in liked:
+                BookRating.objects.create(user=user, book=book, rating=10)
+            BookRating.objects.create(user=user, book=disliked[0], rating=1)
+        self.reader = User.objects.create_user(username='recoreader', password='testpass123')
+        self.client.force_authenticate(user=self.reader)
+
+    def train(self, *args):
+        call_command('train_recommendations', '--factors', '2', '--iterations', '15', *args, stdout=StringIO())
+
+    def ids(self, response):
+        return [book['id'] for book in response.data]
+
+    def test_training_needs_regularization(self):
+        for value in ('0', '-0.1'):
+            with self.assertRaises(CommandError):
+                self.train('--regularization', value)
+        with self.assertRaises(ValueError):
+            als.train(regularization=0)
+        self.assertIsNone(recommendations.current_model())
+
+    def test_training_writes_a_current_mappable_version(self):
+        self.train()
+        model = recommendations.current_model()
+        self.assertIsNotNone(model)
+        self.assertIsInstance(model.factors, np.memmap)
+        self.assertEqual(model.factors.shape, (6, 2))
+        with open(os.path.join(self.tmp.name, 'CURRENT')) as f:
+            self.assertEqual(f.read(), model.version)
+
+        # A new version replaces it, and only --keep versions stay on disk
+        self.train('--keep', '1')
+        self.assertNotEqual(recommendations.current_model().version, model.version)
+        self.assertEqual(len([name for name in os.listdir(self.tmp.name) if name != 'CURRENT']), 1)
+
+    def test_recommends_the_readers_taste_excluding_rated_and_saved(self):
+        self.train()
+        BookRating.objects.create(user=self.reader, book=self.books[3], rating=10)
+        ReadingList.objects.create(user=self.reader, book=self.books[4])
+        response = self.client.get('/api/recommendations/', {'limit': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = self.ids(response)
+        self.assertEqual(ids[0], self.books[5].id)
+        self.assertNotIn(self.books[3].id, ids)
+        self.assertNotIn(self.books[4].id, ids)
+        self.assertIsNotNone(response.data[0]['score'])
+
+    def test_cached_until_the_user_rates_or_saves(self):
+        self.train()
+        first = self.ids(self.client.get('/api/recommendations/'))
+        # Only the book lookup once the ranking is cached
+        with self.assertNumQueries(1):
+            self.assertEqual(self.ids(self.client.get('/api/recommendations/')), first)
+
+        self.client.post(f'/api/books/{first[0]}/rate/', {'rating': 2}, format='json')
+        self.assertNotIn(first[0], self.ids(self.client.get('/api/recommendations/')))
+
+        self.client.post(f'/api/reading-list/add/{first[1]}/')
+        self.assertNotIn(first[1], self.ids(self.client.get('/api/recommendations/')))
+
+        self.client.post('/api/reading-list/bulk-remove/', {'book_ids': [first[1]]}, format='json')
+        self.assertIn(first[1], self.ids(self.client.get('/api/recommendations/')))
+
+    def test_without_a_model_ranks_by_rating(self):
+        Book.objects.filter(id=self.books[2].id).update(average_rating=Decimal('9.9'))
+        response = self.client.get('/api/recommendations/', {'limit': 1})
+        self.assertEqual(self.ids(response), [self.books[2].id])
+        self.assertIsNone(response.data[0]['score'])
+
+    def test_login_and_limit_required(self):
+        self.assertEqual(self.client.get('/api/recommendations/', {'limit': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/api/recommendations/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class FastSerializationTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        Book.objects.all().delete()
+        self.user = User.objects.create_user(username='fastreader', password='testpass123')
+        self.books = [
+            Book.objects.create(
+                title=title,
+                author="Test Author",
+                publication_date=date(2000 + i, 1, 1),
+                isbn=f"444000000000{i}",
+                genre="Fiction",
+                short_description="A quest through the  line separator",
+                page_count=200,
+                average_rating=Decimal(rating),
+                total_ratings=i,
+                about="Ends with a control character \x07 and a quote \"",
+            )
+            for i, (title, rating) in enumerate([
+                ("Plain", '0'), ("Ünïcödé 📚", '7.5'), ("Tab\tand\nnewline", '10'), ("Quest", '3.3'),
+            ])
+        ]
+        BookRating.objects.create(user=self.user, book=self.books[1], rating=8)
+
+    def assertMatchesSerializer(self, params, user=None):
+        """The list response is byte for byte what BookSerializer and JSONRenderer make of its books."""
+        # A bearer token rather than force_authenticate(), which the anonymous response cache cannot see
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'} if user else {}
+        response = self.client.get('/api/books/', params, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = json.loads(response.content)
+        ids = [book['id'] for book in body['results']]
+        books = queries.book_detail(user or AnonymousUser()).in_bulk(ids)
+        page = [books[book_id] for book_id in ids]
+        if params.get('highlight'):
+            snippets = search.snippets(ids, params['q'])
+            for book in page:
+                book.snippet = snippets.get(book.id)
+        fields = queries.selected_fields(params, BOOK_FIELDS, default_exclude=HEAVY_BOOK_FIELDS)
+        results = BookSerializer(page, many=True, context={'book_fields': fields}).data
+        expected = JSONRenderer().render({'next': body['next'], 'previous': body['previous'], 'results': results})
+        self.assertEqual(response.content, expected)
+        return body
+
+    def test_list_matches_serializer_output(self):
+        body = self.assertMatchesSerializer({'sort': 'publication_date', 'fields': ','.join(BOOK_FIELDS)})
+        self.assertEqual(body['results'][0]['average_rating'], '0.0')
+        self.assertIn('\\u2028', self.client.get('/api/books/', {'fields': 'short_description'}).content.decode())
+        self.assertMatchesSerializer({'exclude': 'user_rating,isbn'}, user=self.user)
+
+        body = self.assertMatchesSerializer({'sort': 'title', 'page_size': 2}, user=self.user)
+        self.assertIsNotNone(body['next'])
+        self.assertEqual(self.client.get(body['next']).status_code, status.HTTP_200_OK)
+        ratings = {book['id']: book['user_rating'] for book in self.assertMatchesSerializer({}, user=self.user)['results']}
+        self.assertEqual(ratings[self.books[1].id], 8)
+
+        body = self.assertMatchesSerializer({'q': 'quest', 'highlight': '1'})
+        self.assertIn('<mark>', body['results'][0]['snippet'])
+        self.assertNotIn('snippet', self.assertMatchesSerializer({'q': 'quest'})['results'][0])
+
+    def test_renderer_falls_back_to_json_renderer(self):
+        data = {
+            'text': 'line separator', 'when': timezone.now(), 'day': date(2024, 2, 29),
+            'amount': Decimal('1.50'), 'big': 2 ** 70, 'items': [None, True, 'ü'],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_encoder_needs_a_column_for_every_field(self):
+        with self.assertRaises(ImproperlyConfigured):
+            RowEncoder(ReadingListSerializer)
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.user = User.objects.create_user(username='sparse', password='testpass123')
+        self.book = create_book("3330000000001", title="Sparse Book", about="A long account of the book. " * 50)
+        ReadingList.objects.create(user=self.user, book=self.book)
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, ' '.join(query['sql'] for query in captured.captured_queries)
+
+    def test_list_leaves_out_long_text_by_default(self):
+        response, sql = self.get('/api/books/')
+        self.assertNotIn('about', response.data['results'][0])
+        self.assertNotIn('short_description', response.data['results'][0])
+        self.assertNotIn('"about"', sql)
+
+        response, _ = self.get('/api/books/', {'fields': 'id,about', 'title': 'sparse'})
+        self.assertEqual(response.data['results'], [{'id': self.book.id, 'about': self.book.about}])
+
+    def test_fields_and_exclude_trim_detail_output_and_columns(self):
+        response, sql = self.get(f'/api/books/{self.book.id}/')
+        self.assertIn('about', response.data)
+
+        response, sql = self.get(f'/api/books/{self.book.id}/', {'fields': 'title,user_rating'})
+        self.assertEqual(response.data, {'user_rating': None, 'title': 'Sparse Book'})
+        self.assertNotIn('"about"', sql)
+        self.assertNotIn('"isbn"', sql)
+
+        response, _ = self.get(f'/api/books/{self.book.id}/', {'exclude': 'about,isbn'})
+        self.assertNotIn('about', response.data)
+        self.assertIn('title', response.data)
+
+    def test_variants_are_cached_and_tagged_apart(self):
+        url = f'/api/books/{self.book.id}/'
+        full = self.client.get(url)
+        trimmed = self.client.get(url, {'fields': 'title'})
+        self.assertNotEqual(full.content, trimmed.content)
+        self.assertNotEqual(full['ETag'], trimmed['ETag'])
+        self.assertEqual(self.client.get(url, {'fields': 'title'}).content, trimmed.content)
+
+    def test_reading_list_trims_nested_books(self):
+        self.client.force_authenticate(user=self.user)
+        response, sql = self.get('/api/reading-list/')
+        self.assertNotIn('about', response.data[0]['book'])
+        self.assertNotIn('"about"', sql)
+        response, _ = self.get('/api/reading-list/', {'fields': 'id,title'})
+        self.assertEqual(response.data[0]['book'], {'id': self.book.id, 'title': 'Sparse Book'})
+
+    def test_unknown_field_is_rejected(self):
+        for url in ('/api/books/', f'/api/books/{self.book.id}/', f'/api/books/{self.book.id}/similar/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'fields': 'title,rating_sum'})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('Fields must be among', response.data['error'])
+
+
+class CompressionTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        compression.stats.reset()
+        self.book = create_book("4440000000001", title="Compressed Book", about="A long account of the book. " * 100)
+
+    def decode(self, response):
+        content = response.content
+        encoding = response.get('Content-Encoding')
+        if encoding == 'gzip':
+            return gzip.decompress(content)
+        if encoding == 'br':
+            return compression.brotli.decompress(content)
+        if encoding == 'zstd':
+            return compression.zstandard.ZstdDecompressor().decompressobj().decompress(content)
+        return content
+
+    def test_negotiation(self):
+        first = next(iter(compression.ENCODINGS))
+        self.assertEqual(compression.negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(compression.negotiate('gzip;q=0.5, *'), first)
+        self.assertEqual(compression.negotiate('*'), first)
+        self.assertIsNone(compression.negotiate(''))
+        self.assertIsNone(compression.negotiate('identity'))
+        self.assertIsNone(compression.negotiate('gzip;q=0'))
+        self.assertIsNone(compression.negotiate('deflate, compress'))
+
+    def test_each_coding_round_trips(self):
+        url = f'/api/books/{self.book.id}/'
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        for encoding in compression.ENCODINGS:
+            with self.subTest(encoding=encoding):
+                catalog_cache.get_cache().clear()
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertLess(len(response.content), len(plain.content))
+                self.assertEqual(self.decode(response), plain.content)
+                # Weakened, and still matched by If-None-Match
+                self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+                revalidated = self.client.get(url, HTTP_ACCEPT_ENCODING=encoding, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cached_responses_are_compressed_once(self):
+        first = self.client.get('/api/books/', {'fields': 'id,about'}, HTTP_ACCEPT_ENCODING='gzip')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/books/', {'fields': 'id,about'}, HTTP_ACCEPT_ENCODING='gzip')
+            plain = self.client.get('/api/books/', {'fields': 'id,about'})
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+        self.assertEqual(first.content, second.content)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(gzip.decompress(second.content), plain.content)
+        counts = compression.stats.snapshot()['gzip']
+        self.assertEqual((counts['responses'], counts['reused']), (1, 1))
+        self.assertGreater(counts['ratio'], 1)
+
+    def test_small_and_html_responses_are_sent_as_they_are(self):
+        response = self.client.get(f'/api/books/{self.book.id}/', {'fields': 'id'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        response = self.client.get(
+            f'/api/books/{self.book.id}/', HTTP_ACCEPT_ENCODING='gzip', HTTP_ACCEPT='text/html'
+        )
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(compression.stats.snapshot(), {})
+
+    def test_streamed_export_is_compressed(self):
+        create_books(50, '', title=lambda i: f"Exported {i}", page_count=100)
+        plain = b''.join(self.client.get('/api/books/export/').streaming_content)
+        response = self.client.get('/api/books/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response)
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+        self.assertEqual(compression.stats.snapshot()['gzip']['bytes_in'], len(plain))
+
+
+class InstrumentationTests(APITestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        instrumentation.registry.reset()
+        self.staff = User.objects.create_user(username='scraper', password='testpass123', is_staff=True)
+        create_books(3, '555', title=lambda i: f"Measured Book {i}")
+
+    def test_histogram_quantiles_are_within_bucket_precision(self):
+        histogram = instrumentation.Histogram(scale=1_000_000)
+        for micros in range(1, 100_001):
+            histogram.record(micros / 1_000_000)
+        self.assertEqual(histogram.count, 100_000)
+        self.assertAlmostEqual(histogram.sum(), 5000.05, places=6)
+        for q in (0.5, 0.9, 0.99):
+            self.assertAlmostEqual(histogram.quantile(q), q * 0.1, delta=q * 0.1 / 32)
+        self.assertEqual(histogram.quantile(1.0), 0.1)
+        # 32 one-value buckets, then 32 per power of two up to 2**17
+        self.assertLessEqual(len(histogram.counts), 32 * 13)
+
+    def test_requests_are_recorded_per_route(self):
+        first = self.client.get('/api/books/')
+        self.client.get('/api/books/')
+        self.client.get('/api/books/0/')
+        routes = instrumentation.registry.snapshot()
+        books = routes['get-books']
+        self.assertEqual(books['request_duration_seconds']['count'], 2)
+        # The second was served from the response cache
+        self.assertGreater(books['db_queries']['max'], 0)
+        self.assertEqual(books['db_queries']['p50'], 0)
+        self.assertGreater(books['serializer_duration_seconds']['max'], 0)
+        self.assertEqual(books['response_size_bytes']['sum'], 2 * len(first.content))
+        self.assertEqual(routes['get-book-by-id']['request_duration_seconds']['count'], 1)
+
+    def test_duplicate_queries_are_counted(self):
+        with instrumentation.recording() as metrics:
+            for book in Book.objects.filter(title__startswith='Measured'):
+                Book.objects.filter(id=book.id).exists()
+        self.assertEqual((metrics.queries, metrics.duplicates), (4, 2))
+
+    def test_streamed_bodies_are_recorded_once_sent(self):
+        response = self.client.get('/api/books/export/')
+        self.assertEqual(instrumentation.registry.snapshot(), {})
+        size = len(b''.join(response.streaming_content))
+        export = instrumentation.registry.snapshot()['export-books']
+        self.assertEqual(export['response_size_bytes']['sum'], size)
+        self.assertGreater(export['db_queries']['sum'], 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/books/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        with mock.patch.object(instrumentation, 'TOKEN', 'scrape-me'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Token wrong')
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Token scrape-me')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE bookexplorer_request_duration_seconds summary', body)
+        self.assertIn('bookexplorer_requests_total{route="get-books",status="200"} 1', body)
+        self.assertIn('bookexplorer_db_queries_count{route="get-books"} 1', body)
+
+        token = RefreshToken.for_user(self.staff).access_token
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_snapshots_are_logged(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.log')
+            with mock.patch.object(instrumentation, 'LOG_FILE', path):
+                self.client.get('/api/books/')
+                self.client.get('/api/genres/')
+            with open(path) as log:
+                lines = [json.loads(line) for line in log]
+        # One per LOG_INTERVAL
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['routes']['get-books']['request_duration_seconds']['count'], 1)
+
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        for name, value in {
+            'ENABLED': True, 'SLOW_REQUEST_SECONDS': 10.0, 'INTERVAL': 0.001,
+            'directory': lambda: self.directory,
+        }.items():
+            patcher = mock.patch.object(profiling, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def profiles(self):
+        return sorted(self.directory.glob('*.collapsed'))
+
+    def test_sampler_counts_stacks_below_its_root(self):
+        def handle():
+            samples = sampler.start()
+            _spin(0.05)
+            return sampler.stop(), samples
+
+        sampler = profiling.Sampler(0.001, root=handle.__code__)
+        stopped, samples = handle()
+        self.assertIs(stopped, samples)
+        self.assertGreater(sum(samples.values()), 5)
+        stack, _ = samples.most_common(1)[0]
+        self.assertEqual(stack.split(';'), [
+            'base.tests:ProfilingTests.test_sampler_counts_stacks_below_its_root.<locals>.handle', 'base.tests:_spin',
+        ])
+
+    def test_only_slow_or_signed_requests_are_kept(self):
+        self.client.get('/api/books/')
+        self.assertEqual(self.profiles(), [])
+
+        response = self.client.get('/api/books/', HTTP_X_PROFILE='profile:forged:signature')
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(self.profiles(), [])
+
+        response = self.client.get('/api/books/', HTTP_X_PROFILE=profiling.debug_token())
+        [profile] = self.profiles()
+        self.assertEqual(response['X-Profile-File'], profile.name)
+        self.assertIn('-get-books-', profile.name)
+        for line in profile.read_text().splitlines():
+            self.assertRegex(line, r'^api\.profiling:ProfilingMiddleware\.__call__(;[^; ]+)* \d+$')
+
+        with mock.patch.object(profiling, 'SLOW_REQUEST_SECONDS', 0.0):
+            response = self.client.get('/api/genres/')
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(len(self.profiles()), 2)
+
+    def test_old_profiles_are_pruned(self):
+        with mock.patch.object(profiling, 'MAX_FILES', 3):
+            for i in range(5):
+                profiling.write_profile(Counter({'a;b': i + 1}), 'get-books', 1.5)
+        profiles = self.profiles()
+        self.assertEqual(len(profiles), 3)
+        self.assertEqual(profiles[-1].read_text(), 'a;b 5\n')
+        self.assertTrue(profiles[-1].name.endswith('-get-books-1500ms.collapsed'))
+
+    def test_disabled_by_default(self):
+        with mock.patch.object(profiling, 'ENABLED', False):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.ProfilingMiddleware(lambda request: None)
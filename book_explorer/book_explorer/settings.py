@@ -46,7 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its wall time covers every other middleware
+    'api.instrumentation.InstrumentationMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,6 +79,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'book_explorer.wsgi.application'
+ASGI_APPLICATION = 'book_explorer.asgi.application'
+
+# Route the read endpoints to the async views in api.async_views. Worth it
+# under an ASGI server (book_explorer.asgi); under WSGI each async view
+# would be run through an event loop of its own.
+API_ASYNC_READ_VIEWS = False
 
 
 # Database
@@ -88,6 +98,28 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Anonymous catalog responses, see base/cache.py. LocMem is per process;
+    # to share one cache between the worker processes of a node use
+    # 'django.core.cache.backends.filebased.FileBasedCache' with
+    # 'LOCATION': BASE_DIR / 'cache' / 'catalog'.
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -106,6 +138,31 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# https://docs.djangoproject.com/en/5.2/topics/auth/passwords/
+# New passwords use the first hasher; hashes made by any other, or with
+# other cost parameters, are upgraded on the user's next successful login.
+
+PASSWORD_HASHERS = [
+    'base.hashers.TunedScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+PASSWORD_HASHING = {
+    # Django's scrypt defaults: 16 MiB per hash, far cheaper in CPU than
+    # PBKDF2 at its default iteration count
+    'SCRYPT': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 1},
+    # Logins hash on this many threads per process (default: half the
+    # cores) with at most QUEUE more waiting; beyond that login returns 503
+    'WORKERS': None,
+    'QUEUE': 32,
+}
+
+AUTHENTICATION_BACKENDS = [
+    'base.hashers.PooledModelBackend',
+]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -132,12 +189,64 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Allow all origins (for development only)
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Per-process user cache behind api.authentication.CachedJWTAuthentication,
+# which ENABLED puts in place of simplejwt's JWTAuthentication so requests
+# do not query their own user row. Permission changes are then eventually
+# consistent: in other processes, a deactivated, demoted or deleted user
+# keeps the access their cached row grants for up to TIMEOUT seconds.
+AUTH_USER_CACHE = {
+    'ENABLED': False,
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 300,
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication' if AUTH_USER_CACHE['ENABLED']
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
 }
 
+# Models written by `manage.py train_recommendations` (see
+# base/recommendations.py); MODEL_DIR must be shared by every worker on a
+# host. CACHE_TIMEOUT (seconds) bounds how long a user's ranking is reused.
+RECOMMENDATIONS = {
+    'MODEL_DIR': BASE_DIR / 'var' / 'recommendations',
+    'CACHE_TIMEOUT': 3600,
+}
+
+# Negotiated API response compression (see api/compression.py). Bodies
+# under MIN_SIZE bytes are sent as they are; LEVELS trades CPU for size
+# per coding. zstd and br are only offered when zstandard and brotli are
+# installed.
+COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'LEVELS': {'zstd': 3, 'br': 4, 'gzip': 6},
+}
+
+# Per-route request metrics (see api/instrumentation.py), served in the
+# Prometheus format at /metrics to staff users and to scrapers sending
+# `Authorization: Token <TOKEN>`. With LOG_FILE set, each worker also
+# appends a JSON snapshot to it at most every LOG_INTERVAL seconds.
+METRICS = {
+    'TOKEN': None,
+    'LOG_FILE': None,
+    'LOG_INTERVAL': 60,
+}
+
+# Sampling profiler for slow requests (see api/profiling.py), off unless
+# ENABLED. Requests taking SLOW_REQUEST_SECONDS or more (None: only those
+# with a signed X-Profile header, from `manage.py profile_token`) are saved
+# as collapsed stacks under DIRECTORY, keeping the newest MAX_FILES.
+PROFILING = {
+    'ENABLED': False,
+    'SLOW_REQUEST_SECONDS': 1.0,
+    'INTERVAL': 0.005,
+    'DIRECTORY': BASE_DIR / 'var' / 'profiles',
+    'MAX_FILES': 200,
+    'TOKEN_MAX_AGE': 3600,
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),